@@ -0,0 +1,114 @@
+""" Benchmark of coverage.py on a synthetic campaign
+
+Drives a receiver at random around the gateway of the notebook, with a
+log-distance path loss, and times for n rows (2 million by default):
+  - the points: df.apply(Point) as in the notebook, against
+    geopandas.points_from_xy
+  - the binning: a per-cell Python reduction as hexbin(reduce_C_function=min)
+    does, against coverage.bin_cells
+  - with --csv, writing the rows and loading them back with coverage.load
+The Python loops run on a sample and are extrapolated to n rows.
+    python3 bench_coverage.py --rows 2000000 --csv
+"""
+
+import argparse
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import coverage
+
+# gateway of the notebook
+GATEWAY = (43.422772, -1.606257)
+SAMPLE = 50000
+
+
+def campaign(n, seed=1):
+    # n rows in the columns of coverage.load, a drive of 1 s steps
+    rng = np.random.default_rng(seed)
+    step = rng.normal(0, 8.0, (n, 2)).cumsum(axis=0)
+    # keep it within 3 km of the gateway
+    x, y = (3000 * np.tanh(step / 3000)).T
+    lat, lon = coverage.unproject(x, y, *GATEWAY)
+    d = np.maximum(np.hypot(x, y), 1.0)
+    rssi = np.clip(-40 - 28 * np.log10(d) + rng.normal(0, 6, n), -137, -20).astype('int16')
+    snr = np.clip(rssi + 120 + rng.normal(0, 2, n), -20, 12).round().astype('float32')
+    t0 = pd.Timestamp('2017-05-30T12:36:00Z')
+    return pd.DataFrame({
+        'nrow': np.arange(n), 'loramac_rcx': pd.Categorical(['70b3d5499d9565b3'] * n),
+        'gps_time': t0 + pd.to_timedelta(np.arange(n), unit='s'), 'lat': lat.round(7), 'lon': lon.round(7),
+        'alt': np.full(n, 42.49, 'float32'), 'nb_sent': np.arange(n, dtype='float64'),
+        'loramac_trx': pd.Categorical(['70b3d5499c3a7f7d'] * n), 'crc_trx': '0x7c', 'crc_rcx': '0x7c',
+        'crc_status': True, 'lora_ts': np.arange(n) * 1000000, 'rssi': rssi, 'snr': snr,
+        'sf': np.full(n, 7, 'int8'), 'crc_row': '0x90'})
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def per_cell_python(df, size):
+    # what hexbin does with a reduce_C_function: a list per cell, then min
+    x, y = coverage.project(df['lat'].to_numpy(), df['lon'].to_numpy(), *GATEWAY)
+    q, r = coverage.hex_cells(x, y, size)
+    cells = {}
+    for key, rssi in zip(zip(q.tolist(), r.tolist()), df['rssi'].tolist()):
+        cells.setdefault(key, []).append(rssi)
+    return {key: min(values) for key, values in cells.items()}
+
+
+def report(name, before, after, n, sample):
+    scaled = before * n / sample
+    print('%-10s %9.2f s  -> %7.3f s  x%.0f%s' % (
+        name, scaled, after, scaled / after, '  (extrapolated from %d rows)' % sample if sample < n else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the coverage analysis on a synthetic campaign')
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--size', type=float, default=25.0, help='cell size in metres')
+    parser.add_argument('--csv', action='store_true', help='also time the CSV loading')
+    args = parser.parse_args()
+
+    n = args.rows
+    df, t = timed(campaign, n)
+    print('%d rows generated in %.1f s' % (n, t))
+    sample = df.iloc[:min(n, SAMPLE)]
+
+    if args.csv:
+        with tempfile.TemporaryDirectory() as tmp:
+            name = os.path.join(tmp, 'campaign.csv')
+            df.to_csv(name, header=False, index=False, columns=coverage.COLUMNS)
+            print('%.0f MB of CSV' % (os.path.getsize(name) / 1e6))
+            loaded, t = timed(coverage.load, [name])
+            assert len(loaded) == n
+            print('%-10s %22.3f s' % ('load', t))
+
+    if coverage.gpd is not None:
+        from shapely.geometry import Point
+        before, t_before = timed(lambda: sample.apply(lambda z: Point(z.lon, z.lat), axis=1))
+        after, t_after = timed(coverage.points, df)
+        assert after.geometry.iloc[len(before) - 1].equals(before.iloc[-1])
+        report('points', t_before, t_after, n, len(sample))
+    else:
+        print('points     geopandas not installed')
+
+    before, t_before = timed(per_cell_python, sample, args.size)
+    after, t_after = timed(coverage.bin_cells, df, args.size, 'hex', ('rssi', 'snr'), coverage.STATS, GATEWAY)
+    check = coverage.bin_cells(sample, args.size, 'hex', ('rssi',), ('min',), GATEWAY)
+    assert sorted(before.values()) == sorted(check['rssi_min'].tolist())
+    report('hex bins', t_before, t_after, n, len(sample))
+    squares, t = timed(coverage.bin_cells, df, args.size, 'square', ('rssi', 'snr'), coverage.STATS, GATEWAY)
+    print('%-10s %22.3f s' % ('square', t))
+    print('%d hexagons, %d squares of %g m, %.0f rows per cell' % (
+        len(after), len(squares), args.size, n / max(len(after), 1)))
+
+
+if __name__ == '__main__':
+    main()
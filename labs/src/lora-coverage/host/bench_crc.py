@@ -0,0 +1,86 @@
+""" Benchmark of checksum.crc8 against the former bit loop of utils.crc
+
+Run it with CPython (python3 bench_crc.py) or copy it next to
+checksum.py on the LoPy. Reports bytes/s over coverage log rows for the
+bit loop, the table loop and, when the firmware has it, the viper loop.
+"""
+
+import sys
+import time
+
+if sys.implementation.name != 'micropython':
+    import builtins
+    import os
+    builtins.const = lambda x: x
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lora-rx-node-refact'))
+
+import checksum
+
+ROW = b'0,70b3d5499d9565b3,2017-05-30T12:36:00.000Z,43.42266,-1.609919,42.49,339,70b3d5499c3a7f7d,' \
+      b'0x7c,0x7c,True,3230236963,-118,-8,7'
+N = 2000
+
+
+def _addToCRC(b, crc):
+    # utils._addToCRC, as before
+    if (b < 0):
+        b += 256
+    for i in range(8):
+        odd = ((b^crc) & 1) == 1
+        crc >>= 1
+        b >>= 1
+        if (odd):
+            crc ^= 0x8C # this means crc ^= 140
+    return crc
+
+
+def legacy(data):
+    check = 0
+    for i in bytearray(data):
+        check = _addToCRC(i, check)
+    return check
+
+
+def table(data):
+    crc = 0
+    t = checksum.TABLE
+    for b in data:
+        crc = t[crc ^ b]
+    return crc
+
+
+def ticks():
+    if hasattr(time, 'ticks_us'):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+
+def elapsed(start):
+    if hasattr(time, 'ticks_diff'):
+        return time.ticks_diff(time.ticks_us(), start)
+    return ticks() - start
+
+
+def bench(name, fn, data, n):
+    start = ticks()
+    for i in range(n):
+        fn(data)
+    us = elapsed(start)
+    print('%-8s %10.0f bytes/s' % (name, len(data) * n * 1000000 / us))
+
+
+def main():
+    data = memoryview(ROW)
+    assert legacy(ROW) == table(ROW) == checksum.crc8(ROW) == 0x90
+    # incremental over two chunks
+    assert checksum.crc8(data[40:], checksum.crc8(data[:40])) == 0x90
+    bench('bits', legacy, ROW, N // 10)
+    bench('table', table, ROW, N)
+    if checksum.crc8_viper is not None:
+        bench('viper', lambda d: checksum.crc8_viper(checksum.TABLE, d, len(d), 0), ROW, N)
+    else:
+        print('viper    not available')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+""" Coverage map analysis of the LoRa RX node logs
+
+Loads the CSV rows (the 16 columns notebooks/lora-coverage-map.ipynb
+reads) or the binary logs in chunks with explicit dtypes, builds the
+points with geopandas.points_from_xy and bins RSSI and SNR in hexagonal
+or square cells of a given size in metres, with count, min, mean and max
+computed with NumPy in one sort of the cell keys. The cells are written
+as a GeoJSON or (Geo)Parquet tile, cached by the inputs and parameters:
+    python3 coverage.py ../notebooks/data/data.csv --shape hex --size 25 --out tiles
+
+From the notebook:
+    import sys; sys.path.insert(0, '../host')
+    import coverage
+    df = coverage.load(['data/data.csv'])
+    cells = coverage.bin_cells(df, size=25)
+"""
+
+import argparse
+import binascii
+import hashlib
+import io
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+try:
+    import geopandas as gpd
+    import shapely
+except ImportError:
+    gpd = None
+
+import decode_log
+
+COLUMNS = decode_log.COLUMNS
+
+# dtypes of the CSV columns, the MACs repeat and are categories
+CSV_DTYPES = {'nrow': 'int64', 'loramac_rcx': 'category', 'gps_time': 'str', 'lat': 'float64', 'lon': 'float64',
+              'alt': 'float32', 'nb_sent': 'float64', 'loramac_trx': 'category', 'crc_trx': 'str', 'crc_rcx': 'str',
+              'crc_status': 'bool', 'lora_ts': 'int64', 'rssi': 'int16', 'snr': 'float32', 'sf': 'int8',
+              'crc_row': 'str'}
+CHUNK_ROWS = 500000
+
+# binary log records, decode_log.RECORD_FMT followed by their CRC32
+RECORD_DTYPE = np.dtype([('magic', 'u1'), ('flags', 'u1'), ('age_ms', '<u2'), ('nrow', '<u4'), ('secs', '<u4'),
+                         ('ms', '<u2'), ('lat', '<i4'), ('lon', '<i4'), ('alt', '<i4'), ('seq', '<u4'),
+                         ('tx_mac', 'V8'), ('crc_trx', 'u1'), ('crc_rcx', 'u1'), ('tmst', '<u4'), ('rssi', '<i2'),
+                         ('snr', '<i2'), ('sf', 'u1'), ('crc', '<u4')])
+assert RECORD_DTYPE.itemsize == decode_log.RECORD_LEN
+
+METERS_PER_DEGREE = 111320.0
+SQRT3 = math.sqrt(3)
+SHAPES = ('hex', 'square')
+# statistics of each binned column
+STATS = ('min', 'mean', 'max')
+# bump when the tile contents change, it invalidates the cache
+TILE_VERSION = 1
+
+
+def _read_csv(name, **kwargs):
+    if isinstance(name, bytes):
+        name = io.BytesIO(name)
+    return pd.read_csv(name, header=None, names=COLUMNS, chunksize=CHUNK_ROWS, encoding_errors='replace',
+                       on_bad_lines='skip', **kwargs)
+
+
+def _coerce(chunk):
+    # typed columns of a chunk read as text, rows with garbled numbers dropped
+    for column, dtype in CSV_DTYPES.items():
+        if dtype == 'bool':
+            chunk[column] = chunk[column] == 'True'
+        elif dtype not in ('str', 'category'):
+            chunk[column] = pd.to_numeric(chunk[column], errors='coerce')
+    numeric = [c for c, dtype in CSV_DTYPES.items() if dtype not in ('str', 'category', 'bool', 'float64')]
+    chunk = chunk.dropna(subset=numeric + ['lat', 'lon'])
+    return chunk.astype({c: dtype for c, dtype in CSV_DTYPES.items() if dtype != 'str'})
+
+
+def load_csv(name):
+    # rows of a CSV file, or of its bytes, typed chunk by chunk. The rows damaged over the air
+    # break the dtypes, such a file is read again as text and coerced.
+    try:
+        chunks = [chunk for chunk in _read_csv(name, dtype=CSV_DTYPES)]
+    except (ValueError, TypeError):
+        chunks = [_coerce(chunk) for chunk in _read_csv(name, dtype=str)]
+    if not chunks:
+        return pd.DataFrame({c: pd.Series(dtype=dtype) for c, dtype in CSV_DTYPES.items()})
+    df = pd.concat(chunks, ignore_index=True)
+    df['gps_time'] = pd.to_datetime(df['gps_time'], format='ISO8601', errors='coerce', utc=True)
+    return df
+
+
+def _records(data, name):
+    # structured array of the records of a log, vectorised when the file
+    # is intact, through decode_log's resynchronising reader otherwise
+    magic, version, size, reserved, rx_mac = np.frombuffer(data, dtype='S4,u1,u1,<u2,V8', count=1)[0]
+    if magic != decode_log.FILE_MAGIC or size != decode_log.RECORD_LEN:
+        raise ValueError('not a coverage log, or an unknown version')
+    body = memoryview(data)[decode_log.FILE_HEADER_LEN:]
+    n = len(body) // RECORD_DTYPE.itemsize
+    rec = np.frombuffer(body, dtype=RECORD_DTYPE, count=n)
+    if len(body) % RECORD_DTYPE.itemsize == 0 and (rec['magic'] == decode_log.MAGIC).all():
+        ok = np.fromiter((binascii.crc32(body[i:i + decode_log.RECORD_BODY])
+                          for i in range(0, len(body), RECORD_DTYPE.itemsize)), dtype='<u4', count=n)
+        if (ok == rec['crc']).all():
+            return bytes(rx_mac), rec
+    stats = {"records": 0, "corrupted": 0}
+    fields = [f for mac, f in decode_log.records(data, stats)]
+    print('%s: %d records, %d corrupted' % (name, stats["records"], stats["corrupted"]), file=sys.stderr)
+    return bytes(rx_mac), np.array([f + (0,) for f in fields], dtype=RECORD_DTYPE)
+
+
+def load_log(name):
+    # rows of a binary log, in the columns and dtypes of load_csv
+    with open(name, 'rb') as f:
+        return frame(*_records(f.read(), name))
+
+
+def frame(rx_mac, rec):
+    # rows of the records of a RECORD_DTYPE array, received by rx_mac
+    parsed = (rec['flags'] & decode_log.PARSED) != 0
+    tx_mac = rec['tx_mac'].view('S8')
+    df = pd.DataFrame({
+        'nrow': rec['nrow'].astype('int64'),
+        'loramac_rcx': pd.Categorical([rx_mac.hex()] * len(rec)),
+        'gps_time': pd.to_datetime(rec['secs'].astype('int64') * 1000 + rec['ms'], unit='ms', utc=True),
+        'lat': rec['lat'] / 1e7,
+        'lon': rec['lon'] / 1e7,
+        'alt': (rec['alt'] / 100).astype('float32'),
+        'nb_sent': np.where(parsed, rec['seq'], np.nan),
+        'loramac_trx': pd.Categorical.from_codes(*_mac_codes(tx_mac, parsed)),
+        'crc_trx': np.where(parsed, pd.Series(rec['crc_trx']).map(hex), None),
+        'crc_rcx': pd.Series(rec['crc_rcx']).map(hex),
+        'crc_status': (rec['flags'] & decode_log.CRC_OK) != 0,
+        'lora_ts': rec['tmst'].astype('int64'),
+        'rssi': rec['rssi'],
+        'snr': (rec['snr'] / 10).astype('float32'),
+        'sf': rec['sf'].astype('int8'),
+    })
+    df['crc_row'] = None
+    return df
+
+
+def _mac_codes(macs, parsed):
+    # category codes of the TX MACs, -1 (NaN) when the payload was not parsed
+    unique, codes = np.unique(macs, return_inverse=True)
+    return np.where(parsed, codes, -1), [m.hex() for m in unique]
+
+
+def load(names, crc_ok=True):
+    # rows of CSV and binary logs, only the frames received intact by default
+    frames = [load_log(name) if name.endswith('.bin') else load_csv(name) for name in names]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    for column in ('loramac_rcx', 'loramac_trx'):
+        df[column] = df[column].astype('category')
+    if crc_ok:
+        df = df[df['crc_status']].reset_index(drop=True)
+    return df
+
+
+def points(df):
+    # GeoDataFrame of the rows, the points are (lon, lat) in EPSG:4326
+    if gpd is None:
+        raise ImportError('geopandas is needed for the geometries')
+    return gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['lon'], df['lat']), crs='EPSG:4326')
+
+
+def project(lat, lon, lat0, lon0):
+    # metres east and north of lat0, lon0 (equirectangular, good to a few km)
+    x = (np.asarray(lon) - lon0) * METERS_PER_DEGREE * math.cos(math.radians(lat0))
+    y = (np.asarray(lat) - lat0) * METERS_PER_DEGREE
+    return x, y
+
+
+def unproject(x, y, lat0, lon0):
+    lat = lat0 + np.asarray(y) / METERS_PER_DEGREE
+    lon = lon0 + np.asarray(x) / (METERS_PER_DEGREE * math.cos(math.radians(lat0)))
+    return lat, lon
+
+
+def square_cells(x, y, size):
+    # column, row of the size m squares holding the points
+    return np.floor(x / size).astype('int64'), np.floor(y / size).astype('int64')
+
+
+def square_centres(i, j, size):
+    return (i + 0.5) * size, (j + 0.5) * size
+
+
+def hex_cells(x, y, size):
+    # axial q, r of the pointy top hexagons, size m across their flats,
+    # holding the points (cube coordinates rounded to the nearest centre)
+    radius = size / SQRT3
+    q = (SQRT3 / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+    s = -q - r
+    rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype('int64'), rr.astype('int64')
+
+
+def hex_centres(q, r, size):
+    radius = size / SQRT3
+    return radius * SQRT3 * (q + r / 2), radius * 1.5 * r
+
+
+def _outline(shape, size):
+    # corner offsets of a cell around its centre, closed ring
+    if shape == 'hex':
+        radius = size / SQRT3
+        a = np.radians(np.arange(7) * 60 + 30)
+        return radius * np.cos(a), radius * np.sin(a)
+    half = size / 2
+    return np.array([-half, half, half, -half, -half]), np.array([-half, -half, half, half, -half])
+
+
+def _keys(i, j):
+    # one int64 per cell, i in the high half and j in the low half
+    return (i << 32) | (j & 0xFFFFFFFF)
+
+
+def _split(keys):
+    return keys >> 32, (keys & 0xFFFFFFFF).astype('uint32').view('int32').astype('int64')
+
+
+def aggregate(keys, columns, stats=STATS):
+    # (cell keys, count, {column_stat: values}): one argsort of the keys,
+    # then each statistic reduced over the runs of equal keys
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(keys) else np.array([], 'int64')
+    count = np.diff(np.r_[starts, len(keys)])
+    out = {}
+    for name, values in columns.items():
+        v = np.asarray(values)[order]
+        if 'min' in stats:
+            out[name + '_min'] = np.minimum.reduceat(v, starts) if len(v) else v
+        if 'max' in stats:
+            out[name + '_max'] = np.maximum.reduceat(v, starts) if len(v) else v
+        if 'mean' in stats:
+            out[name + '_mean'] = np.add.reduceat(v.astype('float64'), starts) / count if len(v) else v
+    return sorted_keys[starts], count, out
+
+
+def bin_cells(df, size=25.0, shape='hex', columns=('rssi', 'snr'), stats=STATS, origin=None):
+    # cells of size m with the points of df: centre lat, lon, count and the
+    # stats of columns. origin, (lat, lon), fixes the grid, the first point by default
+    if shape not in SHAPES:
+        raise ValueError('shape is one of %s' % ', '.join(SHAPES))
+    lat = df['lat'].to_numpy()
+    lon = df['lon'].to_numpy()
+    if origin is None:
+        origin = (float(lat[0]), float(lon[0])) if len(lat) else (0.0, 0.0)
+    x, y = project(lat, lon, *origin)
+    cells, centres = (hex_cells, hex_centres) if shape == 'hex' else (square_cells, square_centres)
+    keys, count, values = aggregate(_keys(*cells(x, y, size)), {c: df[c].to_numpy() for c in columns}, stats)
+    cx, cy = centres(*_split(keys), size)
+    clat, clon = unproject(cx, cy, *origin)
+    out = pd.DataFrame({'lat': clat, 'lon': clon, 'count': count})
+    for name, v in values.items():
+        out[name] = v
+    out.attrs.update(shape=shape, size=size, origin=origin)
+    return out
+
+
+def polygons(cells):
+    # GeoDataFrame of the cells with their outline as geometry
+    if gpd is None:
+        raise ImportError('geopandas is needed for the geometries')
+    shape, size, origin = cells.attrs['shape'], cells.attrs['size'], cells.attrs['origin']
+    dx, dy = _outline(shape, size)
+    x, y = project(cells['lat'].to_numpy(), cells['lon'].to_numpy(), *origin)
+    lat, lon = unproject(x[:, None] + dx, y[:, None] + dy, *origin)
+    rings = np.stack([lon, lat], axis=-1)
+    return gpd.GeoDataFrame(cells, geometry=shapely.polygons(rings), crs='EPSG:4326')
+
+
+def tile_name(names, size, shape, fmt):
+    # cache key of a tile: the inputs with their size and date, and the parameters
+    h = hashlib.sha1(json.dumps([TILE_VERSION, size, shape] + [
+        (os.path.abspath(n), os.path.getsize(n), os.path.getmtime(n)) for n in names]).encode())
+    return 'coverage-%s%g-%s.%s' % (shape, size, h.hexdigest()[:12], fmt)
+
+
+def tile(names, out_dir, size=25.0, shape='hex', fmt='geojson'):
+    # (path, built) of the tile of the logs in names, built unless cached
+    path = os.path.join(out_dir, tile_name(names, size, shape, fmt))
+    if os.path.exists(path):
+        return path, False
+    cells = polygons(bin_cells(load(names), size, shape))
+    os.makedirs(out_dir, exist_ok=True)
+    tmp = path + '.tmp'
+    if fmt == 'parquet':
+        cells.to_parquet(tmp)
+    else:
+        cells.to_file(tmp, driver='GeoJSON')
+    os.replace(tmp, path)
+    return path, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bin coverage logs into a GeoJSON or Parquet tile')
+    parser.add_argument('logs', nargs='+', help='CSV files, or .bin logs of the nodes')
+    parser.add_argument('--size', type=float, default=25.0, help='cell size in metres')
+    parser.add_argument('--shape', choices=SHAPES, default='hex')
+    parser.add_argument('--format', choices=('geojson', 'parquet'), default='geojson')
+    parser.add_argument('--out', default='tiles', help='tile directory')
+    args = parser.parse_args()
+
+    path, built = tile(args.logs, args.out, args.size, args.shape, args.format)
+    print('%s %s' % ('built' if built else 'cached', path))
+
+
+if __name__ == '__main__':
+    main()
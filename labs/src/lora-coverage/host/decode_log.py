@@ -0,0 +1,116 @@
+""" Decodes the binary coverage logs of the LoRa RX nodes
+
+    python3 decode_log.py /path/to/acq20170530.bin ... > data.csv
+
+Each record becomes a row of the 16 columns notebooks/lora-coverage-map.ipynb
+reads, with the same formatting as the CSV the nodes used to write,
+including the row CRC as last column. --age adds the fix age in ms as a
+17th column. Records failing their CRC are skipped and counted on stderr,
+the decoder resynchronises on the next record magic.
+"""
+
+import argparse
+import binascii
+import struct
+import sys
+import time
+
+FILE_HEADER_FMT = '<4sBBH8s'
+FILE_HEADER_LEN = struct.calcsize(FILE_HEADER_FMT)
+FILE_MAGIC = b'LCOV'
+
+RECORD_FMT = '<BBHIIHiiiI8sBBIhhB'
+RECORD_BODY = struct.calcsize(RECORD_FMT)
+RECORD_LEN = RECORD_BODY + 4
+MAGIC = 0xC5
+
+CRC_OK = 0x01
+PARSED = 0x02
+
+COLUMNS = ['nrow', 'loramac_rcx', 'gps_time', 'lat', 'lon', 'alt', 'nb_sent', 'loramac_trx', 'crc_trx', 'crc_rcx',
+           'crc_status', 'lora_ts', 'rssi', 'snr', 'sf', 'crc_row']
+
+
+def _table():
+    table = []
+    for i in range(256):
+        crc = i
+        for bit in range(8):
+            crc = (crc >> 1) ^ 0x8C if crc & 1 else crc >> 1
+        table.append(crc)
+    return bytes(table)
+
+
+CRC8_TABLE = _table()
+
+
+def crc8(data, crc=0):
+    # utils.crc of the nodes, as an int
+    for b in data:
+        crc = CRC8_TABLE[crc ^ b]
+    return crc
+
+
+def records(data, stats, start=FILE_HEADER_LEN):
+    # (rx mac, record fields) of a log file from byte start, skipping the
+    # damaged records. stats["offset"] is where the next record would start.
+    magic, version, size, reserved, rx_mac = struct.unpack_from(FILE_HEADER_FMT, data)
+    if magic != FILE_MAGIC or size != RECORD_LEN:
+        raise ValueError('not a coverage log, or an unknown version')
+    pos = max(start, FILE_HEADER_LEN)
+    synced = True
+    while pos + RECORD_LEN <= len(data):
+        crc, = struct.unpack_from('<L', data, pos + RECORD_BODY)
+        if data[pos] != MAGIC or binascii.crc32(data[pos:pos + RECORD_BODY]) != crc:
+            if synced:
+                stats["corrupted"] += 1
+                synced = False
+            pos += 1
+            continue
+        synced = True
+        stats["offset"] = pos + RECORD_LEN
+        yield rx_mac, struct.unpack_from(RECORD_FMT, data, pos)
+        stats["records"] += 1
+        pos += RECORD_LEN
+    if synced:
+        stats["offset"] = pos
+
+
+def row(rx_mac, fields, age=False):
+    (magic, flags, age_ms, nrow, secs, ms, lat, lon, alt, seq, tx_mac, crc_trx, crc_rcx, tmst,
+     rssi, snr, sf) = fields
+    parsed = flags & PARSED
+    gps_time = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(secs)) + '.%03dZ' % ms
+    snr = snr / 10
+    values = [str(nrow), rx_mac.hex(), gps_time, repr(round(lat / 1e7, 7)), repr(round(lon / 1e7, 7)),
+              repr(round(alt / 100, 2)), str(seq) if parsed else '', tx_mac.hex() if parsed else '',
+              hex(crc_trx) if parsed else '', hex(crc_rcx), str(bool(flags & CRC_OK)), str(tmst), str(rssi),
+              str(int(snr)) if snr == int(snr) else repr(snr), str(sf)]
+    line = ','.join(values)
+    values.append(hex(crc8(line.encode())))
+    if age:
+        values.append(str(age_ms))
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode binary coverage logs to CSV')
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--age', action='store_true', help='add the fix age in ms as a 17th column')
+    parser.add_argument('--header', action='store_true', help='write the column names first')
+    args = parser.parse_args()
+
+    stats = {"records": 0, "corrupted": 0}
+    out = sys.stdout
+    if args.header:
+        out.write(','.join(COLUMNS + (['fix_age_ms'] if args.age else [])) + '\n')
+    for name in args.logs:
+        with open(name, 'rb') as f:
+            data = f.read()
+        for rx_mac, fields in records(data, stats):
+            out.write(','.join(row(rx_mac, fields, args.age)) + '\n')
+    print('%d records, %d corrupted' % (stats["records"], stats["corrupted"]), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+""" Checks the TX scheduler of lora-tx-node against the EU868 duty cycle
+
+Runs txsched.TxScheduler on the pycomsim virtual clock, so hours take
+a fraction of a second, and reports the probes sent per hour and the
+most airtime used in any sliding hour next to the legal budget, for the
+scheduler and for the former fixed 2 s loop:
+    python3 duty_cycle.py --sf 7,9,12 --size 8 --hours 3
+"""
+
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'pycom-sim'))
+
+import pycomsim
+
+sim = pycomsim.install(pycomsim.Simulator(pycomsim.Clock(virtual=True)))
+pycomsim.add_path(os.path.join(HERE, '..', 'lora-tx-node'))
+
+import txsched
+
+HOUR_US = 3600 * 1000000
+
+
+def worst_hour(sends):
+    # most airtime in any one hour window, sends are (start us, airtime us)
+    worst = 0
+    used = 0
+    first = 0
+    for start, toa in sends:
+        used += toa
+        while sends[first][0] <= start - HOUR_US:
+            used -= sends[first][1]
+            first += 1
+        worst = max(worst, used)
+    return worst
+
+
+def run_scheduler(args, sf):
+    sched = txsched.TxScheduler(args.freq, sf, jitter=args.jitter, margin=args.margin)
+    toa = sched.time_on_air_us(args.size)
+    end = sim.clock.now_us() + int(args.hours * HOUR_US)
+    sends = []
+    while True:
+        sim.clock.advance(sched.next_us(args.size))
+        if sim.clock.now_us() >= end:
+            break
+        sends.append((sim.clock.now_us(), toa))
+        sched.sent(args.size)
+        # the blocking send returns at the end of the frame
+        sim.clock.advance(toa)
+    return sched, sends
+
+
+def run_fixed(args, sf, period_s=2):
+    toa = txsched.time_on_air_us(args.size, sf)
+    period = toa + period_s * 1000000
+    return [(i * period, toa) for i in range(int(args.hours * HOUR_US // period))]
+
+
+def report(args, sf):
+    sched, sends = run_scheduler(args, sf)
+    fixed = run_fixed(args, sf)
+    budget = sched.band.duty * HOUR_US
+    toa = sched.time_on_air_us(args.size)
+    print("SF%d, %d bytes, %.1f ms on air, budget %.1f s/h" % (sf, args.size, toa / 1000, budget / 1000000))
+    for name, s in (("scheduler", sends), ("fixed 2 s", fixed)):
+        worst = worst_hour(s)
+        print("  %-10s %6.0f probes/h  worst hour %6.1f s on air, %5.1f%% of budget%s" % (
+            name, len(s) / args.hours, worst / 1000000, 100 * worst / budget,
+            "  OVER" if worst > budget else ""))
+    print("  " + sched.report())
+    return worst_hour(sends) <= budget
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Duty cycle check of the lora-tx-node TX scheduler')
+    parser.add_argument('--sf', type=lambda s: [int(sf) for sf in s.split(',')], default=[7, 9, 12])
+    parser.add_argument('--size', type=int, default=8, help='payload bytes, 8 for a probe')
+    parser.add_argument('--freq', type=int, default=868100000)
+    parser.add_argument('--hours', type=float, default=3.0)
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--margin', type=float, default=0.9, help='share of the duty cycle used')
+    args = parser.parse_args()
+    ok = all([report(args, sf) for sf in args.sf])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,229 @@
+""" Ingests the coverage logs of the RX nodes into a Parquet dataset
+
+Collects the acq*.csv and acq*.bin logs under the given files or
+directories (SD cards, FTP copies of the nodes...), keeps the CSV rows
+whose crc_row matches and the binary records whose CRC32 does, drops
+the rows already stored and appends the rest as Parquet files in a
+dataset partitioned by date and receiver MAC:
+    coverage.parquet/date=2017-05-30/rx=70b3d5499d9565b3/part-000001.parquet
+
+The state file of the dataset keeps how far each log was read, so a
+new run only reads the bytes appended since, and starts the log over
+if it was rotated or truncated. --follow tails the logs:
+    python3 ingest.py /media/sd --dataset coverage.parquet --follow 10
+
+A season is then read without parsing any text, with filters on the
+partitions:
+    import ingest
+    df = ingest.read('coverage.parquet', start='2017-05-01', rx='70b3d5499d9565b3')
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import coverage
+import decode_log
+
+PATTERNS = ('acq*.csv', 'acq*.bin')
+STATE = '_ingest.json'
+# a row is the same frame when the receiver, its GPS time and its tmst are
+KEY = ['gps_time', 'lora_ts']
+# bytes hashed to tell a rotated log from a grown one
+HEAD = 256
+
+SCHEMA = pa.schema([('nrow', pa.int64()), ('loramac_rcx', pa.string()), ('gps_time', pa.timestamp('us', 'UTC')),
+                    ('lat', pa.float64()), ('lon', pa.float64()), ('alt', pa.float32()), ('nb_sent', pa.float64()),
+                    ('loramac_trx', pa.string()), ('crc_trx', pa.string()), ('crc_rcx', pa.string()),
+                    ('crc_status', pa.bool_()), ('lora_ts', pa.int64()), ('rssi', pa.int16()),
+                    ('snr', pa.float32()), ('sf', pa.int8()), ('crc_row', pa.string())])
+STRINGS = [f.name for f in SCHEMA if f.type == pa.string()]
+
+
+def sources(paths):
+    # the logs of paths, files or directories searched recursively
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in PATTERNS:
+                found += glob.glob(os.path.join(path, '**', pattern), recursive=True)
+        else:
+            found.append(path)
+    return sorted(set(os.path.abspath(f) for f in found))
+
+
+def load_state(dataset):
+    try:
+        with open(os.path.join(dataset, STATE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'parts': 0, 'logs': {}}
+
+
+def save_state(dataset, state):
+    tmp = os.path.join(dataset, STATE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(dataset, STATE))
+
+
+def check_csv(data, stats):
+    # the lines of data whose crc_row matches, up to the last complete one
+    good = []
+    for line in data.splitlines(keepends=True):
+        body, sep, crc = line.rstrip(b'\r\n').rpartition(b',')
+        try:
+            ok = sep and decode_log.crc8(body) == int(crc, 16)
+        except ValueError:
+            ok = False
+        if ok:
+            good.append(line)
+        else:
+            stats["bad_crc"] += 1
+    return b''.join(good)
+
+
+def read_csv(f, offset, stats):
+    # (rows, new offset) of the complete lines from offset
+    f.seek(offset)
+    data = f.read()
+    end = data.rfind(b'\n') + 1
+    rows = check_csv(data[:end], stats)
+    return (coverage.load_csv(rows) if rows else None), offset + end
+
+
+def read_log(f, offset, stats):
+    # (rows, new offset) of the records from offset, the header gives the rx MAC
+    f.seek(0)
+    header = f.read(decode_log.FILE_HEADER_LEN)
+    if len(header) < decode_log.FILE_HEADER_LEN:
+        return None, offset
+    offset = max(offset, decode_log.FILE_HEADER_LEN)
+    f.seek(offset)
+    data = header + f.read()
+    counts = {"records": 0, "corrupted": 0}
+    fields = [r for mac, r in decode_log.records(data, counts)]
+    stats["bad_crc"] += counts["corrupted"]
+    offset += counts.get("offset", decode_log.FILE_HEADER_LEN) - decode_log.FILE_HEADER_LEN
+    if not fields:
+        return None, offset
+    rec = np.array([r + (0,) for r in fields], dtype=coverage.RECORD_DTYPE)
+    return coverage.frame(header[-8:], rec), offset
+
+
+def read_new(path, entry, stats):
+    # (rows, entry) of what was appended to the log since entry
+    with open(path, 'rb') as f:
+        head = hashlib.sha1(f.read(HEAD)).hexdigest()
+        size = os.fstat(f.fileno()).st_size
+        offset = entry.get('offset', 0)
+        if entry.get('head') != head and offset >= HEAD or size < offset:
+            # rotated or truncated, the dedup drops what was stored
+            offset = 0
+        if size == offset:
+            return None, entry
+        read = read_log if path.endswith('.bin') else read_csv
+        df, offset = read(f, offset, stats)
+    return df, {'offset': offset, 'head': head, 'size': size}
+
+
+def _table(df):
+    df = df.copy()
+    for column in STRINGS:
+        df[column] = df[column].astype('str').where(df[column].notna(), None)
+    return pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+
+
+def append(dataset, df, state, stats):
+    # writes the rows of df not stored yet, one file per partition
+    df = df[df['gps_time'].notna()]
+    df = df.assign(date=df['gps_time'].dt.strftime('%Y-%m-%d'), rx=df['loramac_rcx'].astype('str'))
+    n = len(df)
+    df = df.drop_duplicates(['rx'] + KEY)
+    stats["duplicates"] += n - len(df)
+    for (date, rx), rows in df.groupby(['date', 'rx'], sort=True):
+        folder = os.path.join(dataset, 'date=%s' % date, 'rx=%s' % rx)
+        if os.path.isdir(folder):
+            stored = pd.read_parquet(folder, columns=KEY)
+            seen = pd.MultiIndex.from_frame(rows[KEY]).isin(pd.MultiIndex.from_frame(stored))
+            stats["duplicates"] += int(seen.sum())
+            rows = rows[~seen]
+        if not len(rows):
+            continue
+        os.makedirs(folder, exist_ok=True)
+        state['parts'] += 1
+        name = 'part-%06d.parquet' % state['parts']
+        # hidden while written, the readers skip names starting with _
+        tmp = os.path.join(folder, '_' + name)
+        pq.write_table(_table(rows), tmp)
+        os.replace(tmp, os.path.join(folder, name))
+        stats["rows"] += len(rows)
+
+
+def ingest(paths, dataset):
+    # one pass over the logs, returns the counts of the run
+    os.makedirs(dataset, exist_ok=True)
+    state = load_state(dataset)
+    stats = {"logs": 0, "rows": 0, "bad_crc": 0, "duplicates": 0}
+    for path in sources(paths):
+        entry = state['logs'].get(path, {})
+        try:
+            df, entry = read_new(path, entry, stats)
+        except (OSError, ValueError) as e:
+            print('%s: %s' % (path, e), file=sys.stderr)
+            continue
+        if df is not None and len(df):
+            append(dataset, df, state, stats)
+            stats["logs"] += 1
+        # saved once the rows are, a crash in between only reads them again
+        state['logs'][path] = entry
+        save_state(dataset, state)
+    return stats
+
+
+def read(dataset, start=None, end=None, rx=None, columns=None):
+    # rows of the dataset between the dates start and end included, of
+    # the receiver rx, only the partitions matching are opened
+    filters = []
+    if start:
+        filters.append(('date', '>=', start))
+    if end:
+        filters.append(('date', '<=', end))
+    if rx:
+        filters.append(('rx', '=', rx))
+    schema = pa.schema(list(SCHEMA) + [('date', pa.string()), ('rx', pa.string())])
+    return pd.read_parquet(dataset, columns=columns, filters=filters or None, schema=schema)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest coverage logs into a partitioned Parquet dataset')
+    parser.add_argument('paths', nargs='+', help='logs, or directories searched for %s' % ' '.join(PATTERNS))
+    parser.add_argument('--dataset', default='coverage.parquet')
+    parser.add_argument('--follow', type=float, metavar='S', help='poll the logs every S seconds')
+    args = parser.parse_args()
+
+    while True:
+        start = time.perf_counter()
+        stats = ingest(args.paths, args.dataset)
+        if stats["logs"] or not args.follow:
+            print('%d rows from %d logs, %d failed their CRC, %d duplicates (%.1f s)' % (
+                stats["rows"], stats["logs"], stats["bad_crc"], stats["duplicates"], time.perf_counter() - start))
+        if not args.follow:
+            break
+        try:
+            time.sleep(args.follow)
+        except KeyboardInterrupt:
+            break
+
+
+if __name__ == '__main__':
+    main()
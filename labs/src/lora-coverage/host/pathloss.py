@@ -0,0 +1,174 @@
+""" Log-distance path loss fit and coverage prediction from survey data
+
+Fits, per gateway, RSSI = p0 - 10 n log10(d / 1 m) + X with NumPy least
+squares over the haversine distances of the points, X the shadowing of
+standard deviation sigma, and the noise floor from RSSI - SNR. The model
+then predicts RSSI and SNR on a raster around the gateways, and each
+cell is covered when the predicted SNR clears the demodulation floor of
+the SF, with the probability it does given the shadowing:
+    python3 pathloss.py ../notebooks/data/data.csv --sf 7 --radius 3000 --cell 25 --out grid.npz
+
+--gateway mac=lat,lon places the transmitters of the rows by their
+loramac_trx; the rows of other transmitters go to the notebook gateway.
+Extra gateways to plan for are added with --candidate lat,lon, they use
+the model of the first gateway.
+"""
+
+import argparse
+import collections
+import math
+import time
+
+import numpy as np
+
+try:
+    from scipy.special import erfc as _scipy_erfc
+except ImportError:
+    _scipy_erfc = None
+
+import coverage
+
+# gateway of the notebook
+GATEWAY = (43.422772, -1.606257)
+EARTH_RADIUS = 6371008.8
+
+# demodulation SNR floors in dB per SF (SX1272/6 datasheets)
+SNR_FLOOR = {7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+# thermal noise at 125 kHz with a 6 dB noise figure, when the data has no SNR to go by
+NOISE_DBM = -174 + 10 * math.log10(125000) + 6
+
+# points closer than this are in the near field of the fit
+MIN_DISTANCE = 10.0
+
+Model = collections.namedtuple('Model', 'p0 n sigma noise count')
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # great circle distance in m, over arrays
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype='float64')) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def fit(distance, rssi, snr=None):
+    # Model of the points, or None with fewer than 3 beyond MIN_DISTANCE
+    distance = np.asarray(distance, dtype='float64')
+    rssi = np.asarray(rssi, dtype='float64')
+    keep = distance >= MIN_DISTANCE
+    if keep.sum() < 3:
+        return None
+    x = -10 * np.log10(distance[keep])
+    a = np.column_stack([np.ones_like(x), x])
+    (p0, n), residuals, rank, sv = np.linalg.lstsq(a, rssi[keep], rcond=None)
+    sigma = float(np.std(rssi[keep] - a @ (p0, n), ddof=2))
+    if snr is not None and len(snr):
+        noise = float(np.median(rssi[keep] - np.asarray(snr, dtype='float64')[keep]))
+    else:
+        noise = NOISE_DBM
+    return Model(float(p0), float(n), sigma, noise, int(keep.sum()))
+
+
+def fit_gateways(df, gateways=None):
+    # {tx mac: (gateway lat, lon, Model)}, gateways maps MACs to positions,
+    # rows of other transmitters are all at GATEWAY
+    gateways = gateways or {}
+    tx = df['loramac_trx'].astype('str').to_numpy()
+    located = np.isin(tx, list(gateways))
+    groups = [(mac, tx == mac) for mac in gateways] + [(None, ~located)]
+    out = {}
+    for mac, rows in groups:
+        if not rows.any():
+            continue
+        lat, lon = gateways.get(mac, GATEWAY)
+        d = haversine(lat, lon, df['lat'].to_numpy()[rows], df['lon'].to_numpy()[rows])
+        model = fit(d, df['rssi'].to_numpy()[rows], df['snr'].to_numpy()[rows])
+        if model is not None:
+            out[mac] = (lat, lon, model)
+    return out
+
+
+def rssi_at(model, distance):
+    return model.p0 - 10 * model.n * np.log10(np.maximum(distance, 1.0))
+
+
+def _erfc(x):
+    # scipy when installed, else Abramowitz and Stegun 7.1.26, within 1.5e-7
+    if _scipy_erfc is not None:
+        return _scipy_erfc(x)
+    x = np.asarray(x, dtype='float64')
+    z = np.abs(x)
+    t = 1 / (1 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    out = poly * np.exp(-z * z)
+    return np.where(x < 0, 2 - out, out)
+
+
+def grid(centre, radius, cell):
+    # lat, lon of the centres of a square raster of cell m around centre
+    steps = np.arange(-radius + cell / 2, radius, cell)
+    x, y = np.meshgrid(steps, steps[::-1])
+    return coverage.unproject(x, y, *centre)
+
+
+def predict(gateways, lat, lon, sf=7):
+    # best predicted RSSI and SNR over the gateways, (lat, lon, Model)
+    # tuples, with the index of the gateway, the covered cells and the
+    # probability the SNR clears the floor of sf under the shadowing
+    best_rssi = np.full(np.shape(lat), -np.inf)
+    best_snr = np.full(np.shape(lat), -np.inf)
+    best = np.zeros(np.shape(lat), dtype='int8')
+    sigma = np.zeros(np.shape(lat))
+    for i, (glat, glon, model) in enumerate(gateways):
+        rssi = rssi_at(model, haversine(glat, glon, lat, lon))
+        snr = rssi - model.noise
+        better = snr > best_snr
+        best_rssi = np.where(better, rssi, best_rssi)
+        best_snr = np.where(better, snr, best_snr)
+        best = np.where(better, i, best)
+        sigma = np.where(better, model.sigma, sigma)
+    margin = best_snr - SNR_FLOOR[sf]
+    probability = 0.5 * _erfc(-margin / (np.maximum(sigma, 1e-6) * math.sqrt(2)))
+    return {'rssi': best_rssi, 'snr': best_snr, 'gateway': best, 'covered': margin >= 0,
+            'probability': probability}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit a path loss model and predict coverage on a grid')
+    parser.add_argument('logs', nargs='+', help='CSV files, or .bin logs of the nodes')
+    parser.add_argument('--gateway', action='append', default=[], help='mac=lat,lon of a transmitter')
+    parser.add_argument('--candidate', action='append', default=[], help='lat,lon of a gateway to plan for')
+    parser.add_argument('--sf', type=int, choices=sorted(SNR_FLOOR), default=7)
+    parser.add_argument('--radius', type=float, default=3000.0, help='grid half width in m')
+    parser.add_argument('--cell', type=float, default=25.0, help='grid cell in m')
+    parser.add_argument('--out', help='.npz file of the grid')
+    args = parser.parse_args()
+
+    positions = {}
+    for g in args.gateway:
+        mac, position = g.split('=')
+        positions[mac] = tuple(float(v) for v in position.split(','))
+
+    start = time.perf_counter()
+    df = coverage.load(args.logs)
+    fits = fit_gateways(df, positions)
+    if not fits:
+        parser.error('not enough points to fit a model')
+    for mac, (lat, lon, model) in fits.items():
+        print('%s at %.6f, %.6f: p0 %.1f dBm, n %.2f, sigma %.1f dB, noise %.1f dBm, %d points' % (
+            mac or 'gateway', lat, lon, model.p0, model.n, model.sigma, model.noise, model.count))
+    gateways = list(fits.values())
+    first = gateways[0][2]
+    gateways += [tuple(float(v) for v in c.split(',')) + (first,) for c in args.candidate]
+
+    lat, lon = grid(gateways[0][:2], args.radius, args.cell)
+    p = predict(gateways, lat, lon, args.sf)
+    area = args.cell * args.cell / 1e6
+    print('SF%d floor %.1f dB: %.2f of %.2f km2 covered, %.2f km2 expected with the shadowing (%.1f s)' % (
+        args.sf, SNR_FLOOR[args.sf], p['covered'].sum() * area, lat.size * area, p['probability'].sum() * area,
+        time.perf_counter() - start))
+    if args.out:
+        np.savez_compressed(args.out, lat=lat, lon=lon, sf=args.sf, **p)
+
+
+if __name__ == '__main__':
+    main()
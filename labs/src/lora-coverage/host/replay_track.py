@@ -0,0 +1,183 @@
+""" Replays a GPS track and a LoRa frame stream through the coverage logger
+
+Feeds gpsd TPV reports to GpsClient and GpsTrack of lora-rx-node-refact
+on the pycomsim virtual clock, while frames arrive in between, and
+compares the position logged for each frame with where the receiver
+really was:
+    python3 replay_track.py --speed 50 --fix-ms 1000 --latency 150
+    python3 replay_track.py --track ../notebooks/data/data.csv --every 3
+Without --track the receiver drives round a circle at --speed km/h and
+the frames arrive at random. With --track (a coverage CSV, gps_time lat
+lon alt in columns 3 to 6) only one fix in --every is fed and the frames
+are at the other recorded fixes. The report compares the interpolated
+position with the last fix, which is what the logger used to record.
+"""
+
+import argparse
+import calendar
+import json
+import math
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'pycom-sim'))
+
+import pycomsim
+
+sim = pycomsim.install(pycomsim.Simulator(pycomsim.Clock(virtual=True)))
+pycomsim.add_path(os.path.join(HERE, '..', 'lora-rx-node-refact'))
+
+from gpsclient import GpsClient
+from gpstrack import GpsTrack
+
+EARTH_RADIUS = 6371000.0
+# the gateway of notebooks/lora-coverage-map.ipynb
+CENTER = (43.422772, -1.606257)
+
+
+def distance(lat1, lon1, lat2, lon2):
+    # metres, equirectangular is plenty at these distances
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS * math.hypot(x, y)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def iso(t):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(t)) + '.%03dZ' % (int(t * 1000) % 1000)
+
+
+def parse_iso(s):
+    secs = calendar.timegm(time.strptime(s[:19], '%Y-%m-%dT%H:%M:%S'))
+    return secs + (float('0' + s[19:].rstrip('Z')) if len(s) > 20 else 0.0)
+
+
+def drive(args):
+    # (t, lat, lon, alt) of the fixes and of the frames, round a circle
+    radius = 300.0
+    omega = args.speed / 3.6 / radius
+
+    def where(t):
+        a = omega * t
+        return (CENTER[0] + math.degrees(radius * math.sin(a) / EARTH_RADIUS),
+                CENTER[1] + math.degrees(radius * (1 - math.cos(a)) / EARTH_RADIUS
+                                         / math.cos(math.radians(CENTER[0]))), 40.0)
+
+    fixes = [(t / 1000,) + where(t / 1000) for t in range(0, int(args.duration * 1000), args.fix_ms)]
+    frames = []
+    t = random.expovariate(args.rate)
+    while t < args.duration:
+        frames.append((t,) + where(t))
+        t += random.expovariate(args.rate)
+    return fixes, frames
+
+
+def recorded(args):
+    # every --every fix is fed, the frames are at the others
+    points = []
+    with open(args.track, errors='replace') as f:
+        for line in f:
+            row = line.strip().split(',')
+            try:
+                points.append((parse_iso(row[2]), float(row[3]), float(row[4]), float(row[5])))
+            except (IndexError, ValueError):
+                # truncated or garbled row
+                pass
+    points.sort()
+    t0 = points[0][0]
+    points = [(p[0] - t0,) + p[1:] for p in points]
+    fixes = points[::args.every]
+    frames = [p for i, p in enumerate(points) if i % args.every]
+    return fixes, frames
+
+
+def replay(args, fixes, frames):
+    # runs the logger's wait then interpolate policy on the virtual clock
+    track = GpsTrack(8, args.latency)
+    gps = GpsClient('localhost', 2947, track=track)
+    base = 1000000 - sim.clock.now_us()
+    events = [(fix[0] + (args.latency + random.uniform(0, args.jitter)) / 1000, 0, fix) for fix in fixes]
+    events += [(frame[0], 1, frame) for frame in frames]
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    results = []
+    pending = []
+    last = None
+
+    def ticks(t):
+        return (base + int(t * 1000000)) & 0xFFFFFFFF
+
+    def advance(t):
+        sim.clock.advance(max(base + int(t * 1000000) - sim.clock.now_us(), 0))
+
+    def resolve(frame, stale):
+        pos = track.position(ticks(frame[0]))
+        if pos is None:
+            return
+        error = distance(frame[1], frame[2], pos[0], pos[1])
+        old = distance(frame[1], frame[2], stale[1], stale[2]) if stale else None
+        results.append((error, old, pos[4] / 1000))
+
+    wait = args.wait / 1000
+    for t, kind, item in events:
+        for frame, stale in [p for p in pending if p[0][0] + wait <= t]:
+            advance(frame[0] + wait)
+            resolve(frame, stale)
+            pending.remove((frame, stale))
+        advance(t)
+        if kind == 0:
+            report = {"class": "TPV", "mode": 3, "time": iso(1500000000 + item[0]),
+                      "lat": item[1], "lon": item[2], "alt": item[3]}
+            gps._feed(json.dumps(report).encode() + b'\n')
+            last = item
+            for frame, stale in [p for p in pending if track.after(ticks(p[0][0]))]:
+                resolve(frame, stale)
+                pending.remove((frame, stale))
+        elif wait and not track.after(ticks(t)):
+            pending.append((item, last))
+        else:
+            resolve(item, last)
+    for frame, stale in pending:
+        resolve(frame, stale)
+    return results
+
+
+def report(results):
+    errors = [r[0] for r in results]
+    olds = [r[1] for r in results if r[1] is not None]
+    ages = [r[2] for r in results]
+    print("%d frames" % len(results))
+    print("interpolated error m: p50 %.1f  p95 %.1f  max %.1f" % (
+        percentile(errors, 50), percentile(errors, 95), max(errors)))
+    if olds:
+        print("last fix error m:     p50 %.1f  p95 %.1f  max %.1f" % (
+            percentile(olds, 50), percentile(olds, 95), max(olds)))
+    print("fix age ms: p50 %.0f  p95 %.0f  max %.0f" % (percentile(ages, 50), percentile(ages, 95), max(ages)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the position logged for each LoRa frame')
+    parser.add_argument('--track', help='coverage CSV to take the fixes from, a simulated drive otherwise')
+    parser.add_argument('--every', type=int, default=2, help='with --track, feed one recorded fix in this many')
+    parser.add_argument('--speed', type=float, default=50.0, help='km/h of the simulated drive')
+    parser.add_argument('--fix-ms', type=int, default=1000, help='ms between the fixes of the simulated drive')
+    parser.add_argument('--rate', type=float, default=2.0, help='frames per second of the simulated drive')
+    parser.add_argument('--duration', type=float, default=600.0, help='seconds of simulated drive')
+    parser.add_argument('--latency', type=int, default=100, help='ms from a fix to its arrival')
+    parser.add_argument('--jitter', type=int, default=50, help='ms of random extra delay of the fixes')
+    parser.add_argument('--wait', type=int, default=1500, help='GPS_WAIT_MS, 0 dead-reckons at once')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    fixes, frames = recorded(args) if args.track else drive(args)
+    results = replay(args, fixes, frames)
+    if not results:
+        sys.exit('no frame after the first fix')
+    report(results)
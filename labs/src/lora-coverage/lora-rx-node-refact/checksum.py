@@ -0,0 +1,39 @@
+""" LoPy CRC-8 of the LoRa coverage messages and log rows """
+
+# reflected CRC-8, polynomial 0x8C (Dallas/Maxim 1-Wire), zero init
+POLY = const(0x8C)
+
+
+def _table():
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for j in range(8):
+            crc = (crc >> 1) ^ POLY if crc & 1 else crc >> 1
+        table[i] = crc
+    return bytes(table)
+
+
+TABLE = _table()
+
+try:
+    # needs a firmware with the native code emitters
+    from checksum_viper import crc8_viper
+except Exception:
+    crc8_viper = None
+
+
+def crc8(data, crc=0):
+    """ CRC of bytes, bytearray or memoryview data. Pass the result back
+    as crc to carry on over the next chunk without copying. """
+    if crc8_viper is not None:
+        return crc8_viper(TABLE, data, len(data), crc)
+    table = TABLE
+    for b in data:
+        crc = table[crc ^ b]
+    return crc
+
+
+def crc8_hex(data):
+    # formatted like the crc column of the coverage CSV, e.g. '0x7c'
+    return hex(crc8(data))
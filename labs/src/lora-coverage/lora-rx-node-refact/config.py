@@ -4,5 +4,20 @@ WIFI_HOTSPOT_SSID = 'mrandroid'
 WIFI_HOTSPOT_WPA2 = 'eatmenow'
 GPSD_HOST = "192.168.43.1"
 GPSD_PORT = 2947
+# stream the fixes with ?WATCH, False polls with ?SHGPS.LOCATION; instead
+GPSD_WATCH = True
+# delay between a fix and its arrival over WiFi, subtracted from the fix time
+GPSD_LATENCY_MS = 0
+# a frame waits up to this long for the next fix, so that its position is
+# interpolated rather than extrapolated
+GPS_WAIT_MS = 1500
 
 LOG_PATH = '/flash/log'
+# records kept in RAM before they are written, and the longest they wait
+LOG_BUFFER_RECORDS = 32
+LOG_FLUSH_MS = 10000
+# per transmitter statistics in squares of this many metres, saved every
+# STATS_SAVE_MS to LOG_PATH/covstats.bin, the RGB LED shows the current one
+STATS_CELL_M = 50
+STATS_SAVE_MS = 60000
+COVERAGE_LED = True
@@ -0,0 +1,128 @@
+""" LoPy LoRa coverage log, binary records buffered in RAM """
+
+import binascii
+import os
+import struct
+import time
+
+# magic, version, record size, reserved, receiver LoRa MAC
+FILE_HEADER_FMT = '<4sBBH8s'
+FILE_MAGIC = b'LCOV'
+VERSION = const(1)
+
+# magic, flags, fix age ms, row number, GPS seconds, GPS ms, lat and lon
+# x 1e7, alt cm, TX count, TX LoRa MAC, TX CRC, RX CRC, rx_timestamp,
+# rssi, snr x 10, sf
+RECORD_FMT = '<BBHIIHiiiI8sBBIhhB'
+RECORD_BODY = const(49)
+RECORD_LEN = const(53)  # body and a CRC32
+MAGIC = const(0xC5)
+
+# flags
+CRC_OK = const(0x01)
+PARSED = const(0x02)
+# binary probe, the TX MAC holds the 3 bytes of its node ID
+PROBE = const(0x04)
+
+
+def gps_seconds(gps_time):
+    # '2017-05-30T12:36:00.000Z' to (seconds since 1970, ms), None when
+    # there is no valid time, as in gpsd reports before the first fix
+    if not gps_time or len(gps_time) < 19:
+        return None
+    try:
+        secs = time.mktime((int(gps_time[0:4]), int(gps_time[5:7]), int(gps_time[8:10]),
+                            int(gps_time[11:13]), int(gps_time[14:16]), int(gps_time[17:19]), 0, 0))
+        ms = int(gps_time[20:23]) if len(gps_time) >= 23 and gps_time[19] == '.' else 0
+    except ValueError:
+        return None
+    return secs, ms
+
+
+class CoverageLog:
+    """ Fixed-size, CRC'd records packed into a RAM buffer and appended to
+    the flash once buffer_records are waiting or the oldest of them is
+    flush_ms old, instead of a write and a flush per frame. There is one
+    file a day, acqYYYYMMDD.bin, named after the GPS date of the records.
+    host/decode_log.py turns the files back into the CSV columns. """
+
+    def __init__(self, path, rx_mac, buffer_records=32, flush_ms=10000):
+        self.path = path
+        self.rx_mac = rx_mac
+        self.flush_ms = flush_ms
+
+        self.buf = bytearray(RECORD_LEN * buffer_records)
+        self.mv = memoryview(self.buf)
+        self.max_records = buffer_records
+        self.n = 0
+        self.first_ms = 0
+        self.day = -1
+
+        self.rows = 0
+        self.flushes = 0
+        self.errors = 0
+        # frames not logged for want of a GPS time
+        self.skipped = 0
+
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass
+
+    def log_name(self, day):
+        tm = time.gmtime(day * 86400)
+        return self.path + '/acq%04d%02d%02d.bin' % (tm[0], tm[1], tm[2])
+
+    def append(self, gps_time, lat, lon, alt, age_ms, seq, tx_mac, crc_trx, crc_rcx, flags, tmst, rssi, snr, sf):
+        # False when the fix has no valid time and the frame is skipped
+        t = gps_seconds(gps_time)
+        if t is None:
+            self.skipped += 1
+            return False
+        secs, ms = t
+        day = secs // 86400
+        if day != self.day:
+            # rotate, the buffered records belong to the previous file
+            self.flush()
+            self.day = day
+        if not self.n:
+            self.first_ms = time.ticks_ms()
+        offset = self.n * RECORD_LEN
+        struct.pack_into(RECORD_FMT, self.buf, offset, MAGIC, flags, min(max(age_ms, 0), 65535), self.rows,
+                         secs, ms, int(round(lat * 10000000)), int(round(lon * 10000000)), int(round(alt * 100)),
+                         seq & 0xFFFFFFFF, tx_mac, crc_trx & 0xFF, crc_rcx & 0xFF, tmst & 0xFFFFFFFF, rssi,
+                         int(round(snr * 10)), sf)
+        struct.pack_into('<L', self.buf, offset + RECORD_BODY,
+                         binascii.crc32(self.mv[offset:offset + RECORD_BODY]) & 0xFFFFFFFF)
+        self.n += 1
+        self.rows += 1
+        if self.n >= self.max_records:
+            self.flush()
+        return True
+
+    def poll(self):
+        # flushes the records waiting for more than flush_ms
+        if self.n and time.ticks_diff(time.ticks_ms(), self.first_ms) >= self.flush_ms:
+            self.flush()
+
+    def flush(self):
+        if not self.n:
+            return
+        name = self.log_name(self.day)
+        try:
+            try:
+                new = os.stat(name)[6] == 0
+            except OSError:
+                new = True
+            with open(name, 'ab') as f:
+                if new:
+                    f.write(struct.pack(FILE_HEADER_FMT, FILE_MAGIC, VERSION, RECORD_LEN, 0, self.rx_mac))
+                f.write(self.mv[:self.n * RECORD_LEN])
+            self.flushes += 1
+        except OSError as e:
+            self.errors += 1
+            print("Log write error:", e)
+        self.n = 0
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,210 @@
+""" LoPy LoRa coverage statistics per transmitter and grid cell """
+
+from array import array
+import binascii
+import math
+import os
+import struct
+import time
+
+# magic, version, slots, max transmitters, cell size m, reference latitude
+FILE_FMT = '<4sBHBHf'
+FILE_MAGIC = b'LCST'
+VERSION = const(1)
+
+METERS_PER_DEGREE = 111320.0
+
+# LED colours of the current cell
+GREEN = const(0x007f00)
+YELLOW = const(0x7f7f00)
+RED = const(0x7f0000)
+
+
+def _spread(x):
+    # the 15 low bits of x on the even bits, for the Z-order of the cells
+    x &= 0x7FFF
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    return (x | (x << 1)) & 0x55555555
+
+
+class CoverageStats:
+    """ Running count, RSSI and SNR min/mean/max, and frames lost, for
+    each transmitter in each cell_m square of a grid. The entries live
+    in fixed arrays, an open addressing table whose slot is picked by
+    the interleaved (geohash-like) bits of the cell coordinates; once
+    the table is full new cells are not counted. save() writes the
+    arrays to path and they are loaded back at start. """
+
+    def __init__(self, path, slots=256, max_tx=8, cell_m=50):
+        # slots must be a power of 2
+        self.path = path
+        self.slots = slots
+        self.mask = slots - 1
+        self.max_tx = max_tx
+        self.cell_m = cell_m
+
+        self.nodes = []
+        self.lat0 = 0.0
+        self.dlat = cell_m / METERS_PER_DEGREE
+        self.dlon = self.dlat
+
+        self.cell_lat = array('l', [0] * slots)
+        self.cell_lon = array('l', [0] * slots)
+        self.tx = array('B', [0] * slots)
+        self.count = array('L', [0] * slots)
+        self.lost = array('L', [0] * slots)
+        self.rssi_min = array('h', [0] * slots)
+        self.rssi_max = array('h', [0] * slots)
+        self.rssi_sum = array('l', [0] * slots)
+        # snr x 10
+        self.snr_min = array('h', [0] * slots)
+        self.snr_max = array('h', [0] * slots)
+        self.snr_sum = array('l', [0] * slots)
+        self.arrays = (self.cell_lat, self.cell_lon, self.tx, self.count, self.lost, self.rssi_min, self.rssi_max,
+                       self.rssi_sum, self.snr_min, self.snr_max, self.snr_sum)
+
+        self.used = 0
+        self.full = 0
+        self.last = -1
+        self.dirty = False
+
+    def _reference(self, lat):
+        # cells are cell_m wide at the latitude of the first sample
+        self.lat0 = lat
+        self.dlon = self.dlat / math.cos(math.radians(lat))
+
+    def cell(self, lat, lon):
+        return int(math.floor(lat / self.dlat)), int(math.floor(lon / self.dlon))
+
+    def find(self, tx, clat, clon, create=False):
+        # slot of the entry, -1 when absent (or the table is full)
+        i = (_spread(clat) | (_spread(clon) << 1)) & self.mask
+        for n in range(self.slots):
+            if not self.count[i]:
+                if not create:
+                    return -1
+                self.cell_lat[i] = clat
+                self.cell_lon[i] = clon
+                self.tx[i] = tx
+                self.used += 1
+                return i
+            if self.cell_lat[i] == clat and self.cell_lon[i] == clon and self.tx[i] == tx:
+                return i
+            i = (i + 1) & self.mask
+        return -1
+
+    def node(self, node_id):
+        # index of a transmitter, -1 beyond max_tx
+        try:
+            return self.nodes.index(node_id)
+        except ValueError:
+            pass
+        if len(self.nodes) >= self.max_tx:
+            return -1
+        self.nodes.append(node_id)
+        return len(self.nodes) - 1
+
+    def add(self, node_id, lat, lon, rssi, snr, lost=0):
+        # one frame of node_id received at lat, lon after lost missed ones
+        tx = self.node(node_id)
+        if tx < 0:
+            return -1
+        if not self.used:
+            self._reference(lat)
+        clat, clon = self.cell(lat, lon)
+        i = self.find(tx, clat, clon, True)
+        if i < 0:
+            self.full += 1
+            return -1
+        snr = int(snr * 10)
+        if not self.count[i]:
+            self.rssi_min[i] = self.rssi_max[i] = rssi
+            self.snr_min[i] = self.snr_max[i] = snr
+        else:
+            self.rssi_min[i] = min(self.rssi_min[i], rssi)
+            self.rssi_max[i] = max(self.rssi_max[i], rssi)
+            self.snr_min[i] = min(self.snr_min[i], snr)
+            self.snr_max[i] = max(self.snr_max[i], snr)
+        self.count[i] += 1
+        self.lost[i] += max(lost, 0)
+        self.rssi_sum[i] += rssi
+        self.snr_sum[i] += snr
+        self.last = i
+        self.dirty = True
+        return i
+
+    def per(self, i):
+        sent = self.count[i] + self.lost[i]
+        return self.lost[i] / sent if sent else 0.0
+
+    def colour(self, i=None):
+        # LED colour of entry i, the last one updated by default
+        if i is None:
+            i = self.last
+        if i < 0 or not self.count[i]:
+            return RED
+        rssi = self.rssi_sum[i] / self.count[i]
+        per = self.per(i)
+        if rssi > -100 and per < 0.1:
+            return GREEN
+        if rssi > -115 and per < 0.5:
+            return YELLOW
+        return RED
+
+    def line(self, i):
+        n = self.count[i]
+        return '%s %.5f %.5f n %d rssi %d/%d/%d snr %.1f/%.1f/%.1f per %.2f' % (
+            binascii.hexlify(self.nodes[self.tx[i]]).decode() if self.tx[i] < len(self.nodes) else '?',
+            (self.cell_lat[i] + 0.5) * self.dlat, (self.cell_lon[i] + 0.5) * self.dlon, n,
+            self.rssi_min[i], self.rssi_sum[i] // n, self.rssi_max[i],
+            self.snr_min[i] / 10, self.snr_sum[i] / n / 10, self.snr_max[i] / 10, self.per(i))
+
+    def summary(self):
+        # one line per transmitter and cell, for the REPL
+        for i in range(self.slots):
+            if self.count[i]:
+                print(self.line(i))
+        print('%d cells, %d transmitters, %d frames not counted' % (self.used, len(self.nodes), self.full))
+
+    def save(self):
+        # written aside then renamed, a reset never leaves half a file
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(struct.pack(FILE_FMT, FILE_MAGIC, VERSION, self.slots, len(self.nodes), self.cell_m,
+                                    self.lat0))
+                for node_id in self.nodes:
+                    f.write(node_id)
+                for a in self.arrays:
+                    f.write(a)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            os.rename(tmp, self.path)
+            self.dirty = False
+        except OSError as e:
+            print("Stats save error:", e)
+
+    def load(self):
+        # False when there is nothing matching this table to load
+        try:
+            with open(self.path, 'rb') as f:
+                magic, version, slots, n, cell_m, lat0 = struct.unpack(FILE_FMT, f.read(struct.calcsize(FILE_FMT)))
+                if magic != FILE_MAGIC or version != VERSION or slots != self.slots or cell_m != self.cell_m \
+                        or n > self.max_tx:
+                    return False
+                self.nodes = [f.read(3) for i in range(n)]
+                for a in self.arrays:
+                    f.readinto(a)
+        except OSError:
+            return False
+        self.used = 0
+        for i in range(self.slots):
+            if self.count[i]:
+                self.used += 1
+        if self.used:
+            self._reference(lat0)
+        return True
@@ -0,0 +1,142 @@
+""" LoPy gpsd client for the LoRa coverage logger """
+
+import json
+import socket
+import time
+
+# gpsd streaming mode, the fixes are pushed as TPV reports
+WATCH = b'?WATCH={"enable":true,"json":true};\r\n'
+# ShareGPS one-shot request, for servers without ?WATCH
+POLL = b'?SHGPS.LOCATION;\r\n'
+
+LINE_MAX = const(1024)
+
+
+class GpsClient:
+    """ Keeps one TCP session open to gpsd (or the ShareGPS app) and
+    frames its newline delimited JSON incrementally. The latest fix is
+    published in self.fix as a (lat, lon, alt, time, ticks_ms) tuple,
+    replaced in a single assignment so readers never wait on the I/O.
+    Each fix is also added to track, a GpsTrack, when one is given. """
+
+    def __init__(self, host, port, watch=True, poll_ms=500, timeout_s=5, backoff_ms=1000, backoff_max_ms=30000,
+                 track=None):
+        self.host = host
+        self.port = port
+        self.watch = watch
+        self.poll_ms = poll_ms
+        self.timeout_s = timeout_s
+        self.backoff_ms = backoff_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.track = track
+
+        self.fix = None
+        self.sock = None
+        self.end = False
+
+        # bytes received but not framed yet
+        self.line = bytearray(LINE_MAX)
+        self.n = 0
+
+        self.fixes = 0
+        self.lines = 0
+        self.errors = 0
+        self.connects = 0
+
+    def run(self):
+        # thread body, returns once stop is called
+        backoff = self.backoff_ms
+        while not self.end:
+            try:
+                self._connect()
+                if self._stream():
+                    backoff = self.backoff_ms
+            except Exception as e:
+                self.errors += 1
+                print("GPS connection error:", e)
+            self._close()
+            if self.end:
+                return
+            time.sleep_ms(backoff)
+            backoff = min(backoff * 2, self.backoff_max_ms)
+
+    def stop(self):
+        self.end = True
+        self._close()
+
+    def _connect(self):
+        self.n = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout_s)
+        self.sock.connect(socket.getaddrinfo(self.host, self.port)[0][-1])
+        self.connects += 1
+        if self.watch:
+            self.sock.send(WATCH)
+
+    def _close(self):
+        sock = self.sock
+        self.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def _stream(self):
+        # until the connection drops, returns True when fixes were received
+        fixes = self.fixes
+        next_poll = time.ticks_ms()
+        while not self.end:
+            if not self.watch and time.ticks_diff(time.ticks_ms(), next_poll) >= 0:
+                self.sock.send(POLL)
+                next_poll = time.ticks_add(next_poll, self.poll_ms)
+            data = self.sock.recv(512)
+            if not data:
+                # closed by the server
+                break
+            self._feed(data)
+        return self.fixes != fixes
+
+    def _feed(self, data):
+        start = 0
+        while True:
+            end = data.find(b'\n', start)
+            if end < 0:
+                break
+            self._append(data, start, end)
+            if self.n:
+                self._parse(bytes(self.line[:self.n]))
+            self.n = 0
+            start = end + 1
+        self._append(data, start, len(data))
+
+    def _append(self, data, start, end):
+        if self.n + end - start > LINE_MAX:
+            # not a line we can use, drop what is buffered and mark the
+            # overflow past LINE_MAX, a line of LINE_MAX bytes is kept
+            self.n = LINE_MAX + 1
+            return
+        self.line[self.n:self.n + end - start] = data[start:end]
+        self.n += end - start
+
+    def _parse(self, line):
+        if self.n > LINE_MAX:
+            return
+        self.lines += 1
+        try:
+            report = json.loads(line)
+        except ValueError:
+            self.errors += 1
+            return
+        cls = report.get("class")
+        if cls not in ("TPV", "SHGPS.LOCATION") or "lat" not in report or report.get("mode", 2) < 2:
+            # VERSION, DEVICES, WATCH or no fix yet
+            return
+        if not report.get("time"):
+            # a position without a time cannot be logged
+            return
+        ticks_us = time.ticks_us()
+        self.fix = (report["lat"], report["lon"], report.get("alt", 0.0), report["time"], time.ticks_ms())
+        if self.track is not None:
+            self.track.add(self.fix[0], self.fix[1], self.fix[2], self.fix[3], ticks_us)
+        self.fixes += 1
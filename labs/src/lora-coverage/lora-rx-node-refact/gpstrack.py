@@ -0,0 +1,89 @@
+""" LoPy GPS track, positions interpolated at the LoRa frame time """
+
+from array import array
+import time
+
+
+class GpsTrack:
+    """ The last fixes with the ticks_us they were received at, minus the
+    gpsd delivery latency. position() interpolates between the fixes
+    around a frame's rx_timestamp, or dead-reckons from the last two
+    fixes when the frame is newer than all of them.
+
+    GpsClient adds the fixes from its thread and the logging thread
+    reads them: add only moves head once the slot is written and
+    position reads again if head moved meanwhile, so no lock is needed. """
+
+    def __init__(self, slots=8, latency_ms=0, max_extrapolate_ms=2000):
+        # slots must be a power of 2
+        self.slots = slots
+        self.mask = slots - 1
+        self.latency_us = latency_ms * 1000
+        self.max_extrapolate_us = max_extrapolate_ms * 1000
+        self.lat = array('d', [0.0] * slots)
+        self.lon = array('d', [0.0] * slots)
+        self.alt = array('f', [0.0] * slots)
+        self.ticks = array('L', [0] * slots)
+        self.times = [''] * slots
+
+        # free running counter
+        self.head = 0
+
+    def add(self, lat, lon, alt, gps_time, ticks_us):
+        i = self.head & self.mask
+        self.lat[i] = lat
+        self.lon[i] = lon
+        self.alt[i] = alt
+        self.times[i] = gps_time
+        self.ticks[i] = time.ticks_add(ticks_us, -self.latency_us)
+        self.head += 1
+
+    def after(self, ticks_us):
+        # True when a fix newer than ticks_us was received
+        head = self.head
+        if not head:
+            return False
+        return time.ticks_diff(self.ticks[(head - 1) & self.mask], ticks_us) > 0
+
+    def position(self, ticks_us):
+        # (lat, lon, alt, gps time, fix age in us) at ticks_us, None before the first fix
+        while True:
+            head = self.head
+            pos = self._position(head, ticks_us)
+            if self.head == head:
+                return pos
+
+    def _position(self, head, t):
+        n = min(head, self.slots)
+        if not n:
+            return None
+        newer = -1
+        for k in range(1, n + 1):
+            i = (head - k) & self.mask
+            if time.ticks_diff(t, self.ticks[i]) >= 0:
+                break
+            newer = i
+        else:
+            # older than all the fixes kept, the oldest is the closest
+            return self._blend(newer, newer, 0.0, t)
+        if newer >= 0:
+            span = time.ticks_diff(self.ticks[newer], self.ticks[i])
+            return self._blend(i, newer, time.ticks_diff(t, self.ticks[i]) / span, t)
+        if n == 1:
+            return self._blend(i, i, 0.0, t)
+        # newer than the last fix, carry on at the speed between the last two
+        prev = (head - 2) & self.mask
+        span = time.ticks_diff(self.ticks[i], self.ticks[prev])
+        ahead = min(time.ticks_diff(t, self.ticks[i]), self.max_extrapolate_us)
+        if span <= 0:
+            return self._blend(i, i, 0.0, t)
+        return self._blend(prev, i, 1.0 + ahead / span, t)
+
+    def _blend(self, a, b, f, t):
+        # fix a moved towards fix b by f, aged from the last fix before t
+        base = a if f < 1.0 else b
+        return (self.lat[a] + (self.lat[b] - self.lat[a]) * f,
+                self.lon[a] + (self.lon[b] - self.lon[a]) * f,
+                self.alt[a] + (self.alt[b] - self.alt[a]) * f,
+                self.times[base],
+                time.ticks_diff(t, self.ticks[base]))
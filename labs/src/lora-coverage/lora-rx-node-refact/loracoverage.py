@@ -15,30 +15,61 @@ import sys
 import _thread
 import utils
 import config
+from rxring import RxRing
+from gpsclient import GpsClient
+from gpstrack import GpsTrack
+from covlog import CoverageLog, CRC_OK, PARSED, PROBE
+import probe
+from covstats import CoverageStats
+
+# poll period while a frame waits for the next fix
+GPS_WAIT_STEP_MS = const(50)
+# TX MAC logged for the frames that are not coverage probes
+NO_MAC = bytes(8)
+# before the node ID of a probe in the logged TX MAC
+PROBE_PAD = bytes(5)
 
 class LoraCoverage:
 
-    def __init__(self, host, port, ssid, wpa, log_path):
+    def __init__(self, host, port, ssid, wpa, log_path, gps_watch=True, gps_latency_ms=0, gps_wait_ms=1500,
+                 log_buffer_records=32, log_flush_ms=10000, stats_cell_m=50, stats_save_ms=60000, led=True):
         self.host = host
         self.port = port
         self.ssid = ssid
         self.wpa = wpa
         self.path = log_path
 
-        self.gps_buffer = None
-        self.log_time = None
-        self.log_file = None
-        self.rxnb = 0
-
-        self.loramac = binascii.hexlify(network.LoRa().mac())
+        # one streaming session to the GPS server, the fixes go to self.track
+        # where the position is interpolated at each frame's rx_timestamp
+        self.track = GpsTrack(8, gps_latency_ms)
+        self.gps = GpsClient(host, port, watch=gps_watch, track=self.track)
+        # how long a frame may wait for the fix after it, 0 dead-reckons at once
+        self.gps_wait_us = gps_wait_ms * 1000
+
+        # binary records, buffered and written in blocks to one file a day
+        self.log = CoverageLog(log_path, network.LoRa().mac(), log_buffer_records, log_flush_ms)
+        self.log_flush_ms = log_flush_ms
+        self.flush_alarm = None
+        # frames received and lost per transmitter, from the probe sequence numbers
+        self.seq = probe.SeqTracker()
+        # per transmitter and grid cell summary, see stats.summary() in the REPL
+        self.stats = CoverageStats(log_path + '/covstats.bin', cell_m=stats_cell_m)
+        self.stats.load()
+        self.stats_save_ms = stats_save_ms
+        self.stats_saved = time.ticks_ms()
+        # the RGB LED shows the coverage of the current cell
+        self.led = led
 
         # to be refactored
         self.end = False
 
-        self.lock = _thread.allocate_lock()
-
-        # Create proper directory for log file
-        self._init_log()
+        # received frames are captured here by _lora_cb and logged by _rx_thread
+        self.rx_ring = RxRing(16)
+        # released to wake up _rx_thread
+        self.rx_event = _thread.allocate_lock()
+        self.rx_event.acquire()
+        # frames _rx_thread failed to log
+        self.rx_errors = 0
 
         # Setup wypy/lopy as a station
         self.wlan = network.WLAN(mode=network.WLAN.STA)
@@ -54,155 +85,144 @@ class LoraCoverage:
         self.lora = None
         self.lora_sock = None
 
-        # TCP socket
-        self.tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # Connect
-        self.tcp_sock.connect((self.host, self.port))
-
-    def _init_log(self):
-        # create directory log if not exist
-        try:
-            os.mkdir(self.path)
-        except OSError:
-            pass
-
     # Check if string is empty
     def _isNotBlank (self, myString):
         return bool(myString and myString.strip())
 
-    def _get_log_name(self):
-        #print(self.log_time[:19])
-        #print(type(ts))
-        # ts = ts.replace('-', '')
-        # ts = ts.replace('T', '')
-        # ts = ts.replace(':', '')
-        #ts = '1974'
-        #base = self.path + '/acq/'
-        #return base + ts + 'list.csv'
-        return self.path + '/acq.list.csv'
-
     def _lora_cb(self, lora):
         events = lora.events()
-        if (events & LoRa.RX_PACKET_EVENT) and (self.gps_buffer is not None):
-            #if self.log_file is None:
-            #    self.log_file = open(self._get_log_name(), 'w')
-
+        if events & LoRa.RX_PACKET_EVENT:
+            # only capture the frame here, _rx_thread does the rest
             data_rx = self.lora_sock.recv(256)
             stats = self.lora.stats()            # get lora stats (data is tuple)
+            if self.rx_ring.put(data_rx, stats.rssi, stats.snr, stats.sfrx, stats.rx_timestamp):
+                self._wake_rx_thread()
+
+    def _wake(self, alarm):
+        # lets _rx_thread flush the log when no frame comes
+        self._wake_rx_thread()
+
+    def _wake_rx_thread(self):
+        # called from the LoRa callback, the flush alarm and stop, which
+        # may all find the lock held: the second release raises and is ignored
+        try:
+            self.rx_event.release()
+        except RuntimeError:
+            pass
+
+    def _exit(self):
+        self.log.close()
+        if self.stats.dirty:
+            self.stats.save()
+        _thread.exit()
+
+    def _save_stats(self):
+        if self.stats.dirty and time.ticks_diff(time.ticks_ms(), self.stats_saved) >= self.stats_save_ms:
+            self.stats.save()
+            self.stats_saved = time.ticks_ms()
 
-            if self._isNotBlank(data_rx):
-                with self.lock:
-                    print(self.log_time)
-                    print(self.gps_buffer)
-                #print(self.gps_buffer['time'])
-                # time_stamp = stats[0]          # get timestamp value
-                # rssi = stats[1]
-                # snr = stats[2]
-                # sf = stats[3]
-                #
-                # msgData = ''
-                # msgCrc = ''
-                # if len(data_rx) >= 5:
-                #     msg_data = data_rx[:-5]                  # remove the last 5 char data crc
-                #     msg_crc = data_rx[-4:]                   # get the last 4 char
-                #
-                # # Calculate CRC
-                # crc8 = utils.crc(msg_data)
-                #
-                # # Check CRC
-                # crc_ok = True if crc8 == msg_crc.decode('utf-8') else False
-                # # crc_ok = False
-                # # if crc8 == msg_crc.decode('utf-8'):
-                # #     crc_ok = True
-                #
-                # # fields_lorastats(LoraStats)
-                #
-                # # form csv row
-                # msg = str(self.rxnb)
-                # msg = msg + ',' + self.loramac.decode('utf8')
-                # msg = msg + ',' + self.gps_buffer['time']
-                # msg = msg + ',' + str(self.gps_buffer.lat)
-                # msg = msg + ',' + str(self.gps_buffer.lon)
-                # msg = msg + ',' + str(self.gps_buffer.alt)
-                #
-                # msg = msg + ',' + msg_data.decode('utf-8')
-                # msg = msg + ',' + msg_crc.decode('utf-8')
-                # msg = msg + ',' + str(crc8)
-                # msg = msg + ',' + str(crc_ok)
-                # msg = msg + ',' + str(time_stamp)
-                # msg = msg + ',' + str(rssi)
-                # msg = msg + ',' + str(snr)
-                # msg = msg + ',' + str(sf)
-                #
-                # # # calc crc8 row
-                # #crc8row = calc(msg.encode('utf-8'))
-                # crc8row = utils.crc(msg.encode('utf-8'))
-                #
-                # # # add crc8row as last item
-                # msg = msg + ',' + str(crc8row)
-                #
-                # # write csv and terminal
-                # self.log_file.write(msg)
-                # self.log_file.write('\n')
-                # self.log_file.flush()
-                #
-                # print(msg)              # show in repl
-                # self.rxnb += 1
+    def _rx_thread(self):
+        while True:
+            self.rx_event.acquire()
+            if self.end:
+                self._exit()
+            i = self.rx_ring.peek()
+            while i >= 0:
+                if self.end:
+                    self._exit()
+                tmst = self.rx_ring.tmst[i]
+                if not self.track.after(tmst) and time.ticks_diff(time.ticks_us(), tmst) < self.gps_wait_us:
+                    # interpolating needs the fix after the frame
+                    time.sleep_ms(GPS_WAIT_STEP_MS)
+                    continue
+                try:
+                    self._log_rx(i)
+                except Exception as e:
+                    # a bad frame or fix costs that frame, not the logging
+                    self.rx_errors += 1
+                    print("Log error:", e)
+                self.rx_ring.release()
+                i = self.rx_ring.peek()
+            self.log.poll()
+            self._save_stats()
+
+    def _log_rx(self, i):
+        # fix is (lat, lon, alt, gps time, age in us) at the frame reception
+        fix = self.track.position(self.rx_ring.tmst[i])
+        if fix is None:
+            return
+
+        data_rx = bytes(self.rx_ring.data(i))
+        if not data_rx:
+            return
+
+        seq = 0
+        tx_mac = NO_MAC
+        crc_trx = 0
+        crc_rcx = 0
+        flags = 0
+        per = ''
+        decoded = probe.decode(data_rx)
+        if decoded is not None:
+            # lora-tx-node sends 8 byte binary probes
+            seq, node, sf, tx_power, crc_rcx = decoded
+            tx_mac = PROBE_PAD + node
+            crc_trx = data_rx[-1]
+            flags = PARSED | PROBE | (CRC_OK if crc_rcx == crc_trx else 0)
+        else:
+            # older TX nodes send "<count>,<lora mac hex>,<crc hex>"
+            try:
+                k = data_rx.rfind(b',')
+                msg_data = data_rx[:k]
+                count, mac = msg_data.split(b',')
+                seq = int(count)
+                tx_mac = binascii.unhexlify(mac)
+                crc_trx = int(data_rx[k + 1:], 16)
+                crc_rcx = int(utils.crc(msg_data), 16)
+                flags = PARSED | (CRC_OK if crc_rcx == crc_trx else 0)
+            except ValueError:
+                pass
+
+        if flags & CRC_OK:
+            node = probe.node_id(tx_mac)
+            lost = self.seq.update(node, seq & 0xFFFF)
+            if lost >= 0:
+                j = self.seq.index(node)
+                per = ' PER %.2f (%.2f)' % (self.seq.recent_per(j), self.seq.per(j))
+                self.stats.add(node, fix[0], fix[1], self.rx_ring.rssi[i], self.rx_ring.snr[i], lost)
+                if self.led:
+                    pycom.rgbled(self.stats.colour())
+
+        if not self.log.append(fix[3], fix[0], fix[1], fix[2], fix[4] // 1000, seq, tx_mac, crc_trx, crc_rcx, flags,
+                               self.rx_ring.tmst[i], self.rx_ring.rssi[i], self.rx_ring.snr[i], self.rx_ring.sf[i]):
+            return
+        print('%d %s %f %f %d%s' % (self.log.rows, fix[3], fix[0], fix[1], self.rx_ring.rssi[i], per))
 
     def start(self):
         # Initialize a LoRa sockect
-        self.lora = LoRa(mode=LoRa.LORA)
+        self.lora = LoRa(mode=LoRa.LORA, frequency=probe.FREQUENCY, sf=probe.SF)
         self.lora_sock = socket.socket(socket.AF_LORA, socket.SOCK_RAW)
         self.lora_sock.setblocking(False)
 
         #self.tcp_alarm = Timer.Alarm(handler=lambda u: self._tcp_gps(), s=1, periodic=True)
         self.lora.callback(trigger=LoRa.RX_PACKET_EVENT, handler=self._lora_cb)
+        if self.led:
+            pycom.heartbeat(False)
+        self.flush_alarm = Timer.Alarm(self._wake, ms=self.log_flush_ms // 2, periodic=True)
 
-        # Start the TCP thread receiving GPS coordinates
-        _thread.start_new_thread(self._tcp_thread, ())
+        # Start the GPS streaming thread and the logging thread
+        _thread.start_new_thread(self.gps.run, ())
+        _thread.start_new_thread(self._rx_thread, ())
 
 
     def stop(self):
         self.wlan.mode(network.WLAN.AP)
-        self.tcp_sock.close()
+        self.gps.stop()
 
         self.lora.callback(trigger=LoRa.RX_PACKET_EVENT, handler=None)
         self.lora_sock.close()
-        #self.log_file.close()
+        self.flush_alarm.cancel()
 
-        # Set end flag to terminate TCP thread
+        # Set end flag to terminate the logging thread, it flushes the log
         self.end = True
-
-    def _tcp_thread(self):
-        while True:
-            if self.end:
-                _thread.exit()
-
-            try:
-                # Send request
-                self.tcp_sock.send(b'?SHGPS.LOCATION;\r\n')
-                # Get response
-                rx_data = self.tcp_sock.recv(4096)
-
-                # Release the lock in case of previous TCP error
-                #self.lock.release()
-
-                # Save last gps received to buffer
-                with self.lock:
-                    self.gps_buffer = json.loads(rx_data.decode('ascii'))
-                    if not self.log_time:
-                       self.log_time = self.gps_buffer['time']
-
-            except socket.timeout:
-                self.lock.locked()
-            except OSError as e:
-                if e.errno == errno.EAGAIN:
-                    pass
-                else:
-                    self.lock.locked()
-                    print("Error: Android 'ShareGPS' connection status should be 'Listening'")
-                    print('Change mode and soft reboot Pycom device')
-            except Exception:
-                self.lock.locked()
-                print("TCP recv Exception")
-            time.sleep(0.5)
+        self._wake_rx_thread()
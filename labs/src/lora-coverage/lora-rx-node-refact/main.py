@@ -257,7 +257,10 @@ import utils
 # expansion board button
 button = Pin("G17", mode=Pin.IN, pull=Pin.PULL_UP)
 
-lora_cov = LoraCoverage(config.GPSD_HOST, config.GPSD_PORT, config.WIFI_HOTSPOT_SSID, config.WIFI_HOTSPOT_WPA2, config.LOG_PATH)
+lora_cov = LoraCoverage(config.GPSD_HOST, config.GPSD_PORT, config.WIFI_HOTSPOT_SSID, config.WIFI_HOTSPOT_WPA2, config.LOG_PATH,
+                        config.GPSD_WATCH, config.GPSD_LATENCY_MS, config.GPS_WAIT_MS,
+                        config.LOG_BUFFER_RECORDS, config.LOG_FLUSH_MS, config.STATS_CELL_M, config.STATS_SAVE_MS,
+                        config.COVERAGE_LED)
 
 lora_cov.start()
 
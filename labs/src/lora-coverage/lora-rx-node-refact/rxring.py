@@ -0,0 +1,66 @@
+""" LoPy LoRa RX capture ring """
+
+from array import array
+
+
+class RxRing:
+    """ Preallocated slots filled by the LoRa callback and drained by one
+    worker thread. The callback only moves head and the worker only moves
+    tail, so no lock is needed between them. """
+
+    def __init__(self, slots=16, size=256):
+        # slots must be a power of 2
+        self.slots = slots
+        self.mask = slots - 1
+        self.size = size
+        self.payload = [bytearray(size) for i in range(slots)]
+        self.views = [memoryview(p) for p in self.payload]
+        self.length = array('H', [0] * slots)
+        self.rssi = array('h', [0] * slots)
+        self.snr = array('f', [0] * slots)
+        self.sf = array('B', [0] * slots)
+        self.tmst = array('L', [0] * slots)
+        self.chan = array('B', [0] * slots)
+
+        # free running counters
+        self.head = 0
+        self.tail = 0
+
+        self.received = 0
+        self.overruns = 0
+
+    def count(self):
+        return self.head - self.tail
+
+    def put(self, data, rssi, snr, sf, tmst, chan=0):
+        # called from the LoRa callback
+        self.received += 1
+        if self.head - self.tail > self.mask:
+            self.overruns += 1
+            return False
+        i = self.head & self.mask
+        n = len(data)
+        if n > self.size:
+            n = self.size
+            data = data[:n]
+        self.payload[i][:n] = data
+        self.length[i] = n
+        self.rssi[i] = rssi
+        self.snr[i] = snr
+        self.sf[i] = sf
+        self.tmst[i] = tmst
+        self.chan[i] = chan
+        self.head += 1
+        return True
+
+    def peek(self, k=0):
+        # index of the k-th oldest filled slot, -1 if there are not that many
+        if self.head - self.tail <= k:
+            return -1
+        return (self.tail + k) & self.mask
+
+    def data(self, i):
+        return self.views[i][:self.length[i]]
+
+    def release(self, n=1):
+        self.tail += n
@@ -0,0 +1,12 @@
+""" Viper loop of checksum.crc8, only imported when the firmware supports it """
+
+import micropython
+
+
+@micropython.viper
+def crc8_viper(table, data, n: int, crc: int) -> int:
+    t = ptr8(table)
+    p = ptr8(data)
+    for i in range(n):
+        crc = t[(crc ^ p[i]) & 0xFF]
+    return crc
@@ -41,6 +41,8 @@ import json
 import binascii
 import sys
 import utils
+from covlog import CoverageLog, CRC_OK, PARSED, PROBE
+import probe
 
 # gps data
 lat = 0.0
@@ -116,9 +118,8 @@ def isNotBlank (myString):
 
 loramac = binascii.hexlify(network.LoRa().mac())
 
-# initialize LoRa in LORA mode
-# more params can also be given, like frequency, tx power and spreading factor
-lora = LoRa(mode=LoRa.LORA)
+# initialize LoRa in LORA mode on the channel and SF of the probes
+lora = LoRa(mode=LoRa.LORA, frequency=probe.FREQUENCY, sf=probe.SF)
 
 # create a raw LoRa socket
 nMsgTx = 1
@@ -143,29 +144,10 @@ while not wlan.isconnected():
 print(wlan.ifconfig())
 
 # ---------------------------------
-# create directory log if not exist
-try:
-    os.mkdir('/flash/log')
-except OSError:
-    pass
-
-# open file to store csv
-# form name of csv file
-# format: acq<year><month><day><hour><min><sec>
-
-# unpack localtime in year...
-year, month, day, hour, minute, second, ms, dayinyear = time.localtime()
-
-nameCsv = '/flash/log/acq'
-nameCsv = nameCsv + '{:04d}'.format(year)
-nameCsv = nameCsv + '{:02d}'.format(month)
-nameCsv = nameCsv + '{:02d}'.format(day)
-nameCsv = nameCsv + '{:02d}'.format(hour)
-nameCsv = nameCsv + '{:02d}'.format(minute)
-nameCsv = nameCsv + '{:02d}'.format(second)
-nameCsv = nameCsv + 'list.csv'
-
-fCsv = open(nameCsv, 'w')
+# binary log, one file a day in /flash/log, see host/decode_log.py
+log = CoverageLog('/flash/log', network.LoRa().mac())
+# frames received and lost per transmitter, from the probe sequence numbers
+tracker = probe.SeqTracker()
 
 # ---------------------------------
 pressed = 0
@@ -187,59 +169,64 @@ while True:
         snr=LoraStats[2]
         sf=LoraStats[3]
 
-        msgData=""
-        msgCrc=""
-        if len(dataRx)>=5:
-            msgData = dataRx[:-5]                  # remove the last 5 char data crc
-            msgCrc = dataRx[-4:]                   # get the last 4 char
-
-        # calc crc
-        crc8 = utils.crc(msgData)
-        # verify crc
-        crcOk = False
-        if crc8 == msgCrc.decode('utf-8'):
-            crcOk = True
+        seq = 0
+        txMac = bytes(8)
+        txCrc = 0
+        rxCrc = 0
+        flags = 0
+        per = ''
+        decoded = probe.decode(dataRx)
+        if decoded is not None:
+            # 8 byte binary probe from lora-tx-node
+            seq, node, txSf, txPower, rxCrc = decoded
+            txMac = bytes(5) + node
+            txCrc = dataRx[-1]
+            flags = PARSED | PROBE
+            if rxCrc == txCrc:
+                flags |= CRC_OK
+                if tracker.update(node, seq) >= 0:
+                    j = tracker.index(node)
+                    per = 'PER %.2f (%.2f)' % (tracker.recent_per(j), tracker.per(j))
+        else:
+            msgData=""
+            msgCrc=""
+            if len(dataRx)>=5:
+                msgData = dataRx[:-5]                  # remove the last 5 char data crc
+                msgCrc = dataRx[-4:]                   # get the last 4 char
+
+            # calc crc
+            crc8 = utils.crc(msgData)
+            rxCrc = int(crc8, 16)
+            # verify crc
+            crcOk = False
+            if crc8 == msgCrc.decode('utf-8'):
+                crcOk = True
+
+            # message is "<count>,<lora mac hex>"
+            try:
+                txCount, txHex = msgData.split(b',')
+                seq = int(txCount)
+                txMac = binascii.unhexlify(txHex)
+                txCrc = int(msgCrc, 16)
+                flags = PARSED | (CRC_OK if crcOk else 0)
+            except (ValueError, TypeError):
+                pass
 
         # fields_lorastats(LoraStats)
 
-        # form csv row
-        msg = str(count)
-        msg = msg + ',' + loramac.decode('utf8')
-        msg = msg + ',' + gpstime
-        msg = msg + ',' + str(lat)
-        msg = msg + ',' + str(lon)
-        msg = msg + ',' + str(alt)
-
-        msg = msg + ',' + msgData.decode('utf-8')
-        msg = msg + ',' + msgCrc.decode('utf-8')
-        msg = msg + ',' + str(crc8)
-        msg = msg + ',' + str(crcOk)
-        msg = msg + ',' + str(timestamp)
-        msg = msg + ',' + str(rssi)
-        msg = msg + ',' + str(snr)
-        msg = msg + ',' + str(sf)
-
-        # # calc crc8 row
-        #crc8row = calc(msg.encode('utf-8'))
-        crc8row = utils.crc(msg.encode('utf-8'))
-
-        # # add crc8row as last item
-        msg = msg + ',' + str(crc8row)
-
-        # write csv and terminal
-        fCsv.write(msg)
-        fCsv.write('\n')
-        fCsv.flush()
-
-        print(msg)              # show in repl
+        # skipped until the GPS has a time
+        if log.append(gpstime, lat, lon, alt, 0, seq, txMac, txCrc, rxCrc, flags, timestamp, rssi, snr, sf):
+            print(count, gpstime, lat, lon, rssi, per)              # show in repl
 
-        count = count + 1
+            count = count + 1
 
     s.close()
+    log.poll()
     time.sleep(0.3)  #<== Try a delay here...
 
     if button() == 0:
         print("Acquisition ended")
+        log.close()
         wlan.mode(network.WLAN.AP)
         pycom.rgbled(0x7f0000) # red
         break
@@ -7,40 +7,44 @@
 
 import network
 from network import LoRa
-import binascii
 import socket
-import machine
 import time
-import binascii
-import sys
-import utils # utilities module with CRC calculation
+import probe # binary coverage probe payload
+import txsched # duty cycle pacing
+
+TX_POWER = 14
 
 # Initialize LoRa in LORA mode.
-lora = LoRa(mode=LoRa.LORA)
+lora = LoRa(mode=LoRa.LORA, frequency=probe.FREQUENCY, sf=probe.SF, tx_power=TX_POWER)
+
+# As many probes as the 1% duty cycle of the sub-band allows
+sched = txsched.TxScheduler(probe.FREQUENCY, probe.SF)
 
-# Get loramac as id to be sent in message
-lora_mac = binascii.hexlify(network.LoRa().mac()).decode('utf8')
+# Truncated loramac as id to be sent in message
+node = probe.node_id(network.LoRa().mac())
 
 # Create a raw LoRa socket
 s = socket.socket(socket.AF_LORA, socket.SOCK_RAW)
 
 count_tx = 0
+msgtx = bytearray(probe.PROBE_LEN)
 
 # tx loop
 while True:
+    time.sleep_ms(sched.next_us(probe.PROBE_LEN) // 1000)
     s.setblocking(True)
 
-    msgtx = str(count_tx) + ',' + lora_mac
-    crc8 = utils.crc(msgtx.encode('utf8'))
-    msgtx = msgtx + ',' + crc8
+    # 8 bytes: version and sf, sequence number, node id, tx power, crc
+    probe.encode(msgtx, count_tx, node, probe.SF, TX_POWER)
 
     s.send(msgtx)
-    print('Tx: {} is sending data ...'.format(lora_mac))
+    sched.sent(len(msgtx))
+    print('Tx: probe {} is sending data ...'.format(count_tx))
+    if count_tx % 100 == 0:
+        print('Tx: ' + sched.report())
 
     count_tx += 1
 
     # Get any data received...
     s.setblocking(False)
     data = s.recv(64)
-
-    time.sleep(2)
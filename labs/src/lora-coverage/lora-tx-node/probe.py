@@ -0,0 +1,111 @@
+""" LoPy LoRa coverage probe: binary payload and sequence tracking """
+
+import struct
+
+from checksum import crc8
+
+# version << 4 | sf - 6, sequence number, last 3 bytes of the TX LoRa MAC,
+# tx power dBm, then a CRC-8 of these 7 bytes
+PROBE_FMT = '>BH3sb'
+PROBE_LEN = const(8)
+VERSION = const(1)
+
+# the channel and spreading factor of the campaign, the TX and the RX
+# nodes open the radio with them
+FREQUENCY = 868100000
+SF = const(7)
+
+# a jump of more sequence numbers than this is a TX restart, not losses
+MAX_GAP = const(1000)
+# frames the recent PER is computed over, fits a small int
+WINDOW = const(24)
+WINDOW_MASK = const(0xFFFFFF)
+
+
+def node_id(mac):
+    # the truncated ID sent in the probes, from LoRa().mac()
+    return bytes(mac[-3:])
+
+
+def encode(buf, seq, node, sf, tx_power):
+    # packs a probe in buf, a bytearray of PROBE_LEN, returns buf
+    struct.pack_into(PROBE_FMT, buf, 0, (VERSION << 4) | (sf - 6), seq & 0xFFFF, node, tx_power)
+    buf[PROBE_LEN - 1] = crc8(memoryview(buf)[:PROBE_LEN - 1])
+    return buf
+
+
+def decode(data):
+    # (seq, node id, sf, tx power, crc of the received bytes), None when
+    # data is not a probe. The probe is intact if the crc is data[-1].
+    if len(data) != PROBE_LEN or data[0] >> 4 != VERSION:
+        return None
+    version_sf, seq, node, tx_power = struct.unpack_from(PROBE_FMT, data)
+    return seq, node, (version_sf & 0x0F) + 6, tx_power, crc8(memoryview(data)[:PROBE_LEN - 1])
+
+
+class SeqTracker:
+    """ Frames received and lost per transmitter, from the gaps in the
+    probe sequence numbers. The PER is given since the start and over
+    the last WINDOW frames sent, the latter following the receiver
+    from place to place. Up to max_tx transmitters are tracked. """
+
+    def __init__(self, max_tx=8):
+        self.max_tx = max_tx
+        self.nodes = []
+        self.last = [0] * max_tx
+        self.received = [0] * max_tx
+        self.lost = [0] * max_tx
+        # bit set per frame received, newest in bit 0
+        self.window = [0] * max_tx
+        self.window_n = [0] * max_tx
+
+    def index(self, node):
+        # slot of node, -1 when all slots are taken
+        try:
+            return self.nodes.index(node)
+        except ValueError:
+            pass
+        if len(self.nodes) >= self.max_tx:
+            return -1
+        self.nodes.append(node)
+        return len(self.nodes) - 1
+
+    def update(self, node, seq):
+        # frames lost just before this one, -1 for a duplicate or an untracked node
+        i = self.index(node)
+        if i < 0:
+            return -1
+        if self.received[i]:
+            gap = ((seq - self.last[i]) & 0xFFFF) - 1
+            if gap < 0:
+                return -1
+            if gap > MAX_GAP:
+                # restarted, or too far behind to tell
+                gap = 0
+                self.window_n[i] = 0
+        else:
+            gap = 0
+        self.last[i] = seq
+        self.received[i] += 1
+        self.lost[i] += gap
+        shift = min(gap + 1, WINDOW)
+        self.window[i] = ((self.window[i] << shift) | 1) & WINDOW_MASK
+        self.window_n[i] = min(self.window_n[i] + gap + 1, WINDOW)
+        return gap
+
+    def per(self, i):
+        # since the start
+        sent = self.received[i] + self.lost[i]
+        return self.lost[i] / sent if sent else 0.0
+
+    def recent_per(self, i):
+        # over the last WINDOW frames sent
+        n = self.window_n[i]
+        if not n:
+            return 0.0
+        w = self.window[i] & ((1 << n) - 1)
+        got = 0
+        while w:
+            got += w & 1
+            w >>= 1
+        return 1.0 - got / n
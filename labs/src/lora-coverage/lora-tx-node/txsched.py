@@ -0,0 +1,106 @@
+""" LoPy LoRa transmit scheduler within the EU868 duty cycle limits """
+
+import machine
+import time
+
+# EU868 sub-bands (ETSI EN 300 220-2): low Hz, high Hz, duty cycle in 1/1000
+SUB_BANDS = ((863000000, 865000000, 1),
+             (865000000, 868000000, 10),
+             (868000000, 868600000, 10),
+             (868700000, 869200000, 1),
+             (869400000, 869650000, 100),
+             (869700000, 870000000, 10))
+
+
+def time_on_air_us(size, sf=7, bw=125000, cr=1, preamble=8, header=True, crc=True):
+    # LoRa time on air of size payload bytes (Semtech AN1200.13), cr 1 is 4/5
+    t_sym = (1 << sf) * 1000000 // bw
+    # low data rate optimisation from 16 ms symbols, SF11 and SF12 at 125 kHz
+    de = 1 if t_sym >= 16000 else 0
+    num = 8 * size - 4 * sf + 28 + (16 if crc else 0) - (0 if header else 20)
+    den = 4 * (sf - 2 * de)
+    n_payload = 8 + max(((num + den - 1) // den) * (cr + 4), 0)
+    return (preamble * 4 + 17) * t_sym // 4 + n_payload * t_sym
+
+
+class SubBand:
+    """ Token bucket of airtime: it fills at the duty cycle, times margin
+    to stay clear of the limit, up to window_s worth of it. A frame may
+    go when the bucket holds its time on air. """
+
+    def __init__(self, duty, margin=0.9, window_s=3600):
+        self.duty = duty
+        self.rate = duty * margin
+        self.capacity = self.rate * window_s * 1000000
+        # start empty, a reboot loop must not burst
+        self.tokens = 0.0
+        self.last = time.ticks_us()
+
+        self.sent = 0
+        self.airtime_us = 0
+        # summed at each refill, the ticks wrap around
+        self.elapsed_us = 0
+
+    def refill(self, now):
+        elapsed = time.ticks_diff(now, self.last)
+        self.tokens = min(self.tokens + elapsed * self.rate, self.capacity)
+        self.elapsed_us += elapsed
+        self.last = now
+
+    def wait_us(self, toa_us):
+        # until the bucket holds toa_us, 0 if it already does
+        self.refill(time.ticks_us())
+        if self.tokens >= toa_us:
+            return 0
+        return int((toa_us - self.tokens) / self.rate) + 1
+
+    def consume(self, toa_us):
+        self.refill(time.ticks_us())
+        self.tokens -= toa_us
+        self.sent += 1
+        self.airtime_us += toa_us
+
+    def utilisation(self):
+        # share of the duty cycle budget used since the start
+        self.refill(time.ticks_us())
+        return self.airtime_us / (self.elapsed_us * self.duty) if self.elapsed_us > 0 else 0.0
+
+
+class TxScheduler:
+    """ Paces the frames of a node at the highest rate its sub-band duty
+    cycle allows. next_us spaces them evenly at the rate the bucket
+    refills, with random jitter so that the nodes do not stay in step,
+    and never earlier than the bucket allows. """
+
+    def __init__(self, frequency, sf=7, bw=125000, cr=1, margin=0.9, jitter=0.2, window_s=3600):
+        self.frequency = frequency
+        self.sf = sf
+        self.bw = bw
+        self.cr = cr
+        self.jitter = jitter
+        self.band = None
+        for low, high, duty in SUB_BANDS:
+            if low <= frequency < high:
+                self.band = SubBand(duty / 1000, margin, window_s)
+        if self.band is None:
+            raise ValueError('%d Hz is not in an EU868 sub-band' % frequency)
+
+    def time_on_air_us(self, size):
+        return time_on_air_us(size, self.sf, self.bw, self.cr)
+
+    def sent(self, size):
+        # call once a frame of size bytes went out
+        self.band.consume(self.time_on_air_us(size))
+
+    def next_us(self, size):
+        # how long to wait before the next frame of size bytes
+        toa = self.time_on_air_us(size)
+        interval = toa / self.band.rate
+        # uniform in +-jitter / 2 of the interval, machine.rng() is 24 bits
+        spread = (machine.rng() / 0xFFFFFF - 0.5) * self.jitter
+        return max(int(interval * (1 + spread)) - toa, self.band.wait_us(toa))
+
+    def report(self):
+        band = self.band
+        return 'sent %d, airtime %d ms, %.0f%% of the %.1f%% duty cycle' % (
+            band.sent, band.airtime_us // 1000, 100 * band.utilisation(), 100 * band.duty)
@@ -0,0 +1,138 @@
+""" LoPy Nano Gateway acknowledgement tracking """
+
+from array import array
+import time
+
+# upper bounds of the round trip latency histogram bins, in ms
+LATENCY_BINS = (10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+class AckTracker:
+    """ In-flight table of sent packets waiting for their ack, keyed on
+    the token. Unacked packets are sent again with an exponential backoff
+    until retries is exhausted. The packets are copied into preallocated
+    slots of size bytes, adding one does not allocate. """
+
+    def __init__(self, slots=8, timeout_ms=1000, retries=2, size=2048):
+        self.slots = slots
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+
+        self.tokens = array('H', [0] * slots)
+        self.first_ms = array('L', [0] * slots)
+        self.due_ms = array('L', [0] * slots)
+        self.tries = array('B', [0] * slots)
+        # a copy of the packet, of length 0 when the slot is free
+        self.buffers = [bytearray(size) for i in range(slots)]
+        self.views = [memoryview(b) for b in self.buffers]
+        self.lengths = array('H', [0] * slots)
+
+        self.sent = 0
+        self.acked = 0
+        self.lost = 0
+        self.retransmits = 0
+        self.latency = array('L', [0] * (len(LATENCY_BINS) + 1))
+
+        # counters since the last stat packet, for ackr
+        self.interval_acked = 0
+        self.interval_lost = 0
+
+    def _free_slot(self):
+        # (slot, None) or, when the table is full, the slot of the oldest
+        # packet given up and a copy of it
+        oldest = 0
+        for i in range(self.slots):
+            if not self.lengths[i]:
+                return i, None
+            if time.ticks_diff(self.first_ms[oldest], self.first_ms[i]) > 0:
+                oldest = i
+        evicted = bytes(self.packet(oldest))
+        self._lose(oldest)
+        return oldest, evicted
+
+    def _lose(self, i):
+        self.lengths[i] = 0
+        self.lost += 1
+        self.interval_lost += 1
+
+    def packet(self, i):
+        return self.views[i][:self.lengths[i]]
+
+    def add(self, token, packet, now_ms):
+        # returns the packet given up to make room, None if there was
+        i, evicted = self._free_slot()
+        self.tokens[i] = token
+        self.first_ms[i] = now_ms
+        self.due_ms[i] = time.ticks_add(now_ms, self.timeout_ms)
+        self.tries[i] = 0
+        n = len(packet)
+        self.views[i][:n] = packet
+        self.lengths[i] = n
+        self.sent += 1
+        return evicted
+
+    def ack(self, token, now_ms):
+        # returns the round trip latency in ms, -1 for an unknown token
+        for i in range(self.slots):
+            if self.lengths[i] and self.tokens[i] == token:
+                self.lengths[i] = 0
+                self.acked += 1
+                self.interval_acked += 1
+                rtt = time.ticks_diff(now_ms, self.first_ms[i])
+                b = 0
+                while b < len(LATENCY_BINS) and rtt > LATENCY_BINS[b]:
+                    b += 1
+                self.latency[b] += 1
+                return rtt
+        return -1
+
+    def next_due(self, now_ms):
+        # ms until the next retransmission or expiry, -1 if nothing is in flight
+        due = -1
+        for i in range(self.slots):
+            if self.lengths[i]:
+                d = max(time.ticks_diff(self.due_ms[i], now_ms), 0)
+                if due < 0 or d < due:
+                    due = d
+        return due
+
+    def expired(self, now_ms, lost=None):
+        # yields the packets to send again, views valid until the next add,
+        # forgets the ones out of retries after appending a copy to lost
+        # when given
+        for i in range(self.slots):
+            if not self.lengths[i] or time.ticks_diff(now_ms, self.due_ms[i]) < 0:
+                continue
+            if self.tries[i] >= self.retries:
+                if lost is not None:
+                    lost.append(bytes(self.packet(i)))
+                self._lose(i)
+                continue
+            self.tries[i] += 1
+            self.due_ms[i] = time.ticks_add(now_ms, self.timeout_ms << self.tries[i])
+            self.retransmits += 1
+            yield self.packet(i)
+
+    def drop_expired(self, now_ms):
+        # forgets the packets past their due time without sending them
+        # again, for the ones the next periodic packet replaces. Returns
+        # how many were dropped
+        n = 0
+        for i in range(self.slots):
+            if self.lengths[i] and time.ticks_diff(now_ms, self.due_ms[i]) >= 0:
+                self._lose(i)
+                n += 1
+        return n
+
+    def ack_ratio(self, reset=False):
+        # percentage of packets acked among the ones resolved in the interval
+        done = self.interval_acked + self.interval_lost
+        ratio = 100.0 * self.interval_acked / done if done else 100.0
+        if reset:
+            self.interval_acked = 0
+            self.interval_lost = 0
+        return ratio
+
+    def histogram(self):
+        bins = ['<=%d' % b for b in LATENCY_BINS] + ['>%d' % LATENCY_BINS[-1]]
+        return dict(zip(bins, self.latency))
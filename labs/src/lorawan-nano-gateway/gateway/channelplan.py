@@ -0,0 +1,55 @@
+""" LoPy Nano Gateway receive channel plan """
+
+from array import array
+import time
+
+
+class ChannelPlan:
+    """ (frequency, sf) pairs the single radio hops between, staying
+    dwell_ms on each, with per channel RX counters """
+
+    def __init__(self, channels, dwell_ms):
+        self.channels = channels
+        self.dwell_ms = dwell_ms
+        self.index = 0
+        self.hops = 0
+        self.since_ms = time.ticks_ms()
+
+        # frames received and ms spent listening, per channel
+        self.rx = array('L', [0] * len(channels))
+        self.dwell = array('L', [0] * len(channels))
+
+    def __len__(self):
+        return len(self.channels)
+
+    def current(self):
+        return self.channels[self.index]
+
+    def frequency(self, i):
+        return self.channels[i][0]
+
+    def sf(self, i):
+        return self.channels[i][1]
+
+    def count(self, i):
+        self.rx[i] += 1
+
+    def _account(self, now_ms):
+        self.dwell[self.index] += time.ticks_diff(now_ms, self.since_ms)
+        self.since_ms = now_ms
+
+    def hop(self, now_ms):
+        self._account(now_ms)
+        self.index = (self.index + 1) % len(self.channels)
+        self.hops += 1
+        return self.channels[self.index]
+
+    def summary(self):
+        self._account(time.ticks_ms())
+        summary = []
+        for i in range(len(self.channels)):
+            dwell_s = self.dwell[i] / 1000
+            summary.append({"freq": self.channels[i][0], "sf": self.channels[i][1],
+                            "rx": self.rx[i], "dwell_s": dwell_s,
+                            "rx_per_min": 60 * self.rx[i] / dwell_s if dwell_s else 0.0})
+        return summary
@@ -18,3 +18,21 @@ WIFI_PASS = '55FE992DEC17963FCFAF2A461ED53E'
 
 LORA_FREQUENCY = 868100000
 LORA_DR = "SF7BW125" # DR_5
+
+# Multi-channel / multi-SF receive: (frequency, datarate) pairs the radio hops
+# between, listening LORA_DWELL_MS on each. Leave it empty to stay on
+# LORA_FREQUENCY and LORA_DR, e.g.
+# LORA_CHANNELS = [(868100000, "SF7BW125"), (868100000, "SF9BW125"), (868300000, "SF7BW125")]
+LORA_CHANNELS = []
+LORA_DWELL_MS = 5000
+
+# Up to BATCH_SIZE received frames are pushed in one PUSH_DATA, waiting
+# at most BATCH_WINDOW_MS for the batch to fill (1 and 0 to push each frame)
+BATCH_SIZE = 1
+BATCH_WINDOW_MS = 0
+
+# Frames received while the WiFi or the server is down are spooled here and
+# replayed once it is back, at most SPOOL_MAX_RECORDS of them (280 bytes
+# each). A path under /sd puts the spool on the SD card.
+SPOOL_PATH = '/flash/spool'
+SPOOL_MAX_RECORDS = 256
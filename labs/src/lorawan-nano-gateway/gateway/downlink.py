@@ -0,0 +1,89 @@
+""" LoPy Nano Gateway downlink queue """
+
+TMST_MASK = 0xFFFFFFFF
+TMST_HALF = 0x80000000
+
+# Semtech packet forwarder guard time between two downlinks
+TX_GUARD_US = const(1500)
+
+
+def tmst_diff(a, b):
+    # signed difference a - b between two 32 bit counter values
+    d = (a - b) & TMST_MASK
+    if d >= TMST_HALF:
+        d -= TMST_MASK + 1
+    return d
+
+
+def tmst_add(a, delta):
+    return (a + delta) & TMST_MASK
+
+
+def airtime_us(sf, size, bw=125000, cr=1, preamble=8, header=True, crc=False):
+    # LoRa time on air (Semtech AN1200.13), downlinks have no payload CRC
+    t_sym = (1 << sf) * 1000000 // bw
+    de = 1 if t_sym >= 16000 else 0
+    ih = 0 if header else 1
+    num = 8 * size - 4 * sf + 28 + (16 if crc else 0) - 20 * ih
+    den = 4 * (sf - 2 * de)
+    n_payload = 8 + max(((num + den - 1) // den) * (cr + 4), 0)
+    return (preamble * 4 + 17) * t_sym // 4 + n_payload * t_sym
+
+
+class DownlinkQueue:
+    """ Binary heap of downlinks ordered on their (wrapping) tmst """
+
+    def __init__(self, size=8):
+        self.size = size
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def peek(self):
+        return self.heap[0] if self.heap else None
+
+    def collides(self, tmst, airtime):
+        end = tmst_add(tmst, airtime + TX_GUARD_US)
+        for pk in self.heap:
+            pk_end = tmst_add(pk[0], pk[1] + TX_GUARD_US)
+            if tmst_diff(tmst, pk_end) < 0 and tmst_diff(pk[0], end) < 0:
+                return True
+        return False
+
+    def push(self, pk):
+        # pk is a list starting with [tmst, airtime, ...]
+        if len(self.heap) >= self.size:
+            return False
+        heap = self.heap
+        heap.append(pk)
+        i = len(heap) - 1
+        while i > 0:
+            parent = (i - 1) >> 1
+            if tmst_diff(heap[i][0], heap[parent][0]) >= 0:
+                break
+            heap[i], heap[parent] = heap[parent], heap[i]
+            i = parent
+        return True
+
+    def pop(self):
+        heap = self.heap
+        if not heap:
+            return None
+        top = heap[0]
+        last = heap.pop()
+        if heap:
+            heap[0] = last
+            i = 0
+            n = len(heap)
+            while True:
+                child = 2 * i + 1
+                if child >= n:
+                    break
+                if child + 1 < n and tmst_diff(heap[child + 1][0], heap[child][0]) < 0:
+                    child += 1
+                if tmst_diff(heap[child][0], heap[i][0]) >= 0:
+                    break
+                heap[i], heap[child] = heap[child], heap[i]
+                i = child
+        return top
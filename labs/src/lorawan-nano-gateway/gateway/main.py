@@ -1,12 +1,23 @@
 """ LoPy LoRaWAN Nano Gateway example usage """
 
 import config
+import os
+from machine import SD
 from nanogateway import NanoGateway
 
+if config.SPOOL_PATH.startswith('/sd'):
+    # mount SD if not mounted already
+    try:
+        os.mount(SD(), '/sd')
+    except OSError:
+        print("SD card already mounted.")
 
 nanogw = NanoGateway(id=config.GATEWAY_ID, frequency=config.LORA_FREQUENCY,
                      datarate=config.LORA_DR, ssid=config.WIFI_SSID,
                      password=config.WIFI_PASS, server=config.SERVER,
-                     port=config.PORT, ntp=config.NTP, ntp_period=config.NTP_PERIOD_S)
+                     port=config.PORT, ntp=config.NTP, ntp_period=config.NTP_PERIOD_S,
+                     batch_size=config.BATCH_SIZE, batch_window_ms=config.BATCH_WINDOW_MS,
+                     channels=config.LORA_CHANNELS, dwell_ms=config.LORA_DWELL_MS,
+                     spool_path=config.SPOOL_PATH, spool_max_records=config.SPOOL_MAX_RECORDS)
 
 nanogw.start()
@@ -3,14 +3,23 @@
 from network import WLAN
 from network import LoRa
 from machine import Timer
-import os
 import binascii
 import machine
 import json
 import time
 import errno
 import _thread
+import select
 import socket
+from downlink import DownlinkQueue
+from downlink import airtime_us
+from downlink import tmst_add
+from downlink import tmst_diff
+from semtech import PushDataEncoder
+from rxring import RxRing
+from acks import AckTracker
+from channelplan import ChannelPlan
+from spool import Spool
 
 
 PROTOCOL_VERSION = const(2)
@@ -20,6 +29,10 @@ PUSH_ACK = const(1)
 PULL_DATA = const(2)
 PULL_ACK = const(4)
 PULL_RESP = const(3)
+TX_ACK = const(5)
+
+# header and gateway EUI
+PULL_DATA_LEN = const(12)
 
 TX_ERR_NONE = "NONE"
 TX_ERR_TOO_LATE = "TOO_LATE"
@@ -30,99 +43,171 @@ TX_ERR_TX_FREQ = "TX_FREQ"
 TX_ERR_TX_POWER = "TX_POWER"
 TX_ERR_GPS_UNLOCKED = "GPS_UNLOCKED"
 
+DOWNLINK_SETUP_US = const(5000)         # radio re-init ahead of the TX time
+DOWNLINK_TX_ADVANCE_US = const(10)
+DOWNLINK_MIN_ALARM_US = const(200)
+DOWNLINK_MAX_AHEAD_US = const(20000000)
+DOWNLINK_QUEUE_SIZE = const(8)
+
+RX_RING_SLOTS = const(16)
+# step of the wait for a batch to fill
+BATCH_POLL_MS = const(5)
+
+PUSH_ACK_TIMEOUT_MS = const(1000)
+PUSH_RETRIES = const(2)
+PULL_ACK_TIMEOUT_MS = const(5000)
+
+STAT_PERIOD_MS = const(60000)
+PULL_PERIOD_MS = const(25000)
+# longest sleep of the UDP loop, bounds the delay of a retransmission
+UDP_POLL_MAX_MS = const(1000)
+
+WIFI_CHECK_MS = const(5000)
+# while offline: association checks, and connect retries backing off
+# from WIFI_RETRY_MIN_MS to WIFI_RETRY_MAX_MS
+WIFI_POLL_MS = const(500)
+WIFI_RETRY_MIN_MS = const(2000)
+WIFI_RETRY_MAX_MS = const(30000)
+# PULL_DATA period while the server does not ack, to see it come back
+SERVER_PROBE_MS = const(2000)
+
+# spooled frames sent per PUSH_DATA and time between two of them, so the
+# replay does not starve the live traffic
+REPLAY_BATCH = const(3)
+REPLAY_INTERVAL_MS = const(1000)
+
 STAT_PK = {"stat": {"time": "", "lati": 0,
                     "long": 0, "alti": 0,
                     "rxnb": 0, "rxok": 0,
                     "rxfw": 0, "ackr": 100.0,
                     "dwnb": 0, "txnb": 0}}
 
-RX_PK = {"rxpk": [{"time": "", "tmst": 0,
-                   "chan": 0, "rfch": 0,
-                   "freq": 868.1, "stat": 1,
-                   "modu": "LORA", "datr": "SF7BW125",
-                   "codr": "4/5", "rssi": 0,
-                   "lsnr": 0, "size": 0,
-                   "data": ""}]}
-
 TX_ACK_PK = {"txpk_ack":{"error":""}}
 
 
 class NanoGateway:
 
-    def __init__(self, id, frequency, datarate, ssid, password, server, port, ntp='pool.ntp.org', ntp_period=3600):
+    def __init__(self, id, frequency, datarate, ssid, password, server, port, ntp='pool.ntp.org', ntp_period=3600,
+                 batch_size=1, batch_window_ms=0, channels=None, dwell_ms=5000,
+                 spool_path='/flash/spool', spool_max_records=256):
         self.id = id
+        self.eui = binascii.unhexlify(id)
         self.frequency = frequency
         self.datarate = datarate
         self.sf = self._dr_to_sf(datarate)
+        # (frequency, datarate) pairs to hop between, the default is to stay
+        # on frequency and datarate
+        if not channels:
+            channels = [(frequency, datarate)]
+        self.plan = ChannelPlan([(f, self._dr_to_sf(dr)) for f, dr in channels], dwell_ms)
+        self.hop_alarm = None
         self.ssid = ssid
         self.password = password
         self.server = server
         self.port = port
         self.ntp = ntp
         self.ntp_period = ntp_period
+        self.batch_size = batch_size
+        self.batch_window_ms = batch_window_ms
 
-        self.rxnb = 0
-        self.rxok = 0
+        # rxnb and rxok are counted by the RX ring
         self.rxfw = 0
         self.dwnb = 0
         self.txnb = 0
 
-        self.stat_alarm = None
-        self.pull_alarm = None
-        self.uplink_alarm = None
+        # batching counters
+        self.batches = 0
+        self.batched = 0
+        self.batch_max = 0
+
+        self.downlink_alarm = None
+
+        # received frames are captured here by _lora_cb and pushed by _rx_thread
+        self.rx_ring = RxRing(RX_RING_SLOTS)
+        self.stat_due = False
+
+        self.downlinks = DownlinkQueue(DOWNLINK_QUEUE_SIZE)
+        self.dl_tuned = None
+        self.lora_tx_busy = False
+        # time from PULL_RESP reception to downlink scheduled, last and max
+        self.resp_us = 0
+        self.resp_max_us = 0
+
+        # PUSH_DATA packets are built in this buffer, under udp_lock
+        self.encoder = PushDataEncoder(id)
+
+        # packets waiting for their PUSH_ACK / PULL_ACK, under udp_lock
+        self.push_acks = AckTracker(8, PUSH_ACK_TIMEOUT_MS, PUSH_RETRIES, len(self.encoder.buf))
+        self.pull_acks = AckTracker(2, PULL_ACK_TIMEOUT_MS, 0, PULL_DATA_LEN)
+        self.pull_token = 0
+
+        # frames that could not be forwarded wait here until the WiFi and
+        # the server are back, under spool_lock and never under udp_lock
+        # as writing to the flash is slow
+        self.spool = Spool(spool_path, spool_max_records)
+        # packets given up by _send_push, spooled once udp_lock is released
+        self.evicted = []
+        self.wifi_ok = False
+        self.wifi_retry_ms = 0
+        self.wifi_backoff_ms = WIFI_RETRY_MIN_MS
+        self.wifi_reconnects = 0
+        self.server_ok = True
+        # resolved at the first connection
+        self.server_ip = None
 
         self.udp_lock = _thread.allocate_lock()
+        self.spool_lock = _thread.allocate_lock()
+        self.dl_lock = _thread.allocate_lock()
+        # released to wake up _rx_thread
+        self.rx_event = _thread.allocate_lock()
+        self.rx_event.acquire()
 
         self.lora = None
         self.lora_sock = None
 
+        self.end = False
+
     def start(self):
-        # Change WiFi to STA mode and connect
+        # Change WiFi to STA mode, the UDP loop connects in the background
+        # so the frames are received and spooled until it is up
         self.wlan = WLAN(mode=WLAN.STA)
-        self._connect_to_wifi()
-
-        # Get a time Sync
         self.rtc = machine.RTC()
-        self.rtc.ntp_sync(self.ntp, update_period=self.ntp_period)
 
-        # Get the server IP and create an UDP socket
-        self.server_ip = socket.getaddrinfo(self.server, self.port)[0][-1]
+        # Create an UDP socket, the server IP is resolved once connected
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.setblocking(False)
 
-        # Push the first time immediatelly
-        self._push_data(self._make_stat_packet())
-
-        # Create the alarms
-        self.stat_alarm = Timer.Alarm(handler=lambda t: self._push_data(self._make_stat_packet()), s=60, periodic=True)
-        self.pull_alarm = Timer.Alarm(handler=lambda u: self._pull_data(), s=25, periodic=True)
-
-        # Start the UDP receive thread
+        # Start the UDP event loop, which also connects the WiFi, sends the
+        # keepalives and the stat packets, and the uplink forwarding thread
         _thread.start_new_thread(self._udp_thread, ())
+        _thread.start_new_thread(self._rx_thread, ())
 
-        # Initialize LoRa in LORA mode
-        self.lora = LoRa(mode=LoRa.LORA, frequency=self.frequency, bandwidth=LoRa.BW_125KHZ, sf=self.sf,
+        # Initialize LoRa in LORA mode on the first channel of the plan
+        freq, sf = self.plan.current()
+        self.lora = LoRa(mode=LoRa.LORA, frequency=freq, bandwidth=LoRa.BW_125KHZ, sf=sf,
                          preamble=8, coding_rate=LoRa.CODING_4_5, tx_iq=True)
         # Create a raw LoRa socket
         self.lora_sock = socket.socket(socket.AF_LORA, socket.SOCK_RAW)
         self.lora_sock.setblocking(False)
-        self.lora_tx_done = False
 
         self.lora.callback(trigger=(LoRa.RX_PACKET_EVENT | LoRa.TX_PACKET_EVENT), handler=self._lora_cb)
 
+        if len(self.plan) > 1:
+            self.hop_alarm = Timer.Alarm(handler=lambda h: self._hop(), ms=self.plan.dwell_ms, periodic=True)
+
     def stop(self):
         # TODO: Check how to stop the NTP sync
-        # TODO: Create a cancel method for the alarm
-        # TODO: kill the UDP thread
+        self.end = True
+        self._wake_rx_thread()
+        if self.hop_alarm is not None:
+            self.hop_alarm.cancel()
+        with self.dl_lock:
+            if self.downlink_alarm is not None:
+                self.downlink_alarm.cancel()
+            self.downlinks = DownlinkQueue(DOWNLINK_QUEUE_SIZE)
         self.sock.close()
 
-    def _connect_to_wifi(self):
-        self.wlan.connect(self.ssid, auth=(None, self.password))
-        while not self.wlan.isconnected():
-            time.sleep(0.5)
-        print("WiFi connected!")
-
     def _dr_to_sf(self, dr):
         sf = dr[2:4]
         if sf[1] not in '0123456789':
@@ -130,50 +215,267 @@ class NanoGateway:
         return int(sf)
 
     def _sf_to_dr(self, sf):
-        return self.datarate
+        return "SF%dBW125" % sf
 
-    def _make_stat_packet(self):
+    def _make_stat_packet(self, inner=False):
         now = self.rtc.now()
         STAT_PK["stat"]["time"] = "%d-%02d-%02d %02d:%02d:%02d GMT" % (now[0], now[1], now[2], now[3], now[4], now[5])
-        STAT_PK["stat"]["rxnb"] = self.rxnb
-        STAT_PK["stat"]["rxok"] = self.rxok
+        STAT_PK["stat"]["rxnb"] = self.rx_ring.received
+        STAT_PK["stat"]["rxok"] = self.rx_ring.received - self.rx_ring.overruns
         STAT_PK["stat"]["rxfw"] = self.rxfw
         STAT_PK["stat"]["dwnb"] = self.dwnb
         STAT_PK["stat"]["txnb"] = self.txnb
+        STAT_PK["stat"]["ackr"] = round(self.push_acks.ack_ratio(reset=True), 1)
+        # the ack latency has no Semtech stat field, servers may reject
+        # unknown keys: it goes to the log here and to metrics()
+        print("Push ack latency ms", self.push_acks.histogram())
+        if inner:
+            # only the stat object, to ride along with an rxpk array
+            return json.dumps(STAT_PK["stat"])
         return json.dumps(STAT_PK)
 
-    def _make_node_packet(self, rx_data, rx_time, tmst, sf, rssi, snr):
-        RX_PK["rxpk"][0]["time"] = "%d-%02d-%02dT%02d:%02d:%02d.%dZ" % (rx_time[0], rx_time[1], rx_time[2], rx_time[3], rx_time[4], rx_time[5], rx_time[6])
-        RX_PK["rxpk"][0]["tmst"] = tmst
-        RX_PK["rxpk"][0]["datr"] = self._sf_to_dr(sf)
-        RX_PK["rxpk"][0]["rssi"] = rssi
-        RX_PK["rxpk"][0]["lsnr"] = float(snr)
-        RX_PK["rxpk"][0]["data"] = binascii.b2a_base64(rx_data)[:-1]
-        RX_PK["rxpk"][0]["size"] = len(rx_data)
-        return json.dumps(RX_PK)
-
-    def _push_data(self, data):
-        token = os.urandom(2)
-        packet = bytes([PROTOCOL_VERSION]) + token + bytes([PUSH_DATA]) + binascii.unhexlify(self.id) + data
+    def metrics(self):
+        return {"rxnb": self.rx_ring.received, "rxok": self.rx_ring.received - self.rx_ring.overruns,
+                "rxfw": self.rxfw, "dwnb": self.dwnb, "txnb": self.txnb,
+                "rx_queued": self.rx_ring.count(), "rx_overruns": self.rx_ring.overruns,
+                "batches": self.batches, "batch_max": self.batch_max,
+                "batch_avg": self.batched / self.batches if self.batches else 0.0,
+                "ackr": self.push_acks.ack_ratio(),
+                "push_sent": self.push_acks.sent, "push_acked": self.push_acks.acked,
+                "push_lost": self.push_acks.lost, "push_retransmits": self.push_acks.retransmits,
+                "push_latency_ms": self.push_acks.histogram(),
+                "pull_sent": self.pull_acks.sent, "pull_acked": self.pull_acks.acked,
+                "pull_latency_ms": self.pull_acks.histogram(),
+                "pull_resp_us": self.resp_us, "pull_resp_max_us": self.resp_max_us,
+                "hops": self.plan.hops, "channels": self.plan.summary(),
+                "wifi_ok": self.wifi_ok, "wifi_reconnects": self.wifi_reconnects, "server_ok": self.server_ok,
+                "spool_pending": self.spool.pending(), "spooled": self.spool.spooled,
+                "replayed": self.spool.replayed, "spool_dropped": self.spool.dropped,
+                "spool_corrupted": self.spool.corrupted}
+
+    def _wake_rx_thread(self):
+        # called from the LoRa callback and the UDP loop, which may both
+        # find the lock held: the second release raises and is ignored
+        try:
+            self.rx_event.release()
+        except RuntimeError:
+            pass
+
+    def _stat_due(self):
+        # called by the UDP loop, the stat packet is sent by _rx_thread
+        # along with the queued frames
+        self.stat_due = True
+        self._wake_rx_thread()
+
+    def _rx_thread(self):
+        while True:
+            self.rx_event.acquire()
+            if self.end:
+                _thread.exit()
+            if self.batch_window_ms:
+                # give the batch a chance to fill, each new frame wakes us up
+                start = time.ticks_ms()
+                while not self.stat_due and self.rx_ring.count() < self.batch_size:
+                    left = self.batch_window_ms - time.ticks_diff(time.ticks_ms(), start)
+                    if left <= 0:
+                        break
+                    # the _thread locks of MicroPython have no timeout,
+                    # the ring is checked again every BATCH_POLL_MS
+                    time.sleep_ms(min(left, BATCH_POLL_MS))
+            self._flush_rx()
+
+    def _online(self):
+        # wifi_ok is only set once the server IP is known
+        return self.wifi_ok and self.server_ok
+
+    def _flush_rx(self):
+        # send every captured frame, as many rxpk per PUSH_DATA as fit,
+        # the stat object rides along with the first one when due. Frames
+        # are spooled instead while offline or when the send fails, after
+        # udp_lock is released: this thread is the only reader of the ring.
+        stat = self.stat_due
+        self.stat_due = False
+        ring = self.rx_ring
+        while True:
+            spool = 0
+            with self.udp_lock:
+                if not ring.count():
+                    if stat and self._online():
+                        self._send_push(self.encoder.push_data(self._make_stat_packet()), 0)
+                    break
+                rx_time = self.rtc.now()
+                if not self._online():
+                    spool = ring.count()
+                else:
+                    self.encoder.begin()
+                    n = 0
+                    i = ring.peek()
+                    while i >= 0:
+                        chan = ring.chan[i]
+                        self.encoder.add(ring.data(i), rx_time, ring.tmst[i], ring.sf[i], self.plan.frequency(chan),
+                                         chan, ring.rssi[i], ring.snr[i])
+                        n += 1
+                        if not self.encoder.fits(ring.size):
+                            break
+                        i = ring.peek(n)
+                    if stat:
+                        packet = self.encoder.finish(self._make_stat_packet(inner=True))
+                        stat = False
+                    else:
+                        packet = self.encoder.finish()
+                    if self._send_push(packet, n):
+                        ring.release(n)
+                    else:
+                        spool = n
+            if spool:
+                self._spool_ring(spool, rx_time)
+        self._spool_evicted()
+
+    def _spool_ring(self, n, rx_time):
+        # moves the n oldest frames of the ring to the spool
+        ring = self.rx_ring
+        secs = time.mktime((rx_time[0], rx_time[1], rx_time[2], rx_time[3], rx_time[4], rx_time[5], 0, 0))
+        with self.spool_lock:
+            for k in range(n):
+                i = ring.peek(k)
+                self.spool.append(ring.data(i), ring.rssi[i], ring.snr[i], ring.sf[i], ring.chan[i], ring.tmst[i],
+                                  secs, rx_time[6])
+        ring.release(n)
+
+    def _spool_evicted(self):
+        # spools the packets _send_push gave up, without udp_lock held
+        while self.evicted:
+            with self.udp_lock:
+                packet = self.evicted.pop(0) if self.evicted else None
+            if packet is not None:
+                self._spool_packet(packet)
+
+    def _spool_packet(self, packet):
+        # a PUSH_DATA out of retries, its frames go back to the spool
+        try:
+            rxpk = json.loads(packet[12:])
+        except Exception:
+            print("Spool decode exception")
+            return
+        with self.spool_lock:
+            for pk in rxpk.get("rxpk", []):
+                t = pk["time"]
+                secs = time.mktime((int(t[0:4]), int(t[5:7]), int(t[8:10]), int(t[11:13]), int(t[14:16]),
+                                    int(t[17:19]), 0, 0))
+                self.spool.append(binascii.a2b_base64(pk["data"]), pk["rssi"], pk["lsnr"],
+                                  self._dr_to_sf(pk["datr"]), pk["chan"], pk["tmst"], secs, int(t[20:26]))
+
+    def _replay(self):
+        # only the UDP loop replays, the records read stay in the spool
+        # until commit, flash I/O under spool_lock and the send under udp_lock
+        with self.spool_lock:
+            frames = self.spool.read(REPLAY_BATCH)
+            if not frames:
+                # only corrupted records were left
+                self.spool.commit()
+                return
+        with self.udp_lock:
+            self.encoder.begin()
+            for data, rssi, snr, sf, chan, tmst, secs, usecs in frames:
+                if chan >= len(self.plan):
+                    # spooled under another channel plan
+                    chan = 0
+                t = time.gmtime(secs)
+                self.encoder.add(data, (t[0], t[1], t[2], t[3], t[4], t[5], usecs), tmst, sf,
+                                 self.plan.frequency(chan), chan, rssi, snr)
+            sent = self._send_push(self.encoder.finish(), len(frames))
+        if sent:
+            with self.spool_lock:
+                self.spool.commit()
+        self._spool_evicted()
+
+    def _send_push(self, packet, n):
+        # must be called with udp_lock held
+        try:
+            self.sock.sendto(packet, self.server_ip)
+        except Exception:
+            print("PUSH exception")
+            self.server_ok = False
+            return False
+        # keep a copy for a possible retransmission, the frames of a packet
+        # pushed out of a full table are spooled by _spool_evicted
+        evicted = self.push_acks.add(self.encoder.token, packet, time.ticks_ms())
+        if evicted is not None:
+            self.evicted.append(evicted)
+        if n:
+            self.rxfw += n
+            self.batches += 1
+            self.batched += n
+            if n > self.batch_max:
+                self.batch_max = n
+        return True
+
+    def _pull_data(self):
+        self.pull_token = (self.pull_token + 1) & 0xFFFF
+        packet = bytes([PROTOCOL_VERSION, self.pull_token >> 8, self.pull_token & 0xFF, PULL_DATA]) + self.eui
         with self.udp_lock:
             try:
                 self.sock.sendto(packet, self.server_ip)
             except Exception:
-                print("PUSH exception")
+                print("PULL exception")
+                return
+            self.pull_acks.add(self.pull_token, packet, time.ticks_ms())
 
-    def _pull_data(self):
-        token = os.urandom(2)
-        packet = bytes([PROTOCOL_VERSION]) + token + bytes([PULL_DATA]) + binascii.unhexlify(self.id)
+    def _retransmit(self):
+        now = time.ticks_ms()
+        lost = []
         with self.udp_lock:
+            for packet in self.push_acks.expired(now, lost):
+                try:
+                    self.sock.sendto(packet, self.server_ip)
+                except Exception:
+                    print("PUSH retransmit exception")
+            # PULL_DATA is not sent again, the next keepalive does it
+            self.pull_acks.drop_expired(now)
+        if lost:
+            # the server stopped answering, spool until it acks again
+            self.server_ok = False
+            for packet in lost:
+                self._spool_packet(packet)
+
+    def _check_wifi(self, now):
+        # connects in the background, without blocking the UDP loop.
+        # Returns True when the link just came up
+        if self.wlan.isconnected():
+            if self.wifi_ok:
+                return False
+            if self.server_ip is None:
+                # first connection: time sync and server address
+                try:
+                    self.server_ip = socket.getaddrinfo(self.server, self.port)[0][-1]
+                except Exception:
+                    print("Server address exception")
+                    return False
+                self.rtc.ntp_sync(self.ntp, update_period=self.ntp_period)
+                print("WiFi connected!")
+            else:
+                print("WiFi reconnected!")
+                self.wifi_reconnects += 1
+            self.wifi_ok = True
+            self.wifi_backoff_ms = WIFI_RETRY_MIN_MS
+            return True
+        if self.wifi_ok:
+            print("WiFi lost")
+            self.wifi_ok = False
+            self.wifi_retry_ms = now
+        if time.ticks_diff(now, self.wifi_retry_ms) >= 0:
             try:
-                self.sock.sendto(packet, self.server_ip)
+                self.wlan.connect(self.ssid, auth=(None, self.password))
             except Exception:
-                print("PULL exception")
+                print("WiFi connect exception")
+            self.wifi_retry_ms = time.ticks_add(now, self.wifi_backoff_ms)
+            self.wifi_backoff_ms = min(self.wifi_backoff_ms * 2, WIFI_RETRY_MAX_MS)
+        return False
 
     def _ack_pull_rsp(self, token, error):
         TX_ACK_PK["txpk_ack"]["error"] = error
         resp = json.dumps(TX_ACK_PK)
-        packet = bytes([PROTOCOL_VERSION]) + token + bytes([PULL_ACK]) + binascii.unhexlify(self.id) + resp
+        packet = bytes([PROTOCOL_VERSION]) + token + bytes([TX_ACK]) + self.eui + resp
         with self.udp_lock:
             try:
                 self.sock.sendto(packet, self.server_ip)
@@ -183,62 +485,187 @@ class NanoGateway:
     def _lora_cb(self, lora):
         events = lora.events()
         if events & LoRa.RX_PACKET_EVENT:
-            self.rxnb += 1
-            self.rxok += 1
+            # only capture the frame here, _rx_thread does the network I/O
             rx_data = self.lora_sock.recv(256)
             stats = lora.stats()
-            #self._push_data(self._make_node_packet(rx_data, self.rtc.now(), stats.rx_timestamp, stats.sfrx, stats.rssi, stats.snr))
+            # the radio only demodulates the SF of the channel it listens to
+            chan = self.plan.index
+            self.plan.count(chan)
+            #self.rx_ring.put(rx_data, stats.rssi, stats.snr, self.plan.sf(chan), stats.rx_timestamp, chan)
             # Fix the "not joined yet" issue: https://forum.pycom.io/topic/1330/lopy-lorawan-gateway-with-an-st-lorawan-device/2
-            self._push_data(self._make_node_packet(rx_data, self.rtc.now(), time.ticks_us(), stats.sfrx, stats.rssi, stats.snr))
-            self.rxfw += 1
+            if self.rx_ring.put(rx_data, stats.rssi, stats.snr, self.plan.sf(chan), time.ticks_us(), chan):
+                self._wake_rx_thread()
         if events & LoRa.TX_PACKET_EVENT:
             self.txnb += 1
-            lora.init(mode=LoRa.LORA, frequency=self.frequency, bandwidth=LoRa.BW_125KHZ,
-                      sf=self.sf, preamble=8, coding_rate=LoRa.CODING_4_5, tx_iq=True)
-
-    def _send_down_link(self, data, tmst, datarate, frequency):
-        self.lora.init(mode=LoRa.LORA, frequency=frequency, bandwidth=LoRa.BW_125KHZ,
-                       sf=self._dr_to_sf(datarate), preamble=8, coding_rate=LoRa.CODING_4_5,
-                       tx_iq=True)
-        while time.ticks_us() < tmst:
-            pass
-        self.lora_sock.send(data)
+            with self.dl_lock:
+                self._init_rx()
+                self.lora_tx_busy = False
+                self._arm_down_link()
+
+    def _init_rx(self):
+        # back to listening on the current channel of the plan
+        freq, sf = self.plan.current()
+        self.lora.init(mode=LoRa.LORA, frequency=freq, bandwidth=LoRa.BW_125KHZ,
+                       sf=sf, preamble=8, coding_rate=LoRa.CODING_4_5, tx_iq=True)
+
+    def _hop(self):
+        with self.dl_lock:
+            # the radio belongs to the downlink until its TX is done
+            if self.lora_tx_busy or self.dl_tuned is not None:
+                return
+            self.plan.hop(time.ticks_ms())
+            self._init_rx()
+
+    def _schedule_down_link(self, txpk):
+        data = binascii.a2b_base64(txpk["data"])
+        now = time.ticks_us()
+        if txpk.get("imme", False):
+            # send now, as soon as the radio is set up
+            tmst = tmst_add(now, DOWNLINK_SETUP_US)
+        elif "tmst" in txpk:
+            tmst = txpk["tmst"]
+        else:
+            # scheduled on GPS "time", the gateway has no GPS
+            return TX_ERR_GPS_UNLOCKED
+        t_us = tmst_diff(tmst, now)
+        if t_us < DOWNLINK_SETUP_US:
+            return TX_ERR_TOO_LATE
+        if t_us > DOWNLINK_MAX_AHEAD_US:
+            return TX_ERR_TOO_EARLY
+        airtime = airtime_us(self._dr_to_sf(txpk["datr"]), len(data))
+        with self.dl_lock:
+            if self.downlinks.collides(tmst, airtime):
+                return TX_ERR_COLLISION_PACKET
+            if not self.downlinks.push([tmst, airtime, data, txpk["datr"], int(txpk["freq"] * 1000000)]):
+                return TX_ERR_COLLISION_PACKET
+            self._arm_down_link()
+        return TX_ERR_NONE
+
+    def _arm_down_link(self):
+        # must be called with dl_lock held, one alarm serves the whole queue
+        pk = self.downlinks.peek()
+        if pk is None or self.lora_tx_busy:
+            return
+        self._set_down_link_alarm(tmst_diff(pk[0], time.ticks_us()) - DOWNLINK_SETUP_US)
+
+    def _set_down_link_alarm(self, t_us):
+        if self.downlink_alarm is not None:
+            self.downlink_alarm.cancel()
+        self.downlink_alarm = Timer.Alarm(handler=self._down_link_alarm, us=max(t_us, DOWNLINK_MIN_ALARM_US))
+
+    def _down_link_alarm(self, alarm):
+        with self.dl_lock:
+            pk = self.downlinks.peek()
+            if pk is None or self.lora_tx_busy:
+                return
+            t_us = tmst_diff(pk[0], time.ticks_us())
+            if t_us < 0:
+                # the previous TX ran over this slot
+                self.downlinks.pop()
+                if self.dl_tuned is pk:
+                    self._init_rx()
+                self.dl_tuned = None
+                print("Downlink dropped, late by", -t_us)
+                self._arm_down_link()
+                return
+            if self.dl_tuned is not pk:
+                if t_us > DOWNLINK_SETUP_US + DOWNLINK_MIN_ALARM_US:
+                    self._arm_down_link()
+                    return
+                self.lora.init(mode=LoRa.LORA, frequency=pk[4], bandwidth=LoRa.BW_125KHZ,
+                               sf=self._dr_to_sf(pk[3]), preamble=8, coding_rate=LoRa.CODING_4_5,
+                               tx_iq=True)
+                self.dl_tuned = pk
+                # come back right before the TX time instead of spinning
+                t_us = tmst_diff(pk[0], time.ticks_us()) - DOWNLINK_TX_ADVANCE_US
+                if t_us > DOWNLINK_MIN_ALARM_US:
+                    self._set_down_link_alarm(t_us)
+                    return
+            self.downlinks.pop()
+            self.dl_tuned = None
+            self.lora_tx_busy = True
+            self.lora_sock.send(pk[2])
 
     def _udp_thread(self):
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN)
+        now = time.ticks_ms()
+        next_pull = now
+        next_stat = time.ticks_add(now, STAT_PERIOD_MS)
+        next_wifi = now
+        next_replay = now
+        while not self.end:
+            now = time.ticks_ms()
+            if time.ticks_diff(now, next_wifi) >= 0:
+                if self._check_wifi(now):
+                    # the server has to ack before the spool is replayed,
+                    # and the first stat packet goes out at once
+                    next_pull = now
+                    self._stat_due()
+                next_wifi = time.ticks_add(now, WIFI_CHECK_MS if self.wifi_ok else WIFI_POLL_MS)
+            if time.ticks_diff(now, next_pull) >= 0:
+                # also probes a server that stopped acking
+                if self.wifi_ok:
+                    self._pull_data()
+                next_pull = time.ticks_add(now, PULL_PERIOD_MS if self.server_ok else SERVER_PROBE_MS)
+            if time.ticks_diff(now, next_stat) >= 0:
+                self._stat_due()
+                next_stat = time.ticks_add(now, STAT_PERIOD_MS)
+            self._retransmit()
+            if self._online() and self.spool.pending() and time.ticks_diff(now, next_replay) >= 0:
+                self._replay()
+                next_replay = time.ticks_add(now, REPLAY_INTERVAL_MS)
+
+            # sleep until a datagram arrives or the next timer is due
+            timeout = min(time.ticks_diff(next_pull, now), time.ticks_diff(next_stat, now),
+                          time.ticks_diff(next_wifi, now), UDP_POLL_MAX_MS)
+            with self.udp_lock:
+                due = self.push_acks.next_due(now)
+            if 0 <= due < timeout:
+                timeout = due
+            try:
+                if poller.poll(max(timeout, 0)):
+                    self._udp_recv()
+            except Exception:
+                print("UDP poll Exception")
+
+    def _udp_recv(self):
+        # drain the socket, it is non blocking
         while True:
             try:
                 data, src = self.sock.recvfrom(1024)
-                _token = data[1:3]
-                _type = data[3]
-                if _type == PUSH_ACK:
-                    print("Push ack")
-                elif _type == PULL_ACK:
-                    print("Pull ack")
-                elif _type == PULL_RESP:
-                    self.dwnb += 1
-                    ack_error = TX_ERR_NONE
-                    tx_pk = json.loads(data[4:])
-                    tmst = tx_pk["txpk"]["tmst"]
-                    t_us = tmst - time.ticks_us() - 5000
-                    if t_us < 0:
-                        t_us += 0xFFFFFFFF
-                    if t_us < 20000000:
-                        self.uplink_alarm = Timer.Alarm(handler=lambda x: self._send_down_link(binascii.a2b_base64(tx_pk["txpk"]["data"]),
-                                                                                               tx_pk["txpk"]["tmst"] - 10, tx_pk["txpk"]["datr"],
-                                                                                               int(tx_pk["txpk"]["freq"] * 1000000)), us=t_us)
-                    else:
-                        ack_error = TX_ERR_TOO_LATE
-                        print("Downlink timestamp error!, t_us:", t_us)
-                    self._ack_pull_rsp(_token, ack_error)
-                    print("Pull rsp")
             except socket.timeout:
-                pass
+                return
             except OSError as e:
-                if e.errno == errno.EAGAIN:
-                    pass
-                else:
+                if e.errno != errno.EAGAIN:
                     print("UDP recv OSError Exception")
+                return
+            try:
+                self._udp_handle(data, time.ticks_us())
             except Exception:
                 print("UDP recv Exception")
-            # Wait before trying to receive again
-            time.sleep(0.025)
+
+    def _udp_handle(self, data, rx_us):
+        _token = data[1:3]
+        _type = data[3]
+        if _type == PUSH_ACK:
+            with self.udp_lock:
+                rtt = self.push_acks.ack((data[1] << 8) | data[2], time.ticks_ms())
+            self.server_ok = True
+            print("Push ack", rtt)
+        elif _type == PULL_ACK:
+            with self.udp_lock:
+                rtt = self.pull_acks.ack((data[1] << 8) | data[2], time.ticks_ms())
+            self.server_ok = True
+            print("Pull ack", rtt)
+        elif _type == PULL_RESP:
+            self.dwnb += 1
+            tx_pk = json.loads(data[4:])
+            ack_error = self._schedule_down_link(tx_pk["txpk"])
+            self.resp_us = time.ticks_diff(time.ticks_us(), rx_us)
+            if self.resp_us > self.resp_max_us:
+                self.resp_max_us = self.resp_us
+            if ack_error != TX_ERR_NONE:
+                print("Downlink scheduling error:", ack_error)
+            self._ack_pull_rsp(_token, ack_error)
+            print("Pull rsp")
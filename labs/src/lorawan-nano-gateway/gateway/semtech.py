@@ -0,0 +1,205 @@
+""" LoPy Nano Gateway Semtech UDP PUSH_DATA encoder """
+
+import binascii
+
+PROTOCOL_VERSION = const(2)
+PUSH_DATA = const(0)
+
+HEADER_LEN = const(12)
+
+# rxpk JSON template, split around the variable fields
+F_OPEN = b'{"rxpk":['
+F_TIME = b'{"time":"'
+F_TMST = b'","tmst":'
+F_CHAN = b',"chan":'
+F_FREQ = b',"rfch":0,"freq":'
+F_DATR = b',"stat":1,"modu":"LORA","datr":"'
+F_RSSI = b'","codr":"4/5","rssi":'
+F_LSNR = b',"lsnr":'
+F_SIZE = b',"size":'
+F_DATA = b',"data":"'
+F_END_PK = b'"}'
+F_CLOSE = b']}'
+F_STAT = b'],"stat":'
+F_END = b'}'
+
+# room needed by one rxpk besides its base64 payload
+RXPK_OVERHEAD = const(200)
+# room kept for a stat object riding along with the rxpk array
+STAT_RESERVE = const(256)
+
+B64 = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+class PushDataEncoder:
+    """ Builds PUSH_DATA packets in place in a preallocated buffer """
+
+    def __init__(self, id, size=2048):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.pos = 0
+        self.count = 0
+        self.token = 0
+
+        # the fixed part of the header is written once
+        self.buf[0] = PROTOCOL_VERSION
+        self.buf[3] = PUSH_DATA
+        self.buf[4:HEADER_LEN] = binascii.unhexlify(id)
+
+        # formatted frequencies and datarates, keyed on their numeric value
+        self.freqs = {}
+        self.datrs = {}
+
+    def _next_token(self):
+        self.token = (self.token + 1) & 0xFFFF
+        self.buf[1] = self.token >> 8
+        self.buf[2] = self.token & 0xFF
+
+    def _put(self, pos, frag):
+        end = pos + len(frag)
+        self.buf[pos:end] = frag
+        return end
+
+    def _put_int(self, pos, value, width=1):
+        buf = self.buf
+        if value < 0:
+            buf[pos] = 0x2D  # '-'
+            pos += 1
+            value = -value
+        n = 1
+        v = value
+        while v >= 10:
+            v //= 10
+            n += 1
+        if n < width:
+            n = width
+        end = pos + n
+        while n:
+            n -= 1
+            buf[pos + n] = 0x30 + value % 10
+            value //= 10
+        return end
+
+    def _put_b64(self, pos, data):
+        buf = self.buf
+        n = len(data)
+        i = 0
+        while i + 2 < n:
+            v = (data[i] << 16) | (data[i + 1] << 8) | data[i + 2]
+            buf[pos] = B64[v >> 18]
+            buf[pos + 1] = B64[(v >> 12) & 0x3F]
+            buf[pos + 2] = B64[(v >> 6) & 0x3F]
+            buf[pos + 3] = B64[v & 0x3F]
+            pos += 4
+            i += 3
+        if i < n:
+            v = data[i] << 16
+            if i + 1 < n:
+                v |= data[i + 1] << 8
+            buf[pos] = B64[v >> 18]
+            buf[pos + 1] = B64[(v >> 12) & 0x3F]
+            buf[pos + 2] = B64[(v >> 6) & 0x3F] if i + 1 < n else 0x3D
+            buf[pos + 3] = 0x3D  # '='
+            pos += 4
+        return pos
+
+    def _freq(self, frequency):
+        f = self.freqs.get(frequency)
+        if f is None:
+            f = ('%d.%06d' % (frequency // 1000000, frequency % 1000000)).rstrip('0')
+            if f[-1] == '.':
+                f += '0'
+            f = f.encode()
+            self.freqs[frequency] = f
+        return f
+
+    def _datr(self, sf):
+        d = self.datrs.get(sf)
+        if d is None:
+            d = ('SF%dBW125' % sf).encode()
+            self.datrs[sf] = d
+        return d
+
+    def push_data(self, data):
+        # generic PUSH_DATA around an already serialized JSON object
+        if isinstance(data, str):
+            data = data.encode()
+        self._next_token()
+        end = self._put(HEADER_LEN, data)
+        return self.mv[:end]
+
+    def begin(self):
+        self._next_token()
+        self.count = 0
+        self.pos = self._put(HEADER_LEN, F_OPEN)
+
+    def fits(self, size):
+        return self.pos + RXPK_OVERHEAD + (size + 2) // 3 * 4 + STAT_RESERVE <= len(self.buf)
+
+    def add(self, rx_data, rx_time, tmst, sf, frequency, chan, rssi, snr):
+        if not self.fits(len(rx_data)):
+            return False
+        pos = self.pos
+        if self.count:
+            self.buf[pos] = 0x2C  # ','
+            pos += 1
+        pos = self._put(pos, F_TIME)
+        # rx_time is the RTC tuple: year, month, day, hour, minute, second, usecond
+        pos = self._put_int(pos, rx_time[0], 4)
+        self.buf[pos] = 0x2D
+        pos = self._put_int(pos + 1, rx_time[1], 2)
+        self.buf[pos] = 0x2D
+        pos = self._put_int(pos + 1, rx_time[2], 2)
+        self.buf[pos] = 0x54  # 'T'
+        pos = self._put_int(pos + 1, rx_time[3], 2)
+        self.buf[pos] = 0x3A  # ':'
+        pos = self._put_int(pos + 1, rx_time[4], 2)
+        self.buf[pos] = 0x3A
+        pos = self._put_int(pos + 1, rx_time[5], 2)
+        self.buf[pos] = 0x2E  # '.'
+        pos = self._put_int(pos + 1, rx_time[6], 6)
+        self.buf[pos] = 0x5A  # 'Z'
+        pos = self._put(pos + 1, F_TMST)
+        pos = self._put_int(pos, tmst)
+        pos = self._put(pos, F_CHAN)
+        pos = self._put_int(pos, chan)
+        pos = self._put(pos, F_FREQ)
+        pos = self._put(pos, self._freq(frequency))
+        pos = self._put(pos, F_DATR)
+        pos = self._put(pos, self._datr(sf))
+        pos = self._put(pos, F_RSSI)
+        pos = self._put_int(pos, rssi)
+        pos = self._put(pos, F_LSNR)
+        # one decimal, as the Semtech packet forwarder does
+        snr10 = int(round(snr * 10))
+        if snr10 < 0:
+            self.buf[pos] = 0x2D
+            pos += 1
+            snr10 = -snr10
+        pos = self._put_int(pos, snr10 // 10)
+        self.buf[pos] = 0x2E
+        self.buf[pos + 1] = 0x30 + snr10 % 10
+        pos = self._put(pos + 2, F_SIZE)
+        pos = self._put_int(pos, len(rx_data))
+        pos = self._put(pos, F_DATA)
+        pos = self._put_b64(pos, rx_data)
+        self.pos = self._put(pos, F_END_PK)
+        self.count += 1
+        return True
+
+    def finish(self, stat=None):
+        if stat is None:
+            end = self._put(self.pos, F_CLOSE)
+        else:
+            # stat is the serialized content of the "stat" object
+            if isinstance(stat, str):
+                stat = stat.encode()
+            pos = self._put(self.pos, F_STAT)
+            pos = self._put(pos, stat)
+            end = self._put(pos, F_END)
+        return self.mv[:end]
+
+    def rxpk(self, rx_data, rx_time, tmst, sf, frequency, chan, rssi, snr):
+        self.begin()
+        self.add(rx_data, rx_time, tmst, sf, frequency, chan, rssi, snr)
+        return self.finish()
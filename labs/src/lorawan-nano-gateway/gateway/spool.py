@@ -0,0 +1,154 @@
+""" LoPy Nano Gateway store-and-forward spool """
+
+import binascii
+import os
+import struct
+
+# magic, size, rssi, snr x 10, sf, chan, tmst, rx seconds, rx microseconds
+HEADER_FMT = '<BBhhBBLLL'
+HEADER_LEN = const(20)
+# the LoRa maximum, fits the size byte of the header
+PAYLOAD_LEN = const(255)
+RECORD_LEN = const(279)  # header, payload and a CRC32
+MAGIC = const(0xA5)
+# replayed records between two writes of the read offset, as many may
+# be sent again after a reboot
+POS_SYNC = const(16)
+
+
+class Spool:
+    """ Append-only log of fixed-size, CRC'd records holding the frames
+    that could not be forwarded. Up to max_records frames wait for replay,
+    frames are dropped beyond. The read offset is kept in a side file so a
+    reboot in the middle of a replay does not send everything again. A
+    torn record at the end, from a reset or a failed write, is cut off so
+    the next ones are appended on a record boundary. """
+
+    def __init__(self, path, max_records=256):
+        self.path = path
+        self.max_records = max_records
+        self.data_name = path + '/spool.dat'
+        self.pos_name = path + '/spool.pos'
+
+        self.rec = bytearray(RECORD_LEN)
+        self.mv = memoryview(self.rec)
+
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.corrupted = 0
+
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass
+
+        try:
+            size = os.stat(self.data_name)[6]
+        except OSError:
+            size = 0
+        self.records = size // RECORD_LEN
+        if size % RECORD_LEN:
+            self._truncate()
+        try:
+            with open(self.pos_name, 'r') as f:
+                self.read_pos = min(int(f.read()), self.records)
+        except (OSError, ValueError):
+            self.read_pos = 0
+        self.next_pos = self.read_pos
+        self.saved_pos = self.read_pos
+
+    def pending(self):
+        return self.records - self.read_pos
+
+    def _truncate(self):
+        # cuts the file to self.records whole records. MicroPython files
+        # have no truncate(), the records are copied to a new file instead
+        tmp_name = self.data_name + '.tmp'
+        try:
+            with open(self.data_name, 'rb') as src:
+                with open(tmp_name, 'wb') as dst:
+                    for i in range(self.records):
+                        if src.readinto(self.rec) != RECORD_LEN:
+                            self.records = i
+                            break
+                        dst.write(self.rec)
+            os.remove(self.data_name)
+            os.rename(tmp_name, self.data_name)
+        except OSError as e:
+            print("Spool truncate error:", e)
+
+    def append(self, data, rssi, snr, sf, chan, tmst, secs, usecs):
+        if self.pending() >= self.max_records:
+            self.dropped += 1
+            return False
+        n = min(len(data), PAYLOAD_LEN)
+        struct.pack_into(HEADER_FMT, self.rec, 0, MAGIC, n, rssi, int(snr * 10), sf, chan,
+                         tmst & 0xFFFFFFFF, secs, usecs)
+        self.rec[HEADER_LEN:HEADER_LEN + n] = data[:n]
+        for i in range(HEADER_LEN + n, HEADER_LEN + PAYLOAD_LEN):
+            self.rec[i] = 0
+        struct.pack_into('<L', self.rec, HEADER_LEN + PAYLOAD_LEN,
+                         binascii.crc32(self.mv[:HEADER_LEN + PAYLOAD_LEN]) & 0xFFFFFFFF)
+        try:
+            with open(self.data_name, 'ab') as f:
+                f.write(self.rec)
+        except OSError as e:
+            # flash full or failing, drop the partial record if any
+            print("Spool write error:", e)
+            self.dropped += 1
+            self._truncate()
+            return False
+        self.records += 1
+        self.spooled += 1
+        return True
+
+    def read(self, count):
+        # returns up to count valid records as (data, rssi, snr, sf, chan,
+        # tmst, secs, usecs), records failing the CRC are skipped. They stay
+        # in the spool until commit is called.
+        frames = []
+        pos = self.read_pos
+        torn = False
+        if pos < self.records:
+            with open(self.data_name, 'rb') as f:
+                f.seek(pos * RECORD_LEN)
+                while len(frames) < count and pos < self.records:
+                    if f.readinto(self.rec) != RECORD_LEN:
+                        # torn write at the end of the file
+                        self.records = pos
+                        torn = True
+                        break
+                    pos += 1
+                    crc = struct.unpack_from('<L', self.rec, HEADER_LEN + PAYLOAD_LEN)[0]
+                    if self.rec[0] != MAGIC or binascii.crc32(self.mv[:HEADER_LEN + PAYLOAD_LEN]) & 0xFFFFFFFF != crc:
+                        self.corrupted += 1
+                        continue
+                    h = struct.unpack_from(HEADER_FMT, self.rec, 0)
+                    frames.append((bytes(self.rec[HEADER_LEN:HEADER_LEN + h[1]]), h[2], h[3] / 10, h[4], h[5],
+                                   h[6], h[7], h[8]))
+        if torn:
+            self._truncate()
+        self.next_pos = pos
+        return frames
+
+    def commit(self):
+        # call once the records returned by read are sent. The offset is
+        # saved every POS_SYNC records and on drain, not on every batch
+        self.replayed += self.next_pos - self.read_pos
+        self.read_pos = self.next_pos
+        if self.read_pos >= self.records:
+            # drained, start a new log
+            self.records = 0
+            self.read_pos = 0
+            self.next_pos = 0
+            try:
+                os.remove(self.data_name)
+            except OSError:
+                pass
+        elif self.read_pos - self.saved_pos < POS_SYNC:
+            return
+        if self.read_pos != self.saved_pos:
+            with open(self.pos_name, 'w') as f:
+                f.write(str(self.read_pos))
+            self.saved_pos = self.read_pos
@@ -0,0 +1,101 @@
+""" Benchmark of the PUSH_DATA encoder against the former json.dumps path
+
+Run it with CPython (python3 bench_encoder.py) or copy it
+next to semtech.py on the LoPy. Reports packets/s and the bytes allocated
+per packet: cumulative heap usage with the GC disabled on MicroPython,
+transient peak measured by tracemalloc on CPython.
+"""
+
+import binascii
+import json
+import sys
+import time
+
+if sys.implementation.name != 'micropython':
+    import builtins
+    import os
+    builtins.const = lambda x: x
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gateway'))
+
+from semtech import PushDataEncoder
+
+GATEWAY_ID = '240AC4FFFE012345'
+FREQUENCY = 868100000
+RX_TIME = (2017, 6, 30, 12, 36, 1, 523412, None)
+PAYLOAD = bytes(range(23))
+N = 5000
+
+RX_PK = {"rxpk": [{"time": "", "tmst": 0,
+                   "chan": 0, "rfch": 0,
+                   "freq": 868.1, "stat": 1,
+                   "modu": "LORA", "datr": "SF7BW125",
+                   "codr": "4/5", "rssi": 0,
+                   "lsnr": 0, "size": 0,
+                   "data": ""}]}
+
+
+def legacy(rx_data, rx_time, tmst, rssi, snr):
+    # NanoGateway._make_node_packet followed by _push_data, as before
+    RX_PK["rxpk"][0]["time"] = "%d-%02d-%02dT%02d:%02d:%02d.%dZ" % (rx_time[0], rx_time[1], rx_time[2], rx_time[3], rx_time[4], rx_time[5], rx_time[6])
+    RX_PK["rxpk"][0]["tmst"] = tmst
+    RX_PK["rxpk"][0]["datr"] = "SF7BW125"
+    RX_PK["rxpk"][0]["rssi"] = rssi
+    RX_PK["rxpk"][0]["lsnr"] = float(snr)
+    RX_PK["rxpk"][0]["data"] = binascii.b2a_base64(rx_data)[:-1].decode()
+    RX_PK["rxpk"][0]["size"] = len(rx_data)
+    data = json.dumps(RX_PK).encode()
+    token = bytes([tmst & 0xFF, 0])
+    return bytes([2]) + token + bytes([0]) + binascii.unhexlify(GATEWAY_ID) + data
+
+
+encoder = PushDataEncoder(GATEWAY_ID)
+
+
+def encoded(rx_data, rx_time, tmst, rssi, snr):
+    return encoder.rxpk(rx_data, rx_time, tmst, 7, FREQUENCY, 0, rssi, snr)
+
+
+def ticks_us():
+    if hasattr(time, 'ticks_us'):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+
+def alloc_per_packet(fn):
+    if sys.implementation.name == 'micropython':
+        import gc
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for i in range(100):
+            fn(PAYLOAD, RX_TIME, 3230236963 + i, -118, -8)
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used // 100
+    import tracemalloc
+    tracemalloc.start()
+    fn(PAYLOAD, RX_TIME, 3230236963, -118, -8)
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(PAYLOAD, RX_TIME, 3230236964, -118, -8)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - base
+
+
+def rate(fn):
+    start = ticks_us()
+    for i in range(N):
+        fn(PAYLOAD, RX_TIME, 3230236963 + i, -118, -8)
+    return N * 1000000 / max(ticks_us() - start, 1)
+
+
+# both paths must produce the same JSON
+a = json.loads(bytes(legacy(PAYLOAD, RX_TIME, 3230236963, -118, -8)[12:]))
+b = json.loads(bytes(encoded(PAYLOAD, RX_TIME, 3230236963, -118, -8)[12:]))
+a["rxpk"][0]["time"] = b["rxpk"][0]["time"]
+if a != b:
+    print("Encoder mismatch:", a, b)
+
+for name, fn in (("json.dumps", legacy), ("encoder", encoded)):
+    print("%-10s %8d packets/s %6d bytes allocated/packet" % (name, rate(fn), alloc_per_packet(fn)))
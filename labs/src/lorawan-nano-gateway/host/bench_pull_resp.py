@@ -0,0 +1,45 @@
+""" PULL_RESP to downlink scheduled latency of a gateway
+
+Starts the fake network server, waits for the gateway PULL_DATA, then
+sends immediate downlinks and times each PULL_RESP until its TX_ACK:
+    python3 bench_pull_resp.py [port] [count]
+The TX_ACK is sent once the downlink is scheduled, so the figures include
+the wait of the gateway UDP loop plus the LAN round trip.
+"""
+
+import sys
+import time
+
+from fake_ns import FakeNetworkServer
+
+TXPK = {"imme": True, "freq": 869.525, "rfch": 0, "powe": 14, "modu": "LORA",
+        "datr": "SF9BW125", "codr": "4/5", "ipol": True, "size": 4, "data": "AQIDBA=="}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def run(ns, count, spacing=1.0):
+    while ns.pull_addr is None:
+        time.sleep(0.1)
+    for i in range(count):
+        ns.send_pull_resp(TXPK)
+        # leave the radio time to send the previous downlink
+        time.sleep(spacing)
+    time.sleep(1)
+    return [1000 * t for t in ns.resp_latency]
+
+
+if __name__ == '__main__':
+    ns = FakeNetworkServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 1700)
+    ns.start()
+    print("Waiting for a PULL_DATA on UDP port", ns.port)
+    latency = run(ns, int(sys.argv[2]) if len(sys.argv) > 2 else 50)
+    ns.stop()
+    if latency:
+        print("%d TX_ACK  p50 %.1f ms  p95 %.1f ms  max %.1f ms" % (len(latency), percentile(latency, 50),
+                                                                 percentile(latency, 95), max(latency)))
+    else:
+        print("No TX_ACK received")
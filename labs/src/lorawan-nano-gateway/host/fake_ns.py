@@ -0,0 +1,136 @@
+""" Local UDP stand-in for a Semtech network server
+
+Point the gateway config.py SERVER to the IP of the machine running
+python3 fake_ns.py [port] and every PUSH_DATA is recorded and acked. The
+summary printed every 10 s shows rxpk per PUSH_DATA and stat packets.
+ack_loss and ack_delay make the server look lossy or slow to the gateway.
+"""
+
+import json
+import random
+import socket
+import sys
+import threading
+import time
+
+PROTOCOL_VERSION = 2
+
+PUSH_DATA = 0
+PUSH_ACK = 1
+PULL_DATA = 2
+PULL_RESP = 3
+PULL_ACK = 4
+TX_ACK = 5
+
+
+class FakeNetworkServer(threading.Thread):
+
+    def __init__(self, host='0.0.0.0', port=1700, ack_loss=0.0, ack_delay=0.0):
+        threading.Thread.__init__(self, daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.end = False
+        self.lock = threading.Lock()
+        self.ack_loss = ack_loss
+        self.ack_delay = ack_delay
+
+        # (receive time, token, rxpk list, stat or None) per PUSH_DATA
+        self.pushes = []
+        self.tx_acks = []
+        self.duplicates = 0
+        self.pulls = 0
+        self.pull_addr = None
+        self.resp_token = 0
+        # PULL_RESP send time per token, and PULL_RESP to TX_ACK delays
+        self.resp_sent = {}
+        self.resp_latency = []
+
+    def run(self):
+        while not self.end:
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.handle(data, addr, time.time())
+
+    def stop(self):
+        self.end = True
+        self.join()
+        self.sock.close()
+
+    def _ack(self, packet, addr):
+        if random.random() < self.ack_loss:
+            return
+        if self.ack_delay:
+            threading.Timer(self.ack_delay, self.sock.sendto, (packet, addr)).start()
+        else:
+            self.sock.sendto(packet, addr)
+
+    def handle(self, data, addr, now):
+        if len(data) < 4 or data[0] != PROTOCOL_VERSION:
+            return
+        token = data[1:3]
+        _type = data[3]
+        if _type == PUSH_DATA:
+            body = json.loads(data[12:].decode())
+            with self.lock:
+                if any(push[1] == token for push in self.pushes[-16:]):
+                    # a retransmission of an unacked PUSH_DATA
+                    self.duplicates += 1
+                else:
+                    self.pushes.append((now, token, body.get("rxpk", []), body.get("stat")))
+            self._ack(bytes([PROTOCOL_VERSION]) + token + bytes([PUSH_ACK]), addr)
+        elif _type == PULL_DATA:
+            with self.lock:
+                self.pulls += 1
+                self.pull_addr = addr
+            self._ack(bytes([PROTOCOL_VERSION]) + token + bytes([PULL_ACK]), addr)
+        elif _type == TX_ACK:
+            body = json.loads(data[12:].decode()) if len(data) > 12 else {}
+            with self.lock:
+                self.tx_acks.append((now, token, body.get("txpk_ack", {}).get("error", "NONE")))
+                sent = self.resp_sent.pop(token, None)
+                if sent is not None:
+                    self.resp_latency.append(now - sent)
+
+    def send_pull_resp(self, txpk):
+        # schedule a downlink on the gateway that last sent a PULL_DATA
+        if self.pull_addr is None:
+            return False
+        self.resp_token = (self.resp_token + 1) & 0xFFFF
+        token = bytes([self.resp_token >> 8, self.resp_token & 0xFF])
+        packet = bytes([PROTOCOL_VERSION]) + token + bytes([PULL_RESP]) + json.dumps({"txpk": txpk}).encode()
+        with self.lock:
+            self.resp_sent[token] = time.time()
+        self.sock.sendto(packet, self.pull_addr)
+        return True
+
+    def frames(self):
+        with self.lock:
+            return [pk for push in self.pushes for pk in push[2]]
+
+    def summary(self):
+        with self.lock:
+            sizes = [len(push[2]) for push in self.pushes if push[2]]
+            stats = [push[3] for push in self.pushes if push[3] is not None]
+            return {"push_data": len(self.pushes), "frames": sum(sizes),
+                    "batch_max": max(sizes) if sizes else 0,
+                    "batch_avg": sum(sizes) / len(sizes) if sizes else 0.0,
+                    "stat": len(stats), "stat_with_rxpk": sum(1 for push in self.pushes if push[2] and push[3]),
+                    "duplicates": self.duplicates, "pull_data": self.pulls, "tx_ack": len(self.tx_acks)}
+
+
+if __name__ == '__main__':
+    ns = FakeNetworkServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 1700)
+    ns.start()
+    print("Listening on UDP port", ns.port)
+    try:
+        while True:
+            time.sleep(10)
+            print(ns.summary())
+    except KeyboardInterrupt:
+        ns.stop()
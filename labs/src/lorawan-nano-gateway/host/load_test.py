@@ -0,0 +1,208 @@
+""" Load test of the nano gateway with simulated LoRa nodes
+
+Runs NanoGateway on the pycomsim simulator, forwarding to the fake
+network server, while N simulated nodes send to it:
+    python3 load_test.py --nodes 200 --duty 0.01 --size 20 --sf 7 --duration 30
+Each node sends raw LoRa frames like lora-mac/main.py, either spaced to
+respect the duty cycle (ALOHA, uniformly jittered) or, with --lora-mac,
+after machine.rng() & 0x0F seconds. The report gives the frames/s
+forwarded, where the other frames were lost, the gateway CPU time per
+frame and the node to network server latency percentiles.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'pycom-sim'))
+
+import pycomsim
+from fake_ns import FakeNetworkServer
+
+sim = pycomsim.install()
+pycomsim.add_path(os.path.join(HERE, '..', 'gateway'))
+
+import binascii
+import machine
+import socket
+from network import LoRa
+from nanogateway import NanoGateway
+
+GATEWAY_ID = '240AC4FFFE012345'
+FREQUENCY = 868100000
+# node index and sequence number, the rest of the payload is padding
+HEADER = '>HI'
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+class Node:
+    """ A simulated node sending numbered frames on its own board """
+
+    def __init__(self, index, sf, size, duty, lora_mac):
+        self.index = index
+        self.sf = sf
+        self.size = max(size, struct.calcsize(HEADER))
+        self.lora_mac = lora_mac
+        self.mean_us = pycomsim.airtime_us(sf, self.size) / duty
+        self.seq = 0
+        self.alarm = None
+        # wall clock time at the end of each transmission, by sequence number
+        self.sent = {}
+        self.device = sim.device('node-%d' % index)
+        with self.device:
+            self.lora = LoRa(mode=LoRa.LORA, frequency=FREQUENCY, sf=sf, power_mode=LoRa.TX_ONLY)
+            self.sock = socket.socket(socket.AF_LORA, socket.SOCK_RAW)
+            self.sock.setblocking(False)
+
+    def _interval_us(self):
+        if self.lora_mac:
+            return max(machine.rng() & 0x0F, 1) * 1000000
+        return int(self.mean_us * random.uniform(0.5, 1.5))
+
+    def start(self):
+        with self.device:
+            # random phase so the nodes do not all start together
+            self.alarm = machine.Timer.Alarm(self._send, us=int(random.uniform(0, self.mean_us)))
+
+    def stop(self):
+        if self.alarm is not None:
+            self.alarm.cancel()
+
+    def _send(self, alarm):
+        payload = struct.pack(HEADER, self.index, self.seq) + bytes(self.size - struct.calcsize(HEADER))
+        now = sim.clock.now_us()
+        self.sock.send(payload)
+        self.sent[self.seq] = time.time() + (self.lora.tx_until - now) / 1000000
+        self.seq += 1
+        self.alarm = machine.Timer.Alarm(self._send, us=self._interval_us())
+
+
+def timed(fn, totals, key):
+    # accumulates the CPU time of the calling thread spent in fn
+    def wrapper(*args):
+        t = time.thread_time()
+        try:
+            return fn(*args)
+        finally:
+            totals[key] += time.thread_time() - t
+    return wrapper
+
+
+def run(args):
+    ns = FakeNetworkServer('127.0.0.1', 0, ack_loss=args.ack_loss)
+    ns.start()
+
+    spool = tempfile.mkdtemp()
+    channels = [(FREQUENCY, 'SF%dBW125' % sf) for sf in args.sf] if args.hop else None
+    gw_device = sim.device('gateway')
+    with gw_device:
+        gw = NanoGateway(id=GATEWAY_ID, frequency=FREQUENCY, datarate='SF%dBW125' % args.sf[0], ssid='lab',
+                         password='', server='127.0.0.1', port=ns.port, batch_size=args.batch,
+                         batch_window_ms=args.window, channels=channels, dwell_ms=args.dwell, spool_path=spool)
+        cpu = {"lora_cb": 0.0, "flush_rx": 0.0}
+        gw._lora_cb = timed(gw._lora_cb, cpu, "lora_cb")
+        gw._flush_rx = timed(gw._flush_rx, cpu, "flush_rx")
+        if args.boot_outage:
+            # the gateway boots without WiFi
+            sim.ap.set_up(False)
+            sim.clock.schedule(sim.clock.now_us() + int(args.boot_outage * 1000000), lambda: sim.ap.set_up(True))
+        gw.start()
+    if args.flap:
+        sim.ap.flap(args.flap, args.duration / 3)
+
+    nodes = [Node(i, args.sf[i % len(args.sf)], args.size, args.duty, args.lora_mac) for i in range(args.nodes)]
+    start = time.time()
+    for node in nodes:
+        node.start()
+    time.sleep(args.duration)
+    for node in nodes:
+        node.stop()
+    # let the last frames and retransmissions through
+    time.sleep(2 + args.window / 1000)
+    elapsed = time.time() - start
+    metrics = gw.metrics()
+    gw.stop()
+    ns.stop()
+    shutil.rmtree(spool, ignore_errors=True)
+    return nodes, ns, metrics, cpu, elapsed
+
+
+def report(args, nodes, ns, metrics, cpu, elapsed):
+    latency = []
+    received = set()
+    for arrival, token, rxpk, stat in ns.pushes:
+        for pk in rxpk:
+            index, seq = struct.unpack_from(HEADER, binascii.a2b_base64(pk["data"]))
+            if (index, seq) in received:
+                continue
+            received.add((index, seq))
+            t = nodes[index].sent.get(seq)
+            if t is not None:
+                latency.append(1000 * (arrival - t))
+
+    sent = sum(node.seq for node in nodes)
+    medium = sim.medium.stats
+    heard = medium["delivered"]
+    overruns = metrics["rx_overruns"]
+    forwarded = len(received)
+    not_heard = sent - heard - medium["collisions"] - medium["lost"] - medium["half_duplex"] - medium["rx_overflow"]
+    drops = {"collision": medium["collisions"], "not_listening": not_heard,
+             "radio_queue": medium["rx_overflow"], "irq_overrun": overruns,
+             "udp": max(heard - overruns - forwarded - metrics["spool_pending"], 0),
+             "spooled": metrics["spool_pending"]}
+
+    print("%d nodes, SF %s, %d bytes, %s, %.0f s" % (args.nodes, ','.join(str(sf) for sf in args.sf), args.size,
+                                                    'lora-mac backoff' if args.lora_mac else 'duty %g' % args.duty,
+                                                    elapsed))
+    print("sent %d  heard %d  forwarded %d  (%.1f frames/s, %.1f%% of sent)" % (
+        sent, heard, forwarded, forwarded / elapsed, 100.0 * forwarded / sent if sent else 0.0))
+    print("dropped: " + "  ".join("%s %d (%.1f%%)" % (k, v, 100.0 * v / sent if sent else 0.0)
+                                  for k, v in drops.items()))
+    print("gateway: push %d acked %d lost %d retransmits %d  batch avg %.1f max %d  spooled %d replayed %d" % (
+        metrics["push_sent"], metrics["push_acked"], metrics["push_lost"], metrics["push_retransmits"],
+        metrics["batch_avg"], metrics["batch_max"], metrics["spooled"], metrics["replayed"]))
+    if heard:
+        print("CPU per frame: callback %.1f us  forwarding %.1f us" % (1000000 * cpu["lora_cb"] / heard,
+                                                                      1000000 * cpu["flush_rx"] / heard))
+    if latency:
+        print("latency ms: p50 %.1f  p95 %.1f  p99 %.1f  max %.1f" % (
+            percentile(latency, 50), percentile(latency, 95), percentile(latency, 99), max(latency)))
+    return drops
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the nano gateway with simulated nodes')
+    parser.add_argument('--nodes', type=int, default=100)
+    parser.add_argument('--duty', type=float, default=0.01, help='duty cycle of each node')
+    parser.add_argument('--lora-mac', action='store_true', help='rng() & 0x0F s between frames, like lora-mac')
+    parser.add_argument('--size', type=int, default=20, help='payload bytes')
+    parser.add_argument('--sf', type=lambda s: [int(sf) for sf in s.split(',')], default=[7],
+                        help='SF of the nodes, comma separated, the gateway listens to the first one')
+    parser.add_argument('--hop', action='store_true', help='the gateway hops between the SFs of --sf')
+    parser.add_argument('--dwell', type=int, default=5000, help='ms on each SF with --hop')
+    parser.add_argument('--batch', type=int, default=1, help='gateway BATCH_SIZE')
+    parser.add_argument('--window', type=int, default=0, help='gateway BATCH_WINDOW_MS')
+    parser.add_argument('--ack-loss', type=float, default=0.0, help='PUSH_ACKs dropped by the server')
+    parser.add_argument('--flap', type=float, default=0.0, help='WiFi outages of this many seconds')
+    parser.add_argument('--boot-outage', type=float, default=0.0, help='WiFi down for this many seconds at boot')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of traffic')
+    parser.add_argument('--verbose', action='store_true', help='show the gateway output')
+    args = parser.parse_args()
+    if args.verbose:
+        results = run(args)
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = run(args)
+    report(args, *results)
@@ -0,0 +1,94 @@
+""" Host-side simulator of the Pycom APIs used by the labs
+
+install() puts stand-ins for network, machine, pycom, micropython and
+utime in sys.modules, adds the MicroPython ticks functions to time, the
+AF_LORA sockets to socket, const to the builtins, and makes the threads
+started with _thread keep the board of their creator. The lab code then
+runs unchanged on CPython:
+
+    import pycomsim
+    sim = pycomsim.install()
+    pycomsim.add_path('../lorawan-nano-gateway/gateway')
+    with sim.device('node-1'):
+        ...
+
+add_path() also gives the modules of a lab folder the MicroPython const()
+substitution, the Pysense drivers need it.
+
+See python3 -m pycomsim -h to run a lab main.py.
+"""
+
+import _thread
+import builtins
+import calendar
+import sys
+import time
+
+from .clock import Clock
+from .clock import ticks_add
+from .clock import ticks_diff
+from .constfold import add_path
+from .constfold import run_path
+from .device import Device
+from .device import Simulator
+from .device import current
+from .i2c import I2CBus
+from .i2c import RegisterDevice
+from .radio import Medium
+from .radio import airtime_us
+from .sensors import attach_pysense
+from .wifi import AccessPoint
+
+_installed = False
+_start_new_thread = _thread.start_new_thread
+_mktime = time.mktime
+
+
+def _clock():
+    return Simulator.active.clock
+
+
+def _thread_start(function, args, kwargs={}):
+    return _start_new_thread(current().bind(function), args, kwargs)
+
+
+def _time_mktime(t):
+    # MicroPython takes 8 items, in UTC on the Pycom
+    if len(t) == 8:
+        return calendar.timegm(tuple(t[:6]))
+    return _mktime(t)
+
+
+def install(sim=None):
+    # sim replaces the active simulation, returned
+    global _installed
+    Simulator.active = sim if sim is not None else Simulator()
+    if _installed:
+        return Simulator.active
+    _installed = True
+
+    from . import machine
+    from . import micropython
+    from . import network
+    from . import pycom
+    from . import sockets
+
+    sys.modules['network'] = network
+    sys.modules['machine'] = machine
+    sys.modules['pycom'] = pycom
+    sys.modules['micropython'] = micropython
+    sys.modules['utime'] = time
+    builtins.const = micropython.const
+
+    time.ticks_ms = lambda: _clock().ticks_ms()
+    time.ticks_us = lambda: _clock().ticks_us()
+    time.ticks_cpu = time.ticks_us
+    time.ticks_diff = ticks_diff
+    time.ticks_add = ticks_add
+    time.sleep_ms = lambda ms: _clock().sleep_us(int(ms * 1000))
+    time.sleep_us = lambda us: _clock().sleep_us(int(us))
+    time.mktime = _time_mktime
+
+    _thread.start_new_thread = _thread_start
+    sockets.patch()
+    return Simulator.active
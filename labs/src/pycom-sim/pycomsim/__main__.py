@@ -0,0 +1,37 @@
+""" Runs a lab script on the simulator
+
+    python3 -m pycomsim [--pysense] [--speed X] path/to/main.py
+
+The script folder and its lib folder are put on sys.path, like the board
+file system. --pysense attaches the Pysense board and sensor models to
+I2C bus 0 of the main board.
+"""
+
+import argparse
+import os
+import sys
+
+import pycomsim
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python3 -m pycomsim', description='Run a Pycom lab script on the host')
+    parser.add_argument('script')
+    parser.add_argument('--pysense', action='store_true', help='attach the Pysense sensor models')
+    parser.add_argument('--speed', type=float, default=1.0, help='simulation clock speed')
+    args = parser.parse_args()
+
+    sim = pycomsim.install(pycomsim.Simulator(pycomsim.Clock(speed=args.speed)))
+    if args.pysense:
+        pycomsim.attach_pysense(sim.main.i2c[0], sim.clock)
+
+    folder = os.path.dirname(os.path.abspath(args.script))
+    if os.path.isdir(os.path.join(folder, 'lib')):
+        pycomsim.add_path(os.path.join(folder, 'lib'))
+    pycomsim.add_path(folder)
+    sys.argv = [args.script]
+    pycomsim.run_path(args.script)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+""" Simulation clock and timer alarms """
+
+import heapq
+import threading
+import time
+import traceback
+
+# the Pycom ticks are 32 bit counters
+TICKS_PERIOD = 1 << 32
+TICKS_MASK = TICKS_PERIOD - 1
+TICKS_HALF = TICKS_PERIOD // 2
+
+
+def ticks_diff(a, b):
+    return ((a - b + TICKS_HALF) & TICKS_MASK) - TICKS_HALF
+
+
+def ticks_add(a, b):
+    return (a + b) & TICKS_MASK
+
+
+class Clock:
+    """ Microsecond clock of a simulation. It follows the wall clock,
+    scaled by speed, or is virtual and only moves when advance is called.
+    Alarms are fired in due order, by a scheduler thread in real time or
+    by advance in virtual time, one at a time like the Pycom interrupts. """
+
+    def __init__(self, virtual=False, speed=1.0, start_us=0):
+        self.virtual = virtual
+        self.speed = speed
+        self.start_us = start_us
+        self._t0 = time.monotonic()
+        self._now = start_us
+
+        self._cond = threading.Condition()
+        self._alarms = []
+        self._seq = 0
+        self._thread = None
+        self.fired = 0
+
+    def now_us(self):
+        if self.virtual:
+            return self._now
+        return self.start_us + int((time.monotonic() - self._t0) * 1000000 * self.speed)
+
+    def ticks_us(self):
+        return self.now_us() & TICKS_MASK
+
+    def ticks_ms(self):
+        return (self.now_us() // 1000) & TICKS_MASK
+
+    def schedule(self, due_us, fn):
+        # returns an entry to give to cancel, fn is called without argument
+        with self._cond:
+            self._seq += 1
+            entry = [due_us, self._seq, fn]
+            heapq.heappush(self._alarms, entry)
+            if not self.virtual:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        return entry
+
+    def cancel(self, entry):
+        with self._cond:
+            entry[2] = None
+
+    def _fire(self, fn):
+        self.fired += 1
+        try:
+            fn()
+        except Exception:
+            traceback.print_exc()
+
+    def advance(self, us):
+        # virtual time only: moves the clock, firing the alarms on the way
+        target = self._now + us
+        while True:
+            with self._cond:
+                if not self._alarms or self._alarms[0][0] > target:
+                    break
+                due, seq, fn = heapq.heappop(self._alarms)
+                self._now = max(self._now, due)
+            if fn is not None:
+                self._fire(fn)
+        self._now = target
+
+    def idle(self, max_us=1000):
+        # waits for an interrupt: in virtual time up to the next alarm, at
+        # most max_us, in real time a scheduler slot
+        if not self.virtual:
+            time.sleep(0)
+            return
+        with self._cond:
+            due = self._alarms[0][0] if self._alarms else self._now + max_us
+        self.advance(max(0, min(due - self._now, max_us)))
+
+    def sleep_us(self, us):
+        if self.virtual:
+            self.advance(us)
+        elif us > 0:
+            time.sleep(us / 1000000 / self.speed)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._alarms and self._alarms[0][2] is None:
+                        heapq.heappop(self._alarms)
+                    if not self._alarms:
+                        self._cond.wait()
+                        continue
+                    wait_us = self._alarms[0][0] - self.now_us()
+                    if wait_us <= 0:
+                        break
+                    self._cond.wait(wait_us / 1000000 / self.speed)
+                fn = heapq.heappop(self._alarms)[2]
+            if fn is not None:
+                self._fire(fn)
@@ -0,0 +1,81 @@
+""" MicroPython const() semantics for the lab modules
+
+The MicroPython compiler substitutes NAME = const(value) everywhere in
+the module, also when it is declared in a class body, and the Pysense
+drivers rely on it. Modules imported from the folders given to add_path
+get these names copied to their globals.
+"""
+
+import ast
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+# lab folders, the last one added first like on sys.path, so a module
+# name found in two of them always resolves the same way
+_paths = []
+
+
+def _const_assigns(tree):
+    consts = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                and isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name)
+                and node.value.func.id == 'const' and len(node.value.args) == 1):
+            consts.append(ast.Assign(targets=[ast.Name(node.targets[0].id, ast.Store())], value=node.value.args[0]))
+    return consts
+
+
+class ConstLoader(importlib.machinery.SourceFileLoader):
+
+    def get_code(self, fullname):
+        # always from the source, the cached bytecode has no substitution
+        return self.source_to_code(self.get_data(self.path), self.path)
+
+    def source_to_code(self, data, path, *, _optimize=-1):
+        tree = ast.parse(data, path)
+        consts = _const_assigns(tree)
+        # after the docstring and the imports
+        i = 0
+        while i < len(tree.body) and isinstance(tree.body[i], (ast.Import, ast.ImportFrom, ast.Expr)):
+            i += 1
+        tree.body[i:i] = consts
+        ast.fix_missing_locations(tree)
+        return compile(tree, path, 'exec', dont_inherit=True, optimize=_optimize)
+
+
+class ConstFinder:
+
+    @classmethod
+    def find_spec(cls, name, path=None, target=None):
+        if '.' in name:
+            return None
+        for folder in _paths:
+            filename = os.path.join(folder, name + '.py')
+            if os.path.isfile(filename):
+                return importlib.util.spec_from_file_location(name, filename,
+                                                              loader=ConstLoader(name, filename))
+        return None
+
+
+def add_path(folder):
+    # folder holds lab modules, put first on sys.path
+    folder = os.path.abspath(folder)
+    if folder in _paths:
+        _paths.remove(folder)
+    _paths.insert(0, folder)
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+    if ConstFinder not in sys.meta_path:
+        sys.meta_path.insert(0, ConstFinder)
+
+
+def run_path(script):
+    # runs a lab script as __main__ with the same const() handling
+    with open(script) as f:
+        source = f.read()
+    code = ConstLoader('__main__', script).source_to_code(source.encode(), script)
+    glob = {'__name__': '__main__', '__file__': script, '__builtins__': __builtins__}
+    exec(code, glob)
+    return glob
@@ -0,0 +1,114 @@
+""" Simulated boards and the simulation holding them """
+
+import threading
+import time
+import zlib
+
+from .clock import Clock
+from .i2c import I2CBus
+from .radio import Medium
+from .wifi import AccessPoint
+
+_local = threading.local()
+
+
+def current():
+    # the board the calling code runs on, the main board by default
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return Simulator.active.main
+
+
+class PinState:
+    """ Level of a pin, driven by the code (output) or by the test (input)
+    with the IRQ handler called on the matching edge """
+
+    def __init__(self, device, id):
+        self.device = device
+        self.id = id
+        self.level = 1
+        self.trigger = 0
+        self.handler = None
+        self.arg = None
+
+    def drive(self, level, rising=0x02, falling=0x01):
+        old = self.level
+        self.level = 1 if level else 0
+        if self.handler is None or old == self.level:
+            return
+        edge = rising if self.level else falling
+        if self.trigger & edge:
+            self.device.call(self.handler, self.arg)
+
+
+class Device:
+    """ One simulated board: its radio, WLAN, I2C buses, pins, RGB LED and
+    RTC. Code using the Pycom modules inside "with device:" acts on it,
+    threads and alarms keep the board of the code that created them. """
+
+    def __init__(self, sim, name, uid=None):
+        self.sim = sim
+        self.name = name
+        if uid is None:
+            crc = zlib.crc32(name.encode())
+            uid = bytes([0x30, 0xAE, 0xA4]) + crc.to_bytes(4, 'big')[1:]
+        self.uid = uid
+
+        self.lora = None
+        self.wlan = None
+        self.i2c = {0: I2CBus(), 1: I2CBus()}
+        self.pins = {}
+        self.adc = {}
+        self.rgbled = 0
+        self.heartbeat = True
+        self.nvs = {}
+        # wall clock seconds at the start of the simulation clock
+        self.rtc_base = time.time() - sim.clock.now_us() / 1000000
+        self.rtc_synced = False
+
+    def __enter__(self):
+        if not hasattr(_local, 'stack'):
+            _local.stack = []
+        _local.stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _local.stack.pop()
+
+    def __repr__(self):
+        return '<Device %s>' % self.name
+
+    def call(self, fn, *args):
+        with self:
+            return fn(*args)
+
+    def bind(self, fn):
+        # fn run later, e.g. from the scheduler thread, still on this board
+        def bound(*args):
+            with self:
+                return fn(*args)
+        return bound
+
+    def pin(self, id):
+        if id not in self.pins:
+            self.pins[id] = PinState(self, id)
+        return self.pins[id]
+
+
+class Simulator:
+    """ Shared clock, radio medium and WiFi network of the boards """
+
+    active = None
+
+    def __init__(self, clock=None, medium=None, ap=None):
+        self.clock = clock if clock is not None else Clock()
+        self.medium = medium if medium is not None else Medium(self.clock)
+        self.ap = ap if ap is not None else AccessPoint(self.clock)
+        self.devices = {}
+        self.main = self.device('main')
+
+    def device(self, name, uid=None):
+        if name not in self.devices:
+            self.devices[name] = Device(self, name, uid)
+        return self.devices[name]
@@ -0,0 +1,82 @@
+""" Simulated I2C bus and register-map slave models """
+
+import errno
+
+
+class I2CBus:
+    """ Slaves of a bus by address, with transaction counters so the
+    number of bus accesses of a driver can be measured """
+
+    def __init__(self):
+        self.devices = {}
+        self.transactions = 0
+        self.bytes = 0
+
+    def attach(self, addr, model):
+        self.devices[addr] = model
+        return model
+
+    def slave(self, addr):
+        model = self.devices.get(addr)
+        if model is None:
+            # no ACK from the address
+            raise OSError(errno.EIO, 'I2C bus error')
+        return model
+
+    def count(self, n):
+        self.transactions += 1
+        self.bytes += n
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes = 0
+
+
+class RegisterDevice:
+    """ Register-map slave with an auto-incremented register pointer.
+    A plain write sets the pointer from its first byte and writes the
+    rest, a plain read reads from the pointer. Models override on_read to
+    refresh their data registers and on_write to react to commands. """
+
+    def __init__(self, regs=None, size=256):
+        self.size = size
+        self.regs = bytearray(size)
+        self.ptr = 0
+        if regs:
+            for reg, value in regs.items():
+                self.regs[reg] = value
+
+    def on_read(self, reg, n):
+        pass
+
+    def on_write(self, reg, data):
+        pass
+
+    def read(self, reg, n):
+        self.on_read(reg, n)
+        data = bytes(self.regs[(reg + i) % self.size] for i in range(n))
+        self.ptr = (reg + n) % self.size
+        return data
+
+    def write(self, reg, data):
+        for i, b in enumerate(data):
+            self.regs[(reg + i) % self.size] = b
+        self.ptr = (reg + len(data)) % self.size
+        self.on_write(reg, bytes(data))
+
+    def send(self, data):
+        if not data:
+            return
+        self.ptr = data[0]
+        if len(data) > 1:
+            self.write(data[0], data[1:])
+
+    def receive(self, n):
+        return self.read(self.ptr, n)
+
+    def set_word(self, reg, value, width=2, little=True):
+        # helper for the models, value is truncated to width bytes
+        value &= (1 << (8 * width)) - 1
+        for i in range(width):
+            shift = 8 * i if little else 8 * (width - 1 - i)
+            self.regs[reg + i] = (value >> shift) & 0xFF
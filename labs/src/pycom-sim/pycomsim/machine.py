@@ -0,0 +1,310 @@
+""" Stand-in for the Pycom machine module """
+
+import calendar
+import random
+import sys
+import time
+
+from .device import current
+
+
+class Timer:
+
+    class Alarm:
+        """ One shot or periodic alarm on the simulation clock, the handler
+        runs on the board that created it """
+
+        def __init__(self, handler=None, s=None, ms=None, us=None, arg=None, periodic=False):
+            device = current()
+            self.clock = device.sim.clock
+            if us is None:
+                us = int(ms * 1000) if ms is not None else int(s * 1000000)
+            self.period_us = max(int(us), 1)
+            self.periodic = periodic
+            self.entry = None
+            self.callback(handler, arg)
+            self.handler = device.bind(self._fire)
+            self._schedule(self.clock.now_us() + self.period_us)
+
+        def _schedule(self, due_us):
+            self.due_us = due_us
+            self.entry = self.clock.schedule(due_us, self.handler)
+
+        def _fire(self):
+            if self.periodic:
+                self._schedule(self.due_us + self.period_us)
+            else:
+                self.entry = None
+            if self.user_handler is not None:
+                self.user_handler(self if self.arg is None else self.arg)
+
+        def callback(self, handler, arg=None):
+            self.user_handler = handler
+            self.arg = arg
+
+        def cancel(self):
+            if self.entry is not None:
+                self.clock.cancel(self.entry)
+                self.entry = None
+            self.periodic = False
+
+    class Chrono:
+
+        def __init__(self):
+            self.clock = current().sim.clock
+            self.total_us = 0
+            self.started_us = None
+
+        def start(self):
+            if self.started_us is None:
+                self.started_us = self.clock.now_us()
+
+        def stop(self):
+            if self.started_us is not None:
+                self.total_us += self.clock.now_us() - self.started_us
+                self.started_us = None
+
+        def reset(self):
+            self.total_us = 0
+            if self.started_us is not None:
+                self.started_us = self.clock.now_us()
+
+        def read_us(self):
+            us = self.total_us
+            if self.started_us is not None:
+                us += self.clock.now_us() - self.started_us
+            return us
+
+        def read_ms(self):
+            return self.read_us() / 1000
+
+        def read(self):
+            return self.read_us() / 1000000
+
+    @staticmethod
+    def sleep_us(us):
+        current().sim.clock.sleep_us(us)
+
+
+class Pin:
+    """ Pin of the current board, the test drives the inputs with
+    device.pin(id).drive(level) """
+
+    IN = 1
+    OUT = 2
+    OPEN_DRAIN = 3
+    ALT = 4
+
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    IRQ_FALLING = 0x01
+    IRQ_RISING = 0x02
+    IRQ_LOW_LEVEL = 0x04
+    IRQ_HIGH_LEVEL = 0x08
+
+    def __init__(self, id, mode=IN, pull=None, value=None, alt=-1):
+        self.state = current().pin(id)
+        self.id = id
+        self.init(mode, pull, value)
+
+    def init(self, mode=IN, pull=None, value=None, alt=-1):
+        self._mode = mode
+        self._pull = pull
+        if value is not None:
+            self.state.level = 1 if value else 0
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return self.state.level
+        self.state.level = 1 if value else 0
+
+    def toggle(self):
+        self.state.level ^= 1
+
+    def mode(self, mode=None):
+        if mode is None:
+            return self._mode
+        self._mode = mode
+
+    def pull(self, pull=None):
+        if pull is None:
+            return self._pull
+        self._pull = pull
+
+    def callback(self, trigger, handler=None, arg=None):
+        self.state.trigger = trigger
+        self.state.handler = handler
+        self.state.arg = self if arg is None else arg
+
+
+class I2C:
+    """ Master on a bus of the current board, see I2CBus.attach """
+
+    MASTER = 0
+
+    def __init__(self, bus=0, mode=MASTER, baudrate=100000, pins=None):
+        self.bus = current().i2c[bus]
+
+    def init(self, mode=MASTER, baudrate=100000, pins=None):
+        pass
+
+    def deinit(self):
+        pass
+
+    def scan(self):
+        return sorted(self.bus.devices)
+
+    def readfrom(self, addr, nbytes):
+        try:
+            data = self.bus.slave(addr).receive(nbytes)
+        except OSError:
+            # the address phase went on the bus
+            self.bus.count(0)
+            raise
+        self.bus.count(nbytes)
+        return data
+
+    def readfrom_into(self, addr, buf):
+        buf[:] = self.readfrom(addr, len(buf))
+        return len(buf)
+
+    def writeto(self, addr, buf, stop=True):
+        self.bus.slave(addr).send(bytes(buf))
+        self.bus.count(len(buf))
+        return len(buf)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        data = self.bus.slave(addr).read(memaddr, nbytes)
+        self.bus.count(nbytes)
+        return data
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        buf[:] = self.readfrom_mem(addr, memaddr, len(buf), addrsize)
+        return len(buf)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self.bus.slave(addr).write(memaddr, bytes(buf))
+        self.bus.count(len(buf))
+        return len(buf)
+
+
+class RTC:
+    """ Board clock: the wall clock of the host once synced or set """
+
+    def __init__(self, id=0, datetime=None, source=None):
+        self.device = current()
+        if datetime is not None:
+            self.init(datetime)
+
+    def init(self, datetime=None, source=None):
+        if datetime is None:
+            return
+        secs = calendar.timegm(tuple(datetime[:6]))
+        usecs = datetime[6] if len(datetime) > 6 and datetime[6] else 0
+        self.device.rtc_base = secs + usecs / 1000000 - self.device.sim.clock.now_us() / 1000000
+
+    def now(self):
+        t = self.device.rtc_base + self.device.sim.clock.now_us() / 1000000
+        tm = time.gmtime(t)
+        return (tm[0], tm[1], tm[2], tm[3], tm[4], tm[5], int((t % 1) * 1000000), None)
+
+    def ntp_sync(self, server, update_period=3600, backup_server=None):
+        self.device.rtc_base = time.time() - self.device.sim.clock.now_us() / 1000000
+        self.device.rtc_synced = True
+
+    def synced(self):
+        return self.device.rtc_synced
+
+
+class ADC:
+
+    ATTN_0DB = 0
+    ATTN_11DB = 3
+
+    def __init__(self, id=0, bits=12):
+        self.device = current()
+
+    def channel(self, pin, attn=ATTN_0DB):
+        return ADCChannel(self.device, pin)
+
+    def vref(self, vref=None):
+        return 1100
+
+
+class ADCChannel:
+
+    def __init__(self, device, pin):
+        self.device = device
+        self.pin = pin
+
+    def __call__(self):
+        return self.value()
+
+    def value(self):
+        # raw 12 bit value, set by the test in device.adc
+        return self.device.adc.get(self.pin, 0)
+
+    def voltage(self):
+        return self.value() * 1100 // 4095
+
+
+class UART:
+    """ Console UART, writes go to stdout and nothing is ever read """
+
+    def __init__(self, bus=0, baudrate=115200, bits=8, parity=None, stop=1, pins=None):
+        pass
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def write(self, buf):
+        sys.stdout.write(buf.decode() if isinstance(buf, (bytes, bytearray)) else buf)
+        return len(buf)
+
+    def any(self):
+        return 0
+
+    def read(self, nbytes=None):
+        return None
+
+    def readline(self):
+        return None
+
+
+class SD:
+    """ Not simulated, os.mount does not exist on the host """
+
+    def __init__(self, id=0, pins=None):
+        raise OSError('SD card not available in the simulator')
+
+
+def unique_id():
+    return current().uid
+
+
+def rng():
+    return random.getrandbits(24)
+
+
+def reset():
+    raise SystemExit('machine.reset()')
+
+
+def idle():
+    current().sim.clock.idle()
+
+
+def freq():
+    return 160000000
+
+
+def deepsleep(time_ms=None):
+    raise SystemExit('machine.deepsleep()')
+
+
+def remaining_sleep_time():
+    return 0
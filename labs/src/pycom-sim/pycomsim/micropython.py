@@ -0,0 +1,22 @@
+""" Stand-in for the micropython module """
+
+
+def const(value):
+    return value
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def opt_level(level=None):
+    return 0
+
+
+def mem_info(verbose=False):
+    pass
+
+
+def schedule(func, arg):
+    func(arg)
+    return True
@@ -0,0 +1,284 @@
+""" Stand-in for the Pycom network module: LoRa and WLAN """
+
+import collections
+import random
+import threading
+
+from .device import current
+
+
+class LoRaStats(collections.namedtuple('LoRaStats', ('rx_timestamp', 'rssi', 'snr', 'sfrx', 'sftx', 'tx_trials',
+                                                     'tx_power', 'tx_time_on_air', 'tx_counter', 'tx_frequency'))):
+    pass
+
+
+class LoRa:
+    """ The radio of the current board, attached to the simulation medium.
+    Like on the Pycom it is a singleton: LoRa() returns the radio of the
+    board, re-initialised when arguments are given. In LORAWAN mode the
+    payloads are sent as they are, there is no MAC layer and join()
+    succeeds at once. """
+
+    LORA = 0
+    LORAWAN = 1
+
+    OTAA = 0
+    ABP = 1
+
+    ALWAYS_ON = 0
+    TX_ONLY = 1
+    SLEEP = 2
+
+    BW_125KHZ = 0
+    BW_250KHZ = 1
+    BW_500KHZ = 2
+
+    CODING_4_5 = 1
+    CODING_4_6 = 2
+    CODING_4_7 = 3
+    CODING_4_8 = 4
+
+    CLASS_A = 0
+    CLASS_C = 2
+
+    EU868 = 5
+
+    RX_PACKET_EVENT = 0x01
+    TX_PACKET_EVENT = 0x02
+    TX_FAILED_EVENT = 0x04
+
+    BANDWIDTHS = {BW_125KHZ: 125000, BW_250KHZ: 250000, BW_500KHZ: 500000}
+
+    # frames waiting to be read from the socket, more are dropped
+    RX_QUEUE = 8
+
+    def __new__(cls, *args, **kwargs):
+        device = current()
+        if device.lora is None:
+            radio = object.__new__(cls)
+            radio._setup(device)
+            device.lora = radio
+        return device.lora
+
+    def __init__(self, mode=None, **kwargs):
+        if mode is not None:
+            self.init(mode, **kwargs)
+
+    def _setup(self, device):
+        self.device = device
+        self.medium = device.sim.medium
+        self.clock = device.sim.clock
+        self.lock = threading.Lock()
+        self.mode = None
+        self.freq = 868000000
+        self.spreading = 7
+        self.bw = 125000
+        self.cr = 1
+        self.preamble = 8
+        self.tx_power = 14
+        self.tx_iq = False
+        self.rx_iq = False
+        self.pmode = self.ALWAYS_ON
+        self.tuned_us = 0
+        self.tx_start = 0
+        self.tx_until = 0
+        self.tx_counter = 0
+        self.tx_time_on_air = 0
+        self.tx_frequency = 0
+
+        self.channels = {0: 868100000, 1: 868300000, 2: 868500000}
+        self.joined = False
+
+        self.trigger = 0
+        self.handler = None
+        self.arg = None
+        self._events = 0
+        self.rx_queue = collections.deque()
+        self.rx_ready = threading.Condition(self.lock)
+        self.tx_ready = threading.Event()
+        self.tx_ready.set()
+        self.last = LoRaStats(0, 0, 0.0, 0, 0, 0, 0, 0, 0, 0)
+
+    def init(self, mode, region=None, frequency=868000000, tx_power=14, bandwidth=BW_125KHZ, sf=7, preamble=8,
+             coding_rate=CODING_4_5, power_mode=ALWAYS_ON, tx_iq=False, rx_iq=None, adr=False, public=True,
+             tx_retries=1, device_class=CLASS_A):
+        self.mode = mode
+        self.freq = frequency
+        self.tx_power = tx_power
+        self.bw = self.BANDWIDTHS[bandwidth]
+        self.spreading = sf
+        self.preamble = preamble
+        self.cr = coding_rate
+        self.pmode = power_mode
+        self.tx_iq = tx_iq
+        # LoRaWAN end devices listen to the inverted downlinks
+        self.rx_iq = (mode == self.LORAWAN) if rx_iq is None else rx_iq
+        self.tuned_us = self.clock.now_us()
+        self.medium.attach(self)
+
+    def frequency(self, frequency=None):
+        if frequency is None:
+            return self.freq
+        self.freq = frequency
+        self.tuned_us = self.clock.now_us()
+
+    def sf(self, sf=None):
+        if sf is None:
+            return self.spreading
+        self.spreading = sf
+        self.tuned_us = self.clock.now_us()
+
+    def mac(self):
+        return self.device.uid[:3] + b'\xff\xfe' + self.device.uid[3:]
+
+    def power_mode(self, mode=None):
+        if mode is None:
+            return self.pmode
+        self.pmode = mode
+
+    def join(self, activation, auth, timeout=None, dr=None):
+        self.joined = True
+
+    def has_joined(self):
+        return self.joined
+
+    def add_channel(self, index, frequency, dr_min, dr_max):
+        self.channels[index] = frequency
+
+    def remove_channel(self, index):
+        self.channels.pop(index, None)
+
+    def callback(self, trigger, handler=None, arg=None):
+        self.trigger = trigger
+        self.handler = handler
+        self.arg = arg
+
+    def events(self):
+        with self.lock:
+            events = self._events
+            self._events = 0
+        return events
+
+    def stats(self):
+        return self.last
+
+    def ischannel_free(self, rssi_threshold):
+        now = self.clock.now_us()
+        with self.medium.lock:
+            return not any(t.freq == self.freq and t.start <= now < t.end for t in self.medium.recent)
+
+    def _event(self, event):
+        with self.lock:
+            self._events |= event
+        if self.handler is not None and self.trigger & event:
+            self.device.call(self.handler, self if self.arg is None else self.arg)
+
+    # medium side
+
+    def listening(self, tx):
+        return (self.mode is not None and self.pmode == self.ALWAYS_ON and self.freq == tx.freq
+                and self.spreading == tx.sf and self.bw == tx.bw and self.rx_iq == tx.iq and self.tuned_us <= tx.start)
+
+    def deliver(self, tx, rssi, snr):
+        with self.lock:
+            if len(self.rx_queue) >= self.RX_QUEUE:
+                return False
+            self.rx_queue.append((tx.data, rssi, snr, tx.sf, tx.end & 0xFFFFFFFF))
+            self.rx_ready.notify()
+        self._event(self.RX_PACKET_EVENT)
+        return True
+
+    def transmit(self, data):
+        if self.mode == self.LORAWAN:
+            self.freq = random.choice(list(self.channels.values()))
+        self.tx_ready.clear()
+        end = self.medium.transmit(self, data)
+        self.tx_counter += 1
+        self.tx_time_on_air = (end - self.tx_start) // 1000
+        self.tx_frequency = self.freq
+        return end
+
+    def tx_done(self, tx):
+        self.tx_ready.set()
+        self._event(self.TX_PACKET_EVENT)
+
+    def receive(self, bufsize, blocking, timeout):
+        with self.lock:
+            if not self.rx_queue and blocking:
+                self.rx_ready.wait(timeout)
+            if not self.rx_queue:
+                return b''
+            data, rssi, snr, sf, tmst = self.rx_queue.popleft()
+        self.last = LoRaStats(tmst, rssi, snr, sf, self.spreading, 1, self.tx_power, self.tx_time_on_air,
+                              self.tx_counter, self.tx_frequency)
+        return data[:bufsize]
+
+
+class WLAN:
+    """ WiFi station of the current board, associated to the simulation
+    access point connect_ms after connect(). It drops when the access
+    point goes down and has to connect again. """
+
+    STA = 1
+    AP = 2
+    STA_AP = 3
+
+    WEP = 1
+    WPA = 2
+    WPA2 = 3
+
+    INT_ANT = 0
+    EXT_ANT = 1
+
+    def __init__(self, id=0, mode=STA, ssid=None, auth=None, channel=1, antenna=None, power_save=False):
+        device = current()
+        self.device = device
+        self.ap = device.sim.ap
+        self.clock = device.sim.clock
+        self._mode = mode
+        self.ssid = None
+        self.joined_us = None
+        self.generation = -1
+        self.connects = 0
+        device.wlan = self
+
+    def init(self, mode=STA, ssid=None, auth=None, channel=1, antenna=None, power_save=False):
+        self.mode(mode)
+
+    def mode(self, mode=None):
+        if mode is None:
+            return self._mode
+        self._mode = mode
+        if not mode & self.STA:
+            self.joined_us = None
+
+    def connect(self, ssid, auth=None, bssid=None, timeout=None, ca_certs=None, keyfile=None, certfile=None,
+                identity=None):
+        # returns at once, isconnected() tells when it is done
+        self.connects += 1
+        self.ssid = ssid
+        if self.ap.up and (self.ap.ssid is None or self.ap.ssid == ssid):
+            self.joined_us = self.clock.now_us() + self.ap.connect_ms * 1000
+            self.generation = self.ap.generation
+        else:
+            self.joined_us = None
+
+    def disconnect(self):
+        self.joined_us = None
+
+    def isconnected(self):
+        return (self._mode & self.STA != 0 and self.joined_us is not None and self.ap.up
+                and self.generation == self.ap.generation and self.clock.now_us() >= self.joined_us)
+
+    def ifconfig(self, id=0, config=None):
+        if self.isconnected():
+            return ('127.0.0.1', '255.255.255.0', '127.0.0.1', '127.0.0.1')
+        return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+
+    def scan(self):
+        if not self.ap.up:
+            return []
+        return [(self.ap.ssid or 'pycomsim', b'\x00' * 6, self.WPA2, 1, self.ap.rssi)]
+
+    def mac(self):
+        return self.device.uid
@@ -0,0 +1,38 @@
+""" Stand-in for the pycom module """
+
+from .device import current
+
+
+def heartbeat(state=None):
+    device = current()
+    if state is None:
+        return device.heartbeat
+    device.heartbeat = bool(state)
+
+
+def rgbled(color):
+    current().rgbled = color
+
+
+def nvs_set(key, value):
+    current().nvs[key] = value
+
+
+def nvs_get(key):
+    return current().nvs.get(key)
+
+
+def nvs_erase(key):
+    current().nvs.pop(key, None)
+
+
+def nvs_erase_all():
+    current().nvs.clear()
+
+
+def wifi_on_boot(enable=None):
+    return True
+
+
+def heartbeat_on_boot(enable=None):
+    return True
@@ -0,0 +1,118 @@
+""" Virtual LoRa radio medium shared by the simulated boards """
+
+import random
+import threading
+
+# transmissions are remembered this long for the collision checks
+TX_KEEP_US = 10000000
+
+
+def airtime_us(sf, size, bw=125000, cr=1, preamble=8, header=True, crc=True):
+    # LoRa time on air (Semtech AN1200.13)
+    t_sym = (1 << sf) * 1000000 // bw
+    de = 1 if t_sym >= 16000 else 0
+    ih = 0 if header else 1
+    num = 8 * size - 4 * sf + 28 + (16 if crc else 0) - 20 * ih
+    den = 4 * (sf - 2 * de)
+    n_payload = 8 + max(((num + den - 1) // den) * (cr + 4), 0)
+    return (preamble * 4 + 17) * t_sym // 4 + n_payload * t_sym
+
+
+class Transmission:
+
+    def __init__(self, radio, data, start, end):
+        self.radio = radio
+        self.data = data
+        self.freq = radio.freq
+        self.sf = radio.spreading
+        self.bw = radio.bw
+        self.iq = radio.tx_iq
+        self.start = start
+        self.end = end
+
+
+class Medium:
+    """ Delivers each transmission, at the end of its airtime, to every
+    radio listening on the same frequency, SF, bandwidth and IQ polarity.
+    RSSI, SNR and loss probability come from the link table, or the
+    defaults. A frame overlapping another one on the same channel is lost
+    unless it is capture_db stronger, a radio does not hear while it sends. """
+
+    def __init__(self, clock, rssi=-80, snr=7.0, loss=0.0, rssi_sd=0.0, capture_db=6, seed=None):
+        self.clock = clock
+        self.rssi = rssi
+        self.snr = snr
+        self.loss = loss
+        self.rssi_sd = rssi_sd
+        self.capture_db = capture_db
+        self.random = random.Random(seed)
+
+        self.links = {}
+        self.radios = []
+        self.recent = []
+        self.lock = threading.Lock()
+
+        self.stats = {"sent": 0, "delivered": 0, "lost": 0, "collisions": 0,
+                      "half_duplex": 0, "rx_overflow": 0}
+
+    def link(self, tx, rx, rssi=None, snr=None, loss=None):
+        # tx and rx are device names, the link is one way
+        self.links[(tx, rx)] = (self.rssi if rssi is None else rssi, self.snr if snr is None else snr,
+                                self.loss if loss is None else loss)
+
+    def _link(self, tx_radio, rx_radio):
+        return self.links.get((tx_radio.device.name, rx_radio.device.name), (self.rssi, self.snr, self.loss))
+
+    def attach(self, radio):
+        with self.lock:
+            if radio not in self.radios:
+                self.radios.append(radio)
+
+    def detach(self, radio):
+        with self.lock:
+            if radio in self.radios:
+                self.radios.remove(radio)
+
+    def transmit(self, radio, data):
+        # returns the end of the transmission, on the simulation clock
+        start = max(self.clock.now_us(), radio.tx_until)
+        end = start + airtime_us(radio.spreading, len(data), radio.bw, radio.cr, radio.preamble, crc=not radio.tx_iq)
+        tx = Transmission(radio, bytes(data), start, end)
+        radio.tx_start = start
+        radio.tx_until = end
+        with self.lock:
+            self.recent.append(tx)
+            self.stats["sent"] += 1
+        self.clock.schedule(end, lambda: self._end(tx))
+        return end
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _end(self, tx):
+        with self.lock:
+            self.recent = [t for t in self.recent if t.end > tx.end - TX_KEEP_US]
+            overlapping = [t for t in self.recent if t is not tx and t.start < tx.end and t.end > tx.start
+                           and t.freq == tx.freq and t.sf == tx.sf]
+            radios = list(self.radios)
+        for rx in radios:
+            if rx is tx.radio or not rx.listening(tx):
+                continue
+            if rx.tx_start < tx.end and rx.tx_until > tx.start:
+                self._count("half_duplex")
+                continue
+            rssi, snr, loss = self._link(tx.radio, rx)
+            if loss and self.random.random() < loss:
+                self._count("lost")
+                continue
+            if any(t.radio is not rx and self._link(t.radio, rx)[0] > rssi - self.capture_db for t in overlapping):
+                self._count("collisions")
+                continue
+            if self.rssi_sd:
+                rssi += self.random.gauss(0, self.rssi_sd)
+            if rx.deliver(tx, int(round(rssi)), snr):
+                self._count("delivered")
+            else:
+                self._count("rx_overflow")
+        tx.radio.tx_done(tx)
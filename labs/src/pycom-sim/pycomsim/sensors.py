@@ -0,0 +1,384 @@
+""" I2C models of the Pysense board and of its sensors """
+
+import errno
+
+from .i2c import RegisterDevice
+
+PYSENSE_ADDR = 0x08
+LIS2HH12_ADDR = 0x1E
+LTR329_ADDR = 0x29
+MPL3115A2_ADDR = 0x60
+SI7006A20_ADDR = 0x40
+
+
+class PysenseBoard(RegisterDevice):
+    """ The PIC of the Pysense: PEEK/POKE/MAGIC commands on its memory,
+    versions, and the battery ADC. A read returns the status byte, 0xFF
+    once the command is done, followed by the answer. """
+
+    CMD_PEEK = 0x00
+    CMD_POKE = 0x01
+    CMD_MAGIC = 0x02
+    CMD_HW_VER = 0x10
+    CMD_FW_VER = 0x11
+    CMD_PROD_ID = 0x12
+
+    ADCON0_ADDR = 0x9D
+    ADRESL_ADDR = 0x9B
+    ADRESH_ADDR = 0x9C
+    PORTA_ADDR = 0x00C
+
+    def __init__(self, battery=4.1, hw_version=3, fw_version=0x0D, product_id=0xEF38):
+        RegisterDevice.__init__(self)
+        self.memory = {}
+        self.battery = battery
+        self.button = False
+        self.versions = {self.CMD_HW_VER: hw_version, self.CMD_FW_VER: fw_version, self.CMD_PROD_ID: product_id}
+        self.answer = b'\xff'
+
+    def _peek(self, addr):
+        if addr == self.PORTA_ADDR:
+            # RA3 is the button, pulled up
+            return self.memory.get(addr, 0) & ~0x08 | (0 if self.button else 0x08)
+        return self.memory.get(addr, 0)
+
+    def _poke(self, addr, value):
+        if addr == self.ADCON0_ADDR and value & 0x02:
+            # conversion started, it is done immediately
+            adc = int((self.battery - 0.01) * 180 * 1023 / (3.3 * 280))
+            adc = max(0, min(adc, 1023))
+            self.memory[self.ADRESH_ADDR] = adc >> 2
+            self.memory[self.ADRESL_ADDR] = (adc & 0x03) << 6
+            value &= ~0x02
+        self.memory[addr] = value & 0xFF
+
+    def send(self, data):
+        cmd = data[0]
+        addr = data[1] | (data[2] << 8) if len(data) >= 3 else 0
+        answer = b''
+        if cmd == self.CMD_PEEK:
+            answer = bytes([self._peek(addr)])
+        elif cmd == self.CMD_POKE:
+            self._poke(addr, data[3])
+        elif cmd == self.CMD_MAGIC:
+            value = ((self._peek(addr) & data[3]) | data[4]) ^ data[5]
+            self._poke(addr, value)
+            answer = bytes([self._peek(addr)])
+        elif cmd in self.versions:
+            answer = self.versions[cmd].to_bytes(2, 'little')
+        self.answer = b'\xff' + answer
+
+    def receive(self, n):
+        return (self.answer + bytes(n))[:n]
+
+
+class LIS2HH12Model(RegisterDevice):
+    """ Accelerometer, set_acceleration takes g on each axis """
+
+    WHO_AM_I = 0x0F
+    CTRL1 = 0x20
+    CTRL4 = 0x23
+    STATUS = 0x27
+    OUT_X_L = 0x28
+    # mg per LSB for the full-scale settings of CTRL4
+    SENSITIVITY = {0: 0.061, 2: 0.122, 3: 0.244}
+
+    def __init__(self):
+        RegisterDevice.__init__(self, {self.WHO_AM_I: 0x41, self.CTRL1: 0x07, self.CTRL4: 0x04})
+        self.g = (0.0, 0.0, 1.0)
+
+    def set_acceleration(self, x, y, z):
+        self.g = (x, y, z)
+
+    def on_read(self, reg, n):
+        if reg + n <= self.STATUS or reg > self.OUT_X_L + 5:
+            return
+        mg = self.SENSITIVITY.get((self.regs[self.CTRL4] >> 4) & 0x03, 0.061)
+        for i, g in enumerate(self.g):
+            raw = max(-32768, min(int(round(g * 1000 / mg)), 32767))
+            self.set_word(self.OUT_X_L + 2 * i, raw)
+        self.regs[self.STATUS] = 0x0F if self.regs[self.CTRL1] & 0x70 else 0
+
+
+class LTR329Model(RegisterDevice):
+    """ Ambient light sensor. set_counts takes the channel counts at gain
+    1x and 100 ms, the registers scale them with the configured gain and
+    integration time and saturate at 65535. With a clock, a new gain
+    reaches the data one measurement period after it is written, and
+    ALS_STATUS gives the gain of the data. """
+
+    CONTR = 0x80
+    MEAS_RATE = 0x85
+    PART_ID = 0x86
+    MANUFAC_ID = 0x87
+    DATA_CH1_0 = 0x88
+    STATUS = 0x8C
+    GAINS = {0: 1, 1: 2, 2: 4, 3: 8, 6: 48, 7: 96}
+    INTEGRATION_MS = {0: 100, 1: 50, 2: 200, 3: 400, 4: 150, 5: 250, 6: 300, 7: 350}
+    REPEAT_MS = (50, 100, 200, 500, 1000, 2000, 2000, 2000)
+
+    def __init__(self, clock=None):
+        RegisterDevice.__init__(self, {self.MEAS_RATE: 0x03, self.PART_ID: 0xA0, self.MANUFAC_ID: 0x05})
+        # office lighting
+        self.ch0 = 300
+        self.ch1 = 150
+        self.clock = clock
+        # gain bits of the data, and when the gain of CONTR reaches it
+        self.data_gain = 0
+        self.gain_due_us = 0
+
+    def set_counts(self, ch0, ch1):
+        self.ch0 = ch0
+        self.ch1 = ch1
+
+    def gain(self):
+        return self.GAINS.get((self.regs[self.CONTR] >> 2) & 0x07, 1)
+
+    def period_ms(self):
+        return max(self.REPEAT_MS[self.regs[self.MEAS_RATE] & 0x07], self.integration_ms())
+
+    def on_write(self, reg, data):
+        if self.clock is not None and reg <= self.CONTR < reg + len(data):
+            self.gain_due_us = self.clock.now_us() + self.period_ms() * 1000
+
+    def integration_ms(self):
+        return self.INTEGRATION_MS[(self.regs[self.MEAS_RATE] >> 3) & 0x07]
+
+    def on_read(self, reg, n):
+        if reg + n <= self.DATA_CH1_0 or reg > self.STATUS:
+            return
+        if self.clock is None or self.clock.now_us() >= self.gain_due_us:
+            self.data_gain = (self.regs[self.CONTR] >> 2) & 0x07
+        gain_bits = self.data_gain
+        scale = self.GAINS.get(gain_bits, 1) * self.integration_ms() / 100
+        ch0 = min(int(self.ch0 * scale), 65535)
+        ch1 = min(int(self.ch1 * scale), 65535)
+        self.set_word(self.DATA_CH1_0, ch1)
+        self.set_word(self.DATA_CH1_0 + 2, ch0)
+        invalid = 0x80 if ch0 == 65535 or ch1 == 65535 else 0
+        self.regs[self.STATUS] = invalid | (gain_bits << 4) | (0x04 if self.regs[self.CONTR] & 0x01 else 0)
+
+
+class MPL3115A2Model(RegisterDevice):
+    """ Pressure / altitude / temperature sensor. Data is ready as soon
+    as the sensor is active (CTRL_REG1 SBYB) or a one-shot is requested.
+    Given a clock, an active sensor also samples every 2^ST s of
+    CTRL_REG2 into the data registers and the FIFO, and drives int1, a
+    pin state of the board, with the enabled interrupt sources. """
+
+    STATUS = 0x00
+    OUT_P_MSB = 0x01
+    OUT_T_MSB = 0x04
+    DR_STATUS = 0x06
+    WHO_AM_I = 0x0C
+    F_STATUS = 0x0D
+    F_DATA = 0x0E
+    F_SETUP = 0x0F
+    INT_SOURCE = 0x12
+    CTRL_REG1 = 0x26
+    CTRL_REG2 = 0x27
+    CTRL_REG3 = 0x28
+    CTRL_REG4 = 0x29
+    FIFO_SIZE = 32
+    SRC_DRDY = 0x80
+    SRC_FIFO = 0x40
+
+    def __init__(self, altitude=120.0, pressure=100000.0, temperature=21.5, clock=None, int1=None):
+        RegisterDevice.__init__(self, {self.WHO_AM_I: 0xC4})
+        self.altitude = altitude
+        self.pressure = pressure
+        self.temperature = temperature
+        self.clock = clock
+        self.int1 = int1
+        self.fifo = []
+        self.alarm = None
+
+    def set(self, altitude=None, pressure=None, temperature=None):
+        if altitude is not None:
+            self.altitude = altitude
+        if pressure is not None:
+            self.pressure = pressure
+        if temperature is not None:
+            self.temperature = temperature
+        self._sample()
+
+    def _sample(self):
+        ctrl = self.regs[self.CTRL_REG1]
+        if not ctrl & 0x03:
+            return
+        if ctrl & 0x80:
+            # Q16.4 meters
+            raw = int(round(self.altitude * 16)) & 0xFFFFF
+        else:
+            # Q18.2 Pa
+            raw = int(round(self.pressure * 4)) & 0xFFFFF
+        self.set_word(self.OUT_P_MSB, raw << 4, 3, little=False)
+        # Q8.4 degrees
+        self.set_word(self.OUT_T_MSB, (int(round(self.temperature * 16)) & 0xFFF) << 4, 2, little=False)
+        self.regs[self.STATUS] = 0x0E
+        self.regs[self.DR_STATUS] = 0x0E
+        self.regs[self.INT_SOURCE] |= self.SRC_DRDY
+        # the one-shot bit clears itself
+        self.regs[self.CTRL_REG1] = ctrl & ~0x02
+
+    def _push(self):
+        # the sample just taken into the FIFO, by the F_MODE of F_SETUP
+        mode = self.regs[self.F_SETUP] >> 6
+        if not mode:
+            return
+        overflow = len(self.fifo) >= self.FIFO_SIZE
+        if overflow:
+            if mode == 2:
+                # fill mode stops accepting samples
+                self.regs[self.F_STATUS] |= 0x80
+                return
+            self.fifo.pop(0)
+        self.fifo.append(bytes(self.regs[self.OUT_P_MSB:self.OUT_P_MSB + 5]))
+        self._fifo_status(overflow)
+
+    def _fifo_status(self, overflow=False):
+        watermark = self.regs[self.F_SETUP] & 0x3F
+        flags = self.regs[self.F_STATUS] & 0xC0
+        if overflow:
+            flags |= 0x80
+        if watermark and len(self.fifo) >= watermark:
+            flags |= 0x40
+        self.regs[self.F_STATUS] = flags | len(self.fifo)
+        if flags:
+            self.regs[self.INT_SOURCE] |= self.SRC_FIFO
+
+    def _interrupt(self):
+        # INT1 low while an enabled source is set (IPOL1 0)
+        if self.int1 is not None:
+            active = self.regs[self.INT_SOURCE] & self.regs[self.CTRL_REG4]
+            self.int1.drive(not active if not self.regs[self.CTRL_REG3] & 0x20 else active)
+
+    def _tick(self):
+        self.alarm = None
+        if not self.regs[self.CTRL_REG1] & 0x01:
+            return
+        self._sample()
+        self._push()
+        self._interrupt()
+        self._schedule()
+
+    def _schedule(self):
+        if self.clock is None:
+            return
+        if self.alarm is not None:
+            self.clock.cancel(self.alarm)
+            self.alarm = None
+        if self.regs[self.CTRL_REG1] & 0x01:
+            period = 1000000 << (self.regs[self.CTRL_REG2] & 0x0F)
+            self.alarm = self.clock.schedule(self.clock.now_us() + period, self._tick)
+
+    def read(self, reg, n):
+        if reg == self.F_DATA and self.regs[self.F_SETUP] >> 6:
+            # the FIFO does not increment the register pointer
+            data = b''.join(self.fifo[:n // 5]) + bytes(n % 5)
+            del self.fifo[:n // 5]
+            self.regs[self.F_STATUS] &= 0xC0
+            self._fifo_status()
+            return data
+        data = RegisterDevice.read(self, reg, n)
+        if reg <= self.F_STATUS < reg + n:
+            # reading F_STATUS clears the FIFO flags and the interrupt
+            self.regs[self.F_STATUS] &= 0x3F
+            self.regs[self.INT_SOURCE] &= ~self.SRC_FIFO
+        if reg < self.OUT_T_MSB + 2 and reg + n > self.OUT_P_MSB:
+            self.regs[self.INT_SOURCE] &= ~self.SRC_DRDY
+        self._interrupt()
+        return data
+
+    def on_write(self, reg, data):
+        if reg <= self.F_SETUP < reg + len(data) and not self.regs[self.F_SETUP] >> 6:
+            self.fifo = []
+            self.regs[self.F_STATUS] = 0
+        if reg <= self.CTRL_REG1 < reg + len(data):
+            if self.regs[self.CTRL_REG1] & 0x04:
+                # software reset, back to the defaults
+                self.regs[:] = bytes(self.size)
+                self.regs[self.WHO_AM_I] = 0xC4
+                self.fifo = []
+                self._schedule()
+                return
+            self._sample()
+        if reg <= self.CTRL_REG2 < reg + len(data) or reg <= self.CTRL_REG1 < reg + len(data):
+            self._schedule()
+        self._interrupt()
+
+
+class SI7006A20Model(RegisterDevice):
+    """ Humidity and temperature sensor, command based. A No Hold Master
+    measurement is not acknowledged until the conversion time elapsed on
+    the simulation clock, when one is given. """
+
+    MEASURE_RH_HOLD = 0xE5
+    MEASURE_RH = 0xF5
+    MEASURE_T_HOLD = 0xE3
+    MEASURE_T = 0xF3
+    READ_T_FROM_RH = 0xE0
+    RESET = 0xFE
+    # conversion times in us, 12 bit RH includes the temperature
+    RH_US = 12000 + 7000
+    T_US = 7000
+
+    def __init__(self, humidity=45.0, temperature=21.5, clock=None):
+        RegisterDevice.__init__(self)
+        self.humidity = humidity
+        self.temperature = temperature
+        self.clock = clock
+        self.result = b''
+        self.ready_us = 0
+        self.last_t = b''
+
+    def _now(self):
+        return self.clock.now_us() if self.clock is not None else 0
+
+    @staticmethod
+    def crc8(data):
+        crc = 0
+        for b in data:
+            crc ^= b
+            for i in range(8):
+                crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        return crc
+
+    def _code(self, value):
+        code = int(value) & 0xFFFC
+        data = bytes([code >> 8, code & 0xFF])
+        return data + bytes([self.crc8(data)])
+
+    def send(self, data):
+        cmd = data[0]
+        t_code = self._code((self.temperature + 46.85) * 65536 / 175.72)
+        if cmd in (self.MEASURE_RH, self.MEASURE_RH_HOLD):
+            self.result = self._code((self.humidity + 6) * 65536 / 125)
+            self.last_t = t_code
+            conversion = self.RH_US
+        elif cmd in (self.MEASURE_T, self.MEASURE_T_HOLD):
+            self.result = t_code
+            conversion = self.T_US
+        elif cmd == self.READ_T_FROM_RH:
+            self.result = self.last_t[:2]
+            conversion = 0
+        else:
+            self.result = b''
+            conversion = 0
+        # hold master measurements stretch the clock instead of NACKing
+        hold = cmd in (self.MEASURE_RH_HOLD, self.MEASURE_T_HOLD)
+        self.ready_us = self._now() + (0 if hold else conversion)
+
+    def receive(self, n):
+        if self._now() < self.ready_us:
+            raise OSError(errno.EIO, 'I2C bus error')
+        return (self.result + bytes(n))[:n]
+
+
+def attach_pysense(bus, clock=None):
+    # the board and its 4 sensors on bus, returns the models by name
+    return {"pysense": bus.attach(PYSENSE_ADDR, PysenseBoard()),
+            "accelerometer": bus.attach(LIS2HH12_ADDR, LIS2HH12Model()),
+            "light": bus.attach(LTR329_ADDR, LTR329Model(clock=clock)),
+            "pressure": bus.attach(MPL3115A2_ADDR, MPL3115A2Model(clock=clock)),
+            "humidity": bus.attach(SI7006A20_ADDR, SI7006A20Model(clock=clock))}
@@ -0,0 +1,99 @@
+""" AF_LORA sockets and the WiFi aware IP sockets of the simulator """
+
+import errno
+import socket
+
+from .device import current
+from .network import LoRa
+
+AF_LORA = 160
+SOL_LORA = 0x0FFFF
+SO_CONFIRMED = 0x01
+SO_DR = 0x02
+
+_socket = socket.socket
+
+
+class LoRaSocket:
+    """ Raw socket on the radio of the board that created it """
+
+    def __init__(self, family=AF_LORA, type=socket.SOCK_RAW, proto=0):
+        self.device = current()
+        self.radio = self.device.lora if self.device.lora is not None else self.device.call(LoRa)
+        self.blocking = True
+        self.timeout = None
+
+    def setblocking(self, flag):
+        self.blocking = bool(flag)
+        self.timeout = None
+
+    def settimeout(self, value):
+        self.blocking = value is None or value > 0
+        self.timeout = value
+
+    def setsockopt(self, level, optname, value):
+        if level == SOL_LORA and optname == SO_DR:
+            # EU868, DR0 is SF12 and DR5 SF7
+            self.radio.spreading = 12 - value
+
+    def bind(self, port):
+        pass
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        end = self.radio.transmit(data)
+        if self.blocking:
+            clock = self.radio.clock
+            if clock.virtual:
+                clock.advance(max(end - clock.now_us(), 0))
+            else:
+                self.radio.tx_ready.wait()
+        return len(data)
+
+    def recv(self, bufsize):
+        return self.radio.receive(bufsize, self.blocking, self.timeout)
+
+    def close(self):
+        pass
+
+
+def _check_wifi():
+    # IP traffic of a board whose WLAN is not connected fails like on the device
+    device = current()
+    if device.wlan is not None and not device.wlan.isconnected():
+        raise OSError(errno.EHOSTUNREACH, 'Host is unreachable')
+
+
+class SimSocket(_socket):
+    """ socket.socket replacement: AF_LORA gives a LoRaSocket, the other
+    families a regular socket that fails while the board WiFi is down """
+
+    def __new__(cls, family=-1, type=-1, proto=-1, fileno=None):
+        if family == AF_LORA:
+            return LoRaSocket(family, type, proto)
+        return _socket.__new__(cls, family, type, proto, fileno)
+
+    def connect(self, address):
+        _check_wifi()
+        return _socket.connect(self, address)
+
+    def send(self, data, flags=0):
+        _check_wifi()
+        return _socket.send(self, data, flags)
+
+    def sendall(self, data, flags=0):
+        _check_wifi()
+        return _socket.sendall(self, data, flags)
+
+    def sendto(self, data, *args):
+        _check_wifi()
+        return _socket.sendto(self, data, *args)
+
+
+def patch():
+    socket.AF_LORA = AF_LORA
+    socket.SOL_LORA = SOL_LORA
+    socket.SO_CONFIRMED = SO_CONFIRMED
+    socket.SO_DR = SO_DR
+    socket.socket = SimSocket
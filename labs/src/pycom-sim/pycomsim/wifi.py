@@ -0,0 +1,49 @@
+""" Simulated WiFi network the WLAN stations join """
+
+
+class AccessPoint:
+    """ The network every simulated station joins after connect_ms. When
+    it goes down the stations drop and must connect again, like a real
+    association. flap() takes it down and up periodically. """
+
+    def __init__(self, clock, ssid=None, connect_ms=500, rssi=-60):
+        self.clock = clock
+        # None accepts any SSID
+        self.ssid = ssid
+        self.connect_ms = connect_ms
+        self.rssi = rssi
+        self.up = True
+        # bumped at every outage, a station is associated to one generation
+        self.generation = 0
+        self.outages = 0
+        self._flap = None
+
+    def set_up(self, up):
+        if self.up and not up:
+            self.generation += 1
+            self.outages += 1
+        self.up = up
+
+    def flap(self, down_s, up_s, count=None):
+        # goes down after up_s for down_s, count times or forever
+        self.stop_flapping()
+        state = {"left": count}
+
+        def go_down():
+            if state["left"] is not None:
+                if state["left"] <= 0:
+                    return
+                state["left"] -= 1
+            self.set_up(False)
+            self._flap = self.clock.schedule(self.clock.now_us() + int(down_s * 1000000), go_up)
+
+        def go_up():
+            self.set_up(True)
+            self._flap = self.clock.schedule(self.clock.now_us() + int(up_s * 1000000), go_down)
+
+        self._flap = self.clock.schedule(self.clock.now_us() + int(up_s * 1000000), go_down)
+
+    def stop_flapping(self):
+        if self._flap is not None:
+            self.clock.cancel(self._flap)
+            self._flap = None
@@ -1,5 +1,10 @@
+from array import array
+import machine
+import micropython
 import time
 
+from i2cdevice import I2CDevice
+
 class MPL3115A2exception(Exception):
     pass
 
@@ -17,7 +22,7 @@ class MPL3115A2:
     MPL3115_WHO_AM_I            = const(0x0c)
     MPL3115_FIFO_STATUS         = const(0x0d)
     MPL3115_FIFO_DATA           = const(0x0e)
-    MPL3115_FIFO_SETUP          = const(0x0e)
+    MPL3115_FIFO_SETUP          = const(0x0f)
     MPL3115_TIME_DELAY          = const(0x10)
     MPL3115_SYS_MODE            = const(0x11)
     MPL3115_INT_SORCE           = const(0x12)
@@ -42,18 +47,56 @@ class MPL3115A2:
     ALTITUDE		            = const(0)
     PRESSURE		            = const(1)
 
-    def __init__(self, pysense=None, sda='P22', scl='P21'):
+    # FIFO: 32 samples of OUT_P and OUT_T, F_SETUP mode and F_STATUS flags
+    FIFO_SAMPLES                = const(32)
+    SAMPLE_LEN                  = const(5)
+    F_MODE_CIRCULAR             = const(0x40)
+    F_CNT_MASK                  = const(0x3f)
+    F_OVF                       = const(0x80)
+    # CTRL_REG4 enables and CTRL_REG5 routes to INT1, INT_SOURCE flags
+    INT_DRDY                    = const(0x80)
+    INT_FIFO                    = const(0x40)
+    # polling interval of STATUS while the first sample is taken
+    POLL_MS                     = const(10)
+    # raw units per unit: altitude Q16.4 m, pressure Q18.2 Pa, temperature Q8.4 C
+    ALT_SCALE                   = const(16)
+    PRES_SCALE                  = const(4)
+    TEMP_SCALE                  = const(16)
+    # CTRL_REG1 altimeter mode bit
+    CTRL_ALT                    = const(0x80)
+
+    def __init__(self, pysense=None, sda='P22', scl='P21', mode=ALTITUDE):
         if pysense is not None:
             self.i2c = pysense.i2c
         else:
             from machine import I2C
             self.i2c = I2C(0, mode=I2C.MASTER, pins=(sda, scl))
 
+        self.dev = I2CDevice(self.i2c, MPL3115_I2CADDR)
         self.STA_reg = bytearray(1)
+        # OUT_P MSB, CSB, LSB then OUT_T MSB, LSB
+        self.data = bytearray(5)
+        self.p_data = memoryview(self.data)[0:3]
+        self.t_data = memoryview(self.data)[3:5]
+        self.fifo = bytearray(FIFO_SAMPLES * SAMPLE_LEN)
+        # decoded FIFO samples of the last read_fifo()
+        self.samples = array('l', [0] * (2 * FIFO_SAMPLES))
+        # raw pressure and temperature of the last read(raw=True)
+        self.raw = array('l', [0, 0])
+        self.mode = mode
+
+        # interrupt driven sampling, see start_fifo and start_drdy
+        self.source = 0
+        self.int_pin = None
+        self.handler = None
+        self.pending = False
+        self.period_ms = 1000
+        self.overflows = 0
 
-        self.i2c.writeto_mem(MPL3115_I2CADDR, MPL3115_CTRL_REG1, bytes([0xB8]))
-        self.i2c.writeto_mem(MPL3115_I2CADDR, MPL3115_PT_DATA_CFG, bytes([0x07]))
-        self.i2c.writeto_mem(MPL3115_I2CADDR, MPL3115_CTRL_REG1, bytes([0xB9]))
+        alt = CTRL_ALT if mode == ALTITUDE else 0
+        self.dev.write_u8(MPL3115_CTRL_REG1, 0x38 | alt)
+        self.dev.write_u8(MPL3115_PT_DATA_CFG, 0x07)
+        self.dev.write_u8(MPL3115_CTRL_REG1, 0x39 | alt)
 
         if self._read_status():
             pass
@@ -63,51 +106,173 @@ class MPL3115A2:
     def _read_status(self):
         while True:
 
-            self.i2c.readfrom_mem_into(MPL3115_I2CADDR, MPL3115_STATUS, self.STA_reg)
+            self.dev.read_into(MPL3115_STATUS, self.STA_reg)
 
             if(self.STA_reg[0] == 0):
-                time.sleep(0.01)
+                time.sleep_ms(POLL_MS)
                 pass
             elif(self.STA_reg[0] & 0x04) == 4:
                 return True
             else:
                 return False
 
-    def _fixed_decimal(self, frac_value):
-        fixed_decimal = 0
+    def read(self, raw=False):
+        # altitude and temperature in one burst from OUT_P_MSB. raw returns
+        # self.raw, overwritten by the next read, in the units of decode()
+        self.pending = False
+        self.dev.read_into(MPL3115_PRESSURE_DATA_MSB, self.data)
+        if raw:
+            return self.decode(self.data, 1, self.raw)
+        return (self._alt(), self._temp())
+
+    def start_fifo(self, step=0, watermark=24, int_pin=None, handler=None):
+        # samples every 2**step s into the FIFO, which keeps the last 32.
+        # INT1 goes low with watermark samples in, see _interrupts
+        self._standby()
+        self.dev.write_u8(MPL3115_CTRL_REG2, step & 0x0f)
+        self.dev.write_u8(MPL3115_FIFO_SETUP, F_MODE_CIRCULAR | (watermark & F_CNT_MASK))
+        self._interrupts(INT_FIFO, int_pin, handler)
+        self.period_ms = 1000 << step
+        self._active()
+
+    def start_drdy(self, step=0, int_pin=None, handler=None):
+        # one sample every 2**step s, INT1 low until it is read
+        self._standby()
+        self.dev.write_u8(MPL3115_CTRL_REG2, step & 0x0f)
+        self.dev.write_u8(MPL3115_FIFO_SETUP, 0)
+        self._interrupts(INT_DRDY, int_pin, handler)
+        self.period_ms = 1000 << step
+        self._active()
+
+    def stop(self):
+        # back to polling, the FIFO and the interrupts off
+        self._standby()
+        self.dev.write_u8(MPL3115_CTRL_REG4, 0)
+        self.dev.write_u8(MPL3115_FIFO_SETUP, 0)
+        self.dev.write_u8(MPL3115_CTRL_REG2, 0)
+        if self.int_pin is not None:
+            self.int_pin.callback(machine.Pin.IRQ_FALLING, None)
+        self.source = 0
+        self.int_pin = None
+        self.period_ms = 1000
+        self._active()
 
-        for x in range(2,len(bin(frac_value))):
-            fixed_decimal += int(bin(frac_value)[x])*(2**(-(x-1)))
+    def set_mode(self, mode):
+        # ALTITUDE or PRESSURE for the next samples, the ones already in
+        # the FIFO are to be read before
+        self._standby()
+        self.dev.update_u8(MPL3115_CTRL_REG1, CTRL_ALT, CTRL_ALT if mode == ALTITUDE else 0)
+        self.mode = mode
+        self._active()
 
-        return fixed_decimal
+    def _standby(self):
+        self.dev.update_u8(MPL3115_CTRL_REG1, 0x01, 0)
 
-    def alt(self):
-        OUT_P_MSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB,1)
-        OUT_P_CSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_CSB,1)
-        OUT_P_LSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_LSB,1)
-        OUT_P_ALL = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB,5)
+    def _active(self):
+        self.dev.update_u8(MPL3115_CTRL_REG1, 0, 0x01)
+
+    def _interrupts(self, source, int_pin, handler):
+        # source on INT1, active low push-pull. int_pin is the pin wired
+        # to INT1, the handler is scheduled with the driver as argument.
+        # Without a pin, INT_SOURCE is polled instead.
+        self.source = source
+        self.handler = handler
+        self.pending = False
+        self.dev.write_u8(MPL3115_CTRL_REG3, 0)
+        self.dev.write_u8(MPL3115_CTRL_REG5, source)
+        self.dev.write_u8(MPL3115_CTRL_REG4, source)
+        if int_pin is not None:
+            self.int_pin = machine.Pin(int_pin, mode=machine.Pin.IN, pull=machine.Pin.PULL_UP)
+            self.int_pin.callback(machine.Pin.IRQ_FALLING, self._irq)
+
+    def _irq(self, pin):
+        self.pending = True
+        if self.handler is not None:
+            micropython.schedule(self.handler, self)
+
+    def ready(self):
+        # the interrupt source is set: FIFO at its watermark, or new data
+        if self.int_pin is not None:
+            return self.pending or self.int_pin() == 0
+        return (self.dev.read_u8(MPL3115_INT_SORCE) & self.source) != 0
+
+    def wait(self, timeout_ms=None):
+        # idles until ready, False on timeout. With an interrupt pin the
+        # CPU sleeps until it fires, else INT_SOURCE is read once per sample
+        start = time.ticks_ms()
+        while not self.ready():
+            if timeout_ms is not None and time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+                return False
+            if self.int_pin is not None:
+                machine.idle()
+            else:
+                time.sleep_ms(self.period_ms)
+        return True
 
-        pres_frac = OUT_P_LSB[0] >> 4
-        pres_int = (OUT_P_MSB[0] << 8)|(OUT_P_CSB[0])
+    def read_fifo(self):
+        # samples in the FIFO, oldest first, into self.samples as pairs of
+        # raw pressure and temperature, see decode(), overwritten by the
+        # next call. Returns the number of samples. Two transactions.
+        return self.read_fifo_into(self.samples)
 
-        if (pres_int & (1 << (16 - 1))) != 0: # if sign bit is set e.g., 8bit: 128-255
-            pres_int = pres_int - (1 << 16)
+    def read_fifo_into(self, out):
+        # as read_fifo into out, of 2 * FIFO_SAMPLES items at least
+        self.pending = False
+        status = self.dev.read_u8(MPL3115_FIFO_STATUS)
+        if status & F_OVF:
+            self.overflows += 1
+        n = status & F_CNT_MASK
+        if n:
+            self.dev.read_into(MPL3115_FIFO_DATA, memoryview(self.fifo)[:n * SAMPLE_LEN])
+            self.decode(self.fifo, n, out)
+        return n
 
-        pres_frac = self._fixed_decimal(pres_frac)
+    def decode(self, buf, n, out):
+        # n samples of OUT_P then OUT_T packed in buf into out, as pairs of
+        # raw ints: altitude m * 16 (Q16.4) or pressure Pa * 4 (Q18.2), and
+        # degrees C * 16 (Q8.4). Shifts only, see scale() for the units
+        signed = self.mode == ALTITUDE
+        for i in range(n):
+            j = i * SAMPLE_LEN
+            # 20 bits left aligned in MSB, CSB, LSB, two's complement in altitude
+            p = (buf[j] << 12) | (buf[j + 1] << 4) | (buf[j + 2] >> 4)
+            if signed and p & 0x80000:
+                p -= 0x100000
+            # 12 bits left aligned in MSB, LSB, two's complement
+            t = (buf[j + 3] << 4) | (buf[j + 4] >> 4)
+            if t & 0x800:
+                t -= 0x1000
+            out[2 * i] = p
+            out[2 * i + 1] = t
+        return out
 
-        return(float(str(pres_int)+str(pres_frac)[1:]))
+    def scale(self):
+        # raw pressure and temperature units per m or Pa, and per degree C
+        return (ALT_SCALE if self.mode == ALTITUDE else PRES_SCALE, TEMP_SCALE)
 
-    def temp(self):
-        OUT_T_MSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_TEMP_DATA_MSB,1)
-        OUT_T_LSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_TEMP_DATA_LSB,1)
+    def alt(self, raw=False):
+        self.dev.read_into(MPL3115_PRESSURE_DATA_MSB, self.p_data)
+        return self._p() if raw else self._alt()
 
-        temp_frac = OUT_T_LSB[0] >> 4
+    def temp(self, raw=False):
+        self.dev.read_into(MPL3115_TEMP_DATA_MSB, self.t_data)
+        return self._t() if raw else self._temp()
 
-        temp_int = OUT_T_MSB[0]
+    def _p(self):
+        data = self.data
+        p = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
+        if self.mode == ALTITUDE and p & 0x80000:
+            p -= 0x100000
+        return p
 
-        if (temp_int & (1 << (8 - 1))) != 0: # if sign bit is set e.g., 8bit: 128-255
-            temp_int = temp_int - (1 << 8)
+    def _t(self):
+        t = (self.data[3] << 4) | (self.data[4] >> 4)
+        if t & 0x800:
+            t -= 0x1000
+        return t
 
-        temp_frac = self._fixed_decimal(temp_frac)
+    def _alt(self):
+        return self._p() / (ALT_SCALE if self.mode == ALTITUDE else PRES_SCALE)
 
-        return(float(str(temp_int)+str(temp_frac)[1:]))
+    def _temp(self):
+        return self._t() / TEMP_SCALE
@@ -0,0 +1,62 @@
+import time
+
+class I2CDevice:
+    """ Register access to one device of the Pysense I2C bus. Multi-byte
+    reads are single auto-increment bursts into the caller's bytearray,
+    so a read costs one transaction and no allocation. The transactions
+    and the time spent in them are counted, see report(). """
+
+    def __init__(self, i2c, addr):
+        self.i2c = i2c
+        self.addr = addr
+        self.byte = bytearray(1)
+        self.transactions = 0
+        self.bus_us = 0
+
+    def _done(self, start):
+        self.transactions += 1
+        self.bus_us += time.ticks_diff(time.ticks_us(), start)
+
+    def read_into(self, reg, buf):
+        # len(buf) registers from reg, in one transaction
+        start = time.ticks_us()
+        self.i2c.readfrom_mem_into(self.addr, reg, buf)
+        self._done(start)
+        return buf
+
+    def read_u8(self, reg):
+        return self.read_into(reg, self.byte)[0]
+
+    def write_u8(self, reg, value):
+        self.byte[0] = value
+        start = time.ticks_us()
+        self.i2c.writeto_mem(self.addr, reg, self.byte)
+        self._done(start)
+
+    def update_u8(self, reg, clear, bits):
+        # read-modify-write of the bits of a register
+        self.write_u8(reg, (self.read_u8(reg) & ~clear) | bits)
+
+    def command(self, cmd):
+        # plain write of a command byte, for command based devices
+        self.byte[0] = cmd
+        start = time.ticks_us()
+        self.i2c.writeto(self.addr, self.byte)
+        self._done(start)
+
+    def receive_into(self, buf):
+        # plain read, for command based devices. A NACK raises OSError and
+        # counts, it is how they tell a result is not ready
+        start = time.ticks_us()
+        try:
+            self.i2c.readfrom_into(self.addr, buf)
+        finally:
+            self._done(start)
+        return buf
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bus_us = 0
+
+    def report(self):
+        return '0x%02X: %d transactions, %d us' % (self.addr, self.transactions, self.bus_us)
@@ -0,0 +1,79 @@
+""" I2C bus cost of a sensor fusion loop over the Pysense drivers
+
+Runs the drivers of a lab lib folder on the pycomsim Pysense models and
+counts, per loop over the 4 sensors, the I2C transactions and bytes of
+each driver, with the bus time they take at the given clock rate:
+    python3 bench_i2c.py --lib ../accelerometer/lib --baudrate 100000
+On the board, the drivers report the same counts and the time measured
+around each transaction, see Registers.report().
+"""
+
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'pycom-sim'))
+
+import pycomsim
+
+# start, address and register bytes, repeated start and address, stop:
+# the cost of a register read besides its data bytes, in bit times
+READ_OVERHEAD_BITS = 1 + 9 + 9 + 1 + 9 + 1
+# start, address, stop of a plain read or write
+PLAIN_OVERHEAD_BITS = 1 + 9 + 1
+
+
+def bus_us(transactions, nbytes, baudrate):
+    # upper bound, every transaction counted as a register read
+    return (transactions * READ_OVERHEAD_BITS + nbytes * 9) * 1000000 // baudrate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='I2C transactions of a sensor fusion loop on the Pysense')
+    parser.add_argument('--lib', default=os.path.join(HERE, '..', 'accelerometer', 'lib'))
+    parser.add_argument('--baudrate', type=int, default=100000)
+    parser.add_argument('--loops', type=int, default=3)
+    args = parser.parse_args()
+
+    sim = pycomsim.install(pycomsim.Simulator(pycomsim.Clock(speed=100)))
+    pycomsim.attach_pysense(sim.main.i2c[0], sim.clock)
+    pycomsim.add_path(args.lib)
+    bus = sim.main.i2c[0]
+
+    from pysense import Pysense
+    from LIS2HH12 import LIS2HH12
+    from LTR329ALS01 import LTR329ALS01
+    from MPL3115A2 import MPL3115A2
+    from SI7006A20 import SI7006A20
+
+    py = Pysense()
+    acc = LIS2HH12(py)
+    light = LTR329ALS01(py)
+    pressure = MPL3115A2(py)
+    hum = SI7006A20(py)
+
+    reads = (('LIS2HH12', lambda: acc.read()),
+             ('LTR329ALS01', lambda: light.lux()),
+             # read() is the single burst or conversion of both, when the driver has it
+             ('MPL3115A2', getattr(pressure, 'read', lambda: (pressure.alt(), pressure.temp()))),
+             ('SI7006A20', getattr(hum, 'read', lambda: (hum.temp(), hum.humidity()))))
+    total = [0, 0]
+    print('%-12s %12s %6s %8s' % ('per loop', 'transactions', 'bytes', 'bus us'))
+    for name, read in reads:
+        bus.reset_counters()
+        for i in range(args.loops):
+            read()
+        n, nbytes = bus.transactions / args.loops, bus.bytes / args.loops
+        total[0] += n
+        total[1] += nbytes
+        print('%-12s %12.0f %6.0f %8d' % (name, n, nbytes, bus_us(n, nbytes, args.baudrate)))
+    print('%-12s %12.0f %6.0f %8d' % ('total', total[0], total[1], bus_us(total[0], total[1], args.baudrate)))
+    print('counted by the drivers, on the simulation clock:')
+    for driver in (acc, light, pressure, hum):
+        if hasattr(driver, 'dev'):
+            print(driver.dev.report())
+
+
+if __name__ == '__main__':
+    main()
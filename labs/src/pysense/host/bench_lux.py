@@ -0,0 +1,128 @@
+""" Lux conversion of the LTR-329ALS-01 counts: paths and auto-gain
+
+Converts n random CH0, CH1 samples with the per-sample raw2Lux the
+ambient-light lab had, lux.lux() per sample, lux.lux_into() over an
+array('H') as on the board and lux.lux_np() over NumPy arrays, checks
+the three lux paths agree and times them. Then steps the light of the
+pycomsim sensor from dark to direct sun and shows the gain AutoLux picks,
+and checks that readings in a tight loop, while a new gain takes one
+measurement period to reach the data, stay right:
+    python3 bench_lux.py --lib ../ambient-light/lib --samples 100000
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from array import array
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'pycom-sim'))
+
+import pycomsim
+
+
+def raw2Lux(CHRegs):
+    # the former ambient-light/main.py conversion, gain 1x and 100 ms only
+    if CHRegs[0] == 0xFFFF or CHRegs[1] == 0xFFFF or CHRegs[0] == 0:
+        return -1
+    d0 = float(CHRegs[0])
+    d1 = float(CHRegs[1])
+    ratio = d1 / d0
+    d0 = d0 * (402.0 / 100) * 16
+    d1 = d1 * (402.0 / 100) * 16
+    if ratio < 0.5:
+        return 0.0304 * d0 - 0.062 * d0 * math.pow(ratio, 1.4)
+    if ratio < 0.61:
+        return 0.0224 * d0 - 0.031 * d1
+    if ratio < 0.80:
+        return 0.0128 * d0 - 0.0153 * d1
+    if ratio < 1.30:
+        return 0.00146 * d0 - 0.00112 * d1
+    return 0.0
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lux conversion paths and auto-gain of the LTR-329ALS-01')
+    parser.add_argument('--lib', default=os.path.join(HERE, '..', 'ambient-light', 'lib'))
+    parser.add_argument('--samples', type=int, default=100000)
+    args = parser.parse_args()
+
+    sim = pycomsim.install(pycomsim.Simulator(pycomsim.Clock(virtual=True)))
+    models = pycomsim.attach_pysense(sim.main.i2c[0], sim.clock)
+    pycomsim.add_path(args.lib)
+    import lux
+
+    n = args.samples
+    rnd = random.Random(1)
+    raw = array('H')
+    for i in range(n):
+        ch0 = rnd.randrange(0, 0x10000)
+        raw.append(ch0)
+        raw.append(min(int(ch0 * rnd.uniform(0, 1.2)), 0xFFFF))
+    pairs = list(zip(raw[0::2], raw[1::2]))
+    gain, integration_ms = 4, 200
+
+    legacy, t_legacy = timed(lambda: [raw2Lux(p) for p in pairs])
+    single, t_single = timed(lambda: [lux.lux(ch0, ch1, gain, integration_ms) for ch0, ch1 in pairs])
+    batch, t_batch = timed(lux.lux_array, raw, gain, integration_ms)
+    t_np = None
+    try:
+        import numpy as np
+    except ImportError:
+        print('NumPy not installed, no lux_np')
+    else:
+        counts = np.frombuffer(raw, dtype='uint16').reshape(-1, 2)
+        vector, t_np = timed(lux.lux_np, counts[:, 0], counts[:, 1], gain, integration_ms)
+        expected = np.array([np.nan if v is None else v for v in single])
+        assert np.allclose(vector, expected, equal_nan=True)
+        assert np.allclose(np.array(batch, dtype='float64'), expected, rtol=1e-6, atol=1e-3, equal_nan=True)
+
+    print('%d samples at gain %dx, %d ms' % (n, gain, integration_ms))
+    for name, t in (('raw2Lux', t_legacy), ('lux()', t_single), ('lux_into', t_batch), ('lux_np', t_np)):
+        if t is not None:
+            print('%-10s %8.3f s  %6.2f us/sample' % (name, t, t * 1e6 / n))
+
+    from pysense import Pysense
+    from LTR329ALS01 import LTR329ALS01
+    sensor = LTR329ALS01(Pysense())
+    light = lux.AutoLux(sensor)
+    model = models["light"]
+    print('%10s %8s %5s %16s %12s' % ('counts 1x', 'raw2Lux', 'gain', 'counts', 'AutoLux'))
+    for ch0 in (5, 50, 500, 5000, 20000, 60000, 5000, 50):
+        model.set_counts(ch0, ch0 // 2)
+        # a reading per second, the gain settles over a few
+        for i in range(4):
+            value = light.read()
+            sim.clock.advance(1000000)
+        print('%10d %8.0f %4dx %16s %12s' % (ch0, raw2Lux((min(ch0, 0xFFFF), min(ch0 // 2, 0xFFFF))),
+                                            light.range[0], light.raw,
+                                            'saturated' if value is None else '%.1f' % value))
+    return tight_loop(lux, light, model)
+
+
+def tight_loop(lux, light, model, reads=8):
+    # readings back to back after each change of light, the number wrong
+    wrong = 0
+    for ch0 in (5, 60000, 50, 20000):
+        model.set_counts(ch0, ch0 // 2)
+        expected = lux.lux(ch0, ch0 // 2)
+        for i in range(reads):
+            value = light.read()
+            if value is not None and abs(value - expected) > 0.02 * expected:
+                wrong += 1
+                print('tight loop: %.1f lux at %s, expected %.1f' % (value, light.range, expected))
+    print('tight loop: %d of %d readings wrong' % (wrong, 4 * reads))
+    return wrong
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
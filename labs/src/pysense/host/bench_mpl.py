@@ -0,0 +1,182 @@
+""" Decoding of the MPL3115A2 samples: correctness and allocation
+
+Checks MPL3115A2.decode() and the float reads against values worked out
+from the output formats of the datasheet, Q16.4 m in altitude, Q18.2 Pa
+in pressure and Q8.4 degrees C, negatives included, reads the sensor in
+both modes of set_mode(), then decodes a full FIFO of samples and
+reports the time and memory allocated per sample:
+  - legacy: the former string built floats, bin() walk of the fraction
+  - float: decode() then a division per value
+  - raw: decode() into a preallocated array('l'), as read_fifo_into
+On the host the driver runs on the pycomsim Pysense model:
+    python3 bench_mpl.py --lib ../accelerometer/lib
+On the board, copy it with the lib and import it, the allocations are
+then counted by gc.mem_alloc().
+"""
+
+import gc
+import sys
+import time
+from array import array
+
+MICROPYTHON = sys.implementation.name == 'micropython'
+ROUNDS = 20
+
+# OUT_P MSB, CSB, LSB, OUT_T MSB, LSB and the values they hold
+ALTITUDES = (
+    (b'\x00\x00\x00\x00\x00', 0.0, 0.0),
+    (b'\x01\x2c\x40\x19\x80', 300.25, 25.5),
+    (b'\xff\xf3\xb0\xf6\x80', -12.3125, -9.5),
+    (b'\xff\xff\xf0\xff\xf0', -0.0625, -0.0625),
+    (b'\x7f\xff\xf0\x7f\xf0', 32767.9375, 127.9375),
+    (b'\x80\x00\x00\x80\x00', -32768.0, -128.0),
+)
+PRESSURES = (
+    (b'\x62\xf3\x40\x14\x00', 101325.0, 20.0),
+    (b'\x06\x1a\x80\xe2\x40', 6250.0, -29.75),
+    (b'\xff\xff\xf0\x00\x10', 262143.75, 0.0625),
+)
+
+
+def legacy(data):
+    # the decoding the driver had, a sign and fraction mixup below zero
+    def fixed_decimal(frac_value):
+        fixed = 0
+        for x in range(2, len(bin(frac_value))):
+            fixed += int(bin(frac_value)[x]) * (2 ** (-(x - 1)))
+        return fixed
+    pres_int = (data[0] << 8) | data[1]
+    if pres_int & 0x8000:
+        pres_int -= 0x10000
+    alt = float(str(pres_int) + str(fixed_decimal(data[2] >> 4))[1:])
+    temp_int = data[3]
+    if temp_int & 0x80:
+        temp_int -= 0x100
+    temp = float(str(temp_int) + str(fixed_decimal(data[4] >> 4))[1:])
+    return alt, temp
+
+
+def check(sensor, mode, cases):
+    sensor.mode = mode
+    p_scale, t_scale = sensor.scale()
+    out = array('l', [0, 0])
+    failed = 0
+    for data, p, t in cases:
+        sensor.decode(data, 1, out)
+        sensor.data[:] = data
+        got = (out[0] / p_scale, out[1] / t_scale, sensor._alt(), sensor._temp())
+        if got != (p, t, p, t):
+            failed += 1
+            print('%s: decoded %s, expected %s, %s' % (' '.join('%02x' % b for b in data), got, p, t))
+    return failed
+
+
+def check_modes(sensor, model=None):
+    # a reading in each mode, against the model on the host
+    failed = 0
+    sensor.set_mode(sensor.PRESSURE)
+    pressure, temp = sensor.read()
+    raw = sensor.read(raw=True)[0]
+    sensor.set_mode(sensor.ALTITUDE)
+    altitude = sensor.read()[0]
+    if model is not None:
+        expected = (round(model.pressure * 4) / 4, round(model.altitude * 16) / 16)
+    else:
+        expected = None
+    if not 20000 <= pressure <= 110000 or raw != pressure * 4 or expected and (pressure, altitude) != expected:
+        failed += 1
+        print('pressure mode: %s Pa, %s m, expected %s' % (pressure, altitude, expected))
+    print('pressure mode %.2f Pa, altitude mode %.2f m' % (pressure, altitude))
+    return failed
+
+
+def allocated(fn, *args):
+    # (bytes, s) allocated and spent by fn over ROUNDS calls
+    if MICROPYTHON:
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        start = time.ticks_us()
+        for i in range(ROUNDS):
+            fn(*args)
+        t = time.ticks_diff(time.ticks_us(), start) / 1e6
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used, t
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        fn(*args)
+    t = time.perf_counter() - start
+    # CPython frees as it goes, the peak is what one round holds at most
+    used = tracemalloc.get_traced_memory()[1] * ROUNDS
+    tracemalloc.stop()
+    return used, t
+
+
+def bench(sensor):
+    sensor.mode = sensor.ALTITUDE
+    n = sensor.FIFO_SAMPLES
+    buf = bytearray()
+    for i in range(n):
+        buf += ALTITUDES[i % len(ALTITUDES)][0]
+    out = array('l', [0] * (2 * n))
+    p_scale, t_scale = sensor.scale()
+
+    def run_legacy():
+        return [legacy(buf[j:j + 5]) for j in range(0, len(buf), 5)]
+
+    def run_float():
+        sensor.decode(buf, n, out)
+        return [(out[2 * i] / p_scale, out[2 * i + 1] / t_scale) for i in range(n)]
+
+    def run_raw():
+        return sensor.decode(buf, n, out)
+
+    run_raw()
+    print('%-8s %10s %10s  (%d samples x %d rounds)' % ('decode', 'bytes/smp', 'us/smp', n, ROUNDS))
+    for name, fn in (('legacy', run_legacy), ('float', run_float), ('raw', run_raw)):
+        used, t = allocated(fn)
+        print('%-8s %10.1f %10.1f' % (name, used / (n * ROUNDS), t * 1e6 / (n * ROUNDS)))
+    if not MICROPYTHON:
+        print('(host: peak bytes traced per round, run on the board for the allocations)')
+
+
+def sensor_on_host(lib):
+    import os
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.join(here, '..', '..', 'pycom-sim'))
+    import pycomsim
+    sim = pycomsim.install(pycomsim.Simulator(pycomsim.Clock(virtual=True)))
+    models = pycomsim.attach_pysense(sim.main.i2c[0], sim.clock)
+    pycomsim.add_path(lib or os.path.join(here, '..', 'accelerometer', 'lib'))
+    from pysense import Pysense
+    from MPL3115A2 import MPL3115A2
+    return MPL3115A2(Pysense()), models["pressure"]
+
+
+def main(sensor=None):
+    model = None
+    if sensor is None:
+        if MICROPYTHON:
+            from pysense import Pysense
+            from MPL3115A2 import MPL3115A2
+            sensor = MPL3115A2(Pysense())
+        else:
+            import argparse
+            parser = argparse.ArgumentParser(description='Correctness and allocations of the MPL3115A2 decoding')
+            parser.add_argument('--lib', help='lab lib folder of the driver')
+            sensor, model = sensor_on_host(parser.parse_args().lib)
+    failed = check(sensor, sensor.ALTITUDE, ALTITUDES) + check(sensor, sensor.PRESSURE, PRESSURES)
+    wrong = sum(1 for data, p, t in ALTITUDES if legacy(data) != (p, t))
+    print('%d of %d datasheet values decoded, %d of the altitudes wrong with the legacy decoding' % (
+        len(ALTITUDES) + len(PRESSURES) - failed, len(ALTITUDES) + len(PRESSURES), wrong))
+    failed += check_modes(sensor, model)
+    bench(sensor)
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
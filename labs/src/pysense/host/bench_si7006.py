@@ -0,0 +1,87 @@
+""" Throughput of the SI7006A20 measurements on the pycomsim Pysense
+
+Runs the driver of a lab lib folder on the virtual clock of the
+simulator, with the conversion times of the datasheet, and reports per
+temperature and humidity pair the time the caller is blocked, the I2C
+transactions and the pairs per second back to back:
+  - legacy: temp() then humidity(), each a conversion and a 0.5 s sleep
+  - read(): one humidity conversion polled until the sensor ACKs, the
+    temperature read back with Read Temperature from previous RH
+  - pipelined: start() at the end of a loop, values() at the next one,
+    as temp-hum/main.py does at 1 Hz
+    python3 bench_si7006.py --lib ../temp-hum/lib --pairs 20
+"""
+
+import argparse
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'pycom-sim'))
+
+import pycomsim
+from bench_i2c import bus_us
+
+
+def legacy(sensor, time):
+    # the former temp() and humidity(), on the virtual clock
+    values = []
+    for cmd in (sensor.TEMP_NOHOLDMASTER, sensor.HUMD_NOHOLDMASTER):
+        sensor.dev.command(cmd)
+        time.sleep_ms(500)
+        data = sensor.dev.receive_into(sensor.data)
+        values.append((data[0] << 8) | data[1])
+    return values
+
+
+def pipelined(sensor, time):
+    # the loop body of temp-hum/main.py, less its sleep
+    values = sensor.values()
+    sensor.start()
+    return values
+
+
+def measure(name, fn, sensor, sim, bus, pairs, baudrate):
+    import time
+    bus.reset_counters()
+    start = sim.clock.now_us()
+    for i in range(pairs):
+        # the 1 Hz loop, a conversion started before runs meanwhile
+        sim.clock.advance(1000000)
+        if fn(sensor, time) is None:
+            print('%s: no result' % name)
+    # the models take no time on the bus, it is added at baudrate
+    blocked = (sim.clock.now_us() - start + bus_us(bus.transactions, bus.bytes, baudrate)) / pairs - 1000000
+    print('%-10s %10.2f %13.1f %10.0f' % (name, blocked / 1000, bus.transactions / pairs, 1000000 / blocked))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput of the SI7006A20 measurements on pycomsim')
+    parser.add_argument('--lib', default=os.path.join(HERE, '..', 'temp-hum', 'lib'))
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--baudrate', type=int, default=100000)
+    args = parser.parse_args()
+
+    sim = pycomsim.install(pycomsim.Simulator(pycomsim.Clock(virtual=True)))
+    models = pycomsim.attach_pysense(sim.main.i2c[0], sim.clock)
+    pycomsim.add_path(args.lib)
+    bus = sim.main.i2c[0]
+
+    from pysense import Pysense
+    from SI7006A20 import SI7006A20
+    sensor = SI7006A20(Pysense())
+
+    model = models["humidity"]
+    temp, humidity = sensor.read()
+    print('model %.2f C %.2f %%RH, read() %.2f C %.2f %%RH' % (model.temperature, model.humidity, temp, humidity))
+
+    print('%-10s %10s %13s %10s  (I2C at %d Hz)' % ('per pair', 'blocked ms', 'transactions', 'pairs/s',
+                                                     args.baudrate))
+    measure('legacy', legacy, sensor, sim, bus, args.pairs, args.baudrate)
+    measure('read()', lambda s, time: s.read(), sensor, sim, bus, args.pairs, args.baudrate)
+    sensor.start()
+    measure('pipelined', pipelined, sensor, sim, bus, args.pairs, args.baudrate)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
+import struct
 import time
 
+from i2cdevice import I2CDevice
+
 class LTR329ALS01:
 
     ALS_I2CADDR = const(0x29)
     ALS_CONTR_REG = const(0x80)
     ALS_MEAS_REG = const(0x85)
+    ALS_STATUS_REG = const(0x8C)
     ALS_DATA_CH0_LOW = const(0x8A)
     ALS_DATA_CH0_HIGH = const(0x8B)
     ALS_DATA_CH1_LOW = const(0x88)
@@ -29,6 +33,9 @@ class LTR329ALS01:
     ALS_RATE_500 = const(0x03)
     ALS_RATE_1000 = const(0x04)
     ALS_RATE_2000 = const(0x05)
+    # ALS_STATUS: new data, and the gain bits of the data
+    ALS_NEW_DATA = const(0x04)
+    POLL_MS = const(10)
 
     def __init__(self, pysense=None, sda='P22', scl='P21', gain=ALS_GAIN_1X, integration=ALS_INT_100, rate=ALS_RATE_500):
         if pysense is not None:
@@ -37,23 +44,39 @@ class LTR329ALS01:
             from machine import I2C
             self.i2c = I2C(0, mode=I2C.MASTER, pins=(sda, scl))
 
-        self.i2c.writeto_mem(ALS_I2CADDR, ALS_CONTR_REG, bytearray([gain]))
-        meas = self._concat_hex(integration, rate)
-        self.i2c.writeto_mem(ALS_I2CADDR, ALS_MEAS_REG, bytearray([meas]))
+        self.dev = I2CDevice(self.i2c, ALS_I2CADDR)
+        # CH1 then CH0, low byte first
+        self.data = bytearray(4)
+
+        # CONTR value and MEAS_RATE codes, see lux.settings()
+        self.gain = gain
+        self.integration = integration
+        self.rate = rate
+
+        self.dev.write_u8(ALS_CONTR_REG, gain)
+        # integration time in bits 5:3, repeat rate in 2:0
+        self.dev.write_u8(ALS_MEAS_REG, (integration << 3) | rate)
         time.sleep(0.01)
 
-    def _concat_hex(self, a, b):
-        sizeof_b = 0
-        while((b >> sizeof_b) > 0):
-            sizeof_b += 1
-        sizeof_b += sizeof_b % 4
-        return (a << sizeof_b) | b
+    def set_gain(self, gain):
+        # one of the ALS_GAIN_ values, for the measurements from the next one
+        self.gain = gain
+        self.dev.write_u8(ALS_CONTR_REG, gain)
+
+    def wait(self, timeout_ms=1000):
+        # polls until new data measured with the current gain, False on timeout
+        start = time.ticks_ms()
+        while True:
+            status = self.dev.read_u8(ALS_STATUS_REG)
+            if status & ALS_NEW_DATA and (status >> 4) & 0x07 == (self.gain >> 2) & 0x07:
+                return True
+            if time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+                return False
+            time.sleep_ms(POLL_MS)
 
     def lux(self):
-        data0 = self.i2c.readfrom_mem(ALS_I2CADDR , ALS_DATA_CH1_LOW, 1)
-        data1 = self.i2c.readfrom_mem(ALS_I2CADDR , ALS_DATA_CH1_HIGH, 1)
-        data2 = self.i2c.readfrom_mem(ALS_I2CADDR , ALS_DATA_CH0_LOW, 1)
-        data3 = self.i2c.readfrom_mem(ALS_I2CADDR , ALS_DATA_CH0_HIGH, 1)
-        data_reg_CH1 = self._concat_hex(data1[0], data0[0])
-        data_reg_CH0 = self._concat_hex(data2[0], data3[0])
+        # the datasheet asks for CH1 low to CH0 high in one read, it
+        # latches the pair of channels
+        self.dev.read_into(ALS_DATA_CH1_LOW, self.data)
+        data_reg_CH1, data_reg_CH0 = struct.unpack('<HH', self.data)
         return(data_reg_CH0, data_reg_CH1)
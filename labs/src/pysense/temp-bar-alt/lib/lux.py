@@ -0,0 +1,128 @@
+""" Lux of the LTR-329ALS-01 channel counts
+
+Uses the gain and integration time the driver configured, per sample,
+over an array of samples on the board or over NumPy arrays on the host.
+The coefficients are the ones of the LTR-329ALS-01 application note. """
+
+from array import array
+
+# gain factors by the CONTR gain bits, integration times by the MEAS_RATE code
+GAINS = (1, 2, 4, 8, 1, 1, 48, 96)
+INTEGRATION_MS = (100, 50, 200, 400, 150, 250, 300, 350)
+# CONTR values of the gains, in increasing order
+GAIN_STEPS = (0x01, 0x05, 0x09, 0x0D, 0x19, 0x1D)
+SATURATED = const(0xFFFF)
+# the gain goes up when the counts would stay below half the range
+RANGE_UP = const(0x7FFF)
+
+def settings(sensor):
+    # (gain, integration ms) of a LTR329ALS01
+    return (GAINS[(sensor.gain >> 2) & 0x07], INTEGRATION_MS[sensor.integration & 0x07])
+
+def _scale(gain, integration_ms, window):
+    return window * 100.0 / (gain * integration_ms)
+
+def lux(ch0, ch1, gain=1, integration_ms=100, window=1.0):
+    # lux of one sample, None when a channel saturated. window is the
+    # attenuation factor of a cover, 1.0 without
+    if ch0 == SATURATED or ch1 == SATURATED:
+        return None
+    total = ch0 + ch1
+    # ch1 / total below 0.45, 0.64 and 0.85, in integers
+    if 100 * ch1 < 45 * total:
+        raw = 1.7743 * ch0 + 1.1059 * ch1
+    elif 100 * ch1 < 64 * total:
+        raw = 4.2785 * ch0 - 1.9548 * ch1
+    elif 100 * ch1 < 85 * total:
+        raw = 0.5926 * ch0 + 0.1185 * ch1
+    else:
+        return 0.0
+    return raw * _scale(gain, integration_ms, window)
+
+def lux_into(raw, out, gain=1, integration_ms=100, window=1.0, n=None):
+    # lux of the n samples of raw, ch0 and ch1 pairs as in array('H'),
+    # into out, as array('f'). Saturated samples are NaN
+    scale = _scale(gain, integration_ms, window)
+    nan = float('nan')
+    if n is None:
+        n = len(raw) // 2
+    for i in range(n):
+        ch0 = raw[2 * i]
+        ch1 = raw[2 * i + 1]
+        total = ch0 + ch1
+        if ch0 == SATURATED or ch1 == SATURATED:
+            out[i] = nan
+        elif 100 * ch1 < 45 * total:
+            out[i] = (1.7743 * ch0 + 1.1059 * ch1) * scale
+        elif 100 * ch1 < 64 * total:
+            out[i] = (4.2785 * ch0 - 1.9548 * ch1) * scale
+        elif 100 * ch1 < 85 * total:
+            out[i] = (0.5926 * ch0 + 0.1185 * ch1) * scale
+        else:
+            out[i] = 0.0
+    return out
+
+def lux_array(raw, gain=1, integration_ms=100, window=1.0):
+    # as lux_into, into a new array('f')
+    n = len(raw) // 2
+    return lux_into(raw, array('f', [0.0] * n), gain, integration_ms, window, n)
+
+def lux_np(ch0, ch1, gain=1, integration_ms=100, window=1.0):
+    # as lux_into over NumPy arrays of counts, for the host
+    import numpy as np
+    ch0 = np.asarray(ch0, dtype='float64')
+    ch1 = np.asarray(ch1, dtype='float64')
+    total = ch0 + ch1
+    # the integer comparisons of lux(), exact for counts below 2**16
+    raw = np.select([100 * ch1 < 45 * total, 100 * ch1 < 64 * total, 100 * ch1 < 85 * total],
+                    [1.7743 * ch0 + 1.1059 * ch1, 4.2785 * ch0 - 1.9548 * ch1, 0.5926 * ch0 + 0.1185 * ch1],
+                    0.0)
+    out = raw * _scale(gain, integration_ms, window)
+    out[(ch0 == SATURATED) | (ch1 == SATURATED)] = np.nan
+    return out
+
+class AutoLux:
+    """ Lux readings of a LTR329ALS01 with auto-gain ranging: a saturated
+    sample steps the gain down and is measured again, and the gain goes
+    up for the next reading as far as the counts would stay in range.
+    After a change of gain, a reading first waits for data measured with
+    it, at most one measurement period. """
+
+    def __init__(self, sensor, window=1.0, timeout_ms=1000):
+        self.sensor = sensor
+        self.window = window
+        self.timeout_ms = timeout_ms
+        self.step = GAIN_STEPS.index(sensor.gain) if sensor.gain in GAIN_STEPS else 0
+        # counts of the last sample, and its gain and integration ms
+        self.raw = (0, 0)
+        self.range = settings(sensor)
+        # the gain changed, the data registers may still hold the former one
+        self.settling = False
+
+    def _set_step(self, step):
+        self.step = step
+        self.sensor.set_gain(GAIN_STEPS[step])
+        self.settling = True
+
+    def read(self):
+        # lux, None when saturated at the lowest gain or on timeout
+        while True:
+            if self.settling:
+                if not self.sensor.wait(self.timeout_ms):
+                    return None
+                self.settling = False
+            ch0, ch1 = self.raw = self.sensor.lux()
+            saturated = ch0 == SATURATED or ch1 == SATURATED
+            if saturated and self.step > 0:
+                self._set_step(self.step - 1)
+                continue
+            gain, integration_ms = self.range = settings(self.sensor)
+            value = lux(ch0, ch1, gain, integration_ms, self.window)
+            # the highest gain the counts would stay in range with
+            peak = max(ch0, ch1)
+            step = self.step
+            while step < len(GAIN_STEPS) - 1 and peak * GAINS[(GAIN_STEPS[step + 1] >> 2) & 0x07] // gain < RANGE_UP:
+                step += 1
+            if step != self.step:
+                self._set_step(step)
+            return value
@@ -36,6 +36,8 @@ OFF_P = const(0x2B)                 # Pressure offset correction register
 OFF_T = const(0x2C)                 # Temperature offset correction register
 OFF_H = const(0x2D)                 # Altitude offset correction register 
 
+POLL_MS = const(64)                 # STATUS polling interval in ms
+
 # reads one byte over I2C
 def IIC_Read(regAddr):
     data = bytearray(1)
@@ -171,18 +173,25 @@ def toggleOneShot():
     value = value | 0x02                # Set OST bit
     IIC_Write(CTRL_REG1, value)       
 
+# Waits for the data ready bits of mask in STATUS, False after 1 s.
+# A conversion takes up to 512 ms at 128x oversampling, so STATUS is
+# read every POLL_MS rather than every ms.
+def waitStatus(mask):
+    counter = 0
+    while (IIC_Read(STATUS) & mask) == 0:
+        counter = counter + 1
+        if(counter > 1000 // POLL_MS):
+            return False
+        time.sleep_ms(POLL_MS)
+    return True
+
 def readTemperature():
     if(IIC_Read(STATUS) & 0x02 == 0):
         # Toggle the OST bit causing the sensor to immediately take another reading
         toggleOneShot()
     # Wait for TDR bit, indicates we have new temp data
-    counter = 0
-    while( (IIC_Read(STATUS) & 0x02) == 0):
-        counter = counter + 1
-        if(counter > 600):
-            # Error out after max of 512ms for a read
-            return(-400)
-        time.sleep_ms(1)
+    if not waitStatus(0x02):
+        return(-400)
 
     # Read temperature registers
     data = bytearray(2)
@@ -221,13 +230,8 @@ def readAltitude():
     toggleOneShot()         # Toggle the OST bit causing the sensor to immediately take another reading
 
     # Wait for PDR bit, indicates we have new data
-    counter = 0
-    while( (IIC_Read(STATUS) & 0x02) == 0):
-        counter = counter + 1
-        if(counter > 600):
-            # Error out after max of 512ms for a read
-            return(-1)
-        time.sleep_ms(1)
+    if not waitStatus(0x04):
+        return(-1)
 
     # Read pressure registers
     data = bytearray(3)
@@ -261,13 +265,8 @@ def readPressure():
         toggleOneShot()
 
     # Wait for PDR bit, indicates we have new pressure data
-    counter = 0
-    while( (IIC_Read(STATUS) & 0x04) == 0):
-        counter = counter + 1
-        if(counter > 600):
-            # Error out after max of 512ms for a read
-            return(-1)
-        time.sleep_ms(1)
+    if not waitStatus(0x04):
+        return(-1)
 
     # Read pressure registers
     data = bytearray(3)
@@ -1,6 +1,8 @@
 import math
 import struct
 
+from i2cdevice import I2CDevice
+
 class LIS2HH12:
 
     ACC_I2CADDR = const(30)
@@ -22,51 +24,44 @@ class LIS2HH12:
             from machine import I2C
             self.i2c = I2C(0, mode=I2C.MASTER, pins=(sda, scl))
 
-        self.reg = bytearray(1)
+        self.dev = I2CDevice(self.i2c, ACC_I2CADDR)
+        # X, Y and Z, low byte first
+        self.data = bytearray(6)
 
         self.x = 0
         self.y = 0
         self.z = 0
 
-        whoami = self.i2c.readfrom_mem(ACC_I2CADDR , PRODUCTID_REG, 1)
-        if (whoami[0] != 0x41):
+        whoami = self.dev.read_u8(PRODUCTID_REG)
+        if (whoami != 0x41):
             raise ValueError("Incorrect product ID")
         # enable acceleration readings
-        self.i2c.readfrom_mem_into(ACC_I2CADDR , CTRL1_REG, self.reg)
-        self.reg[0] &= ~0x70
-        self.reg[0] |= 0x30
-        self.i2c.writeto_mem(ACC_I2CADDR , CTRL1_REG, self.reg)
-        # change the full-scale to 4g
-        self.i2c.readfrom_mem_into(ACC_I2CADDR , CTRL4_REG, self.reg)
-        self.reg[0] &= ~0b00110000
-        self.reg[0] |= 0b00100000
-        self.i2c.writeto_mem(ACC_I2CADDR , CTRL4_REG, self.reg)
+        self.dev.update_u8(CTRL1_REG, 0x70, 0x30)
+        # change the full-scale to 4g, keep the register address auto-increment
+        self.dev.update_u8(CTRL4_REG, 0b00110000, 0b00100100)
         self.read()
 
     def read(self):
-        x = self.i2c.readfrom_mem(ACC_I2CADDR , ACC_X_L_REG, 2)
-        self.x = struct.unpack('<h', x)
-        y = self.i2c.readfrom_mem(ACC_I2CADDR , ACC_Y_L_REG, 2)
-        self.y = struct.unpack('<h', y)
-        z = self.i2c.readfrom_mem(ACC_I2CADDR , ACC_Z_L_REG, 2)
-        self.z = struct.unpack('<h', z)
-        return (self.x[0], self.y[0], self.z[0])
+        # the 3 axes in one burst from OUT_X_L
+        self.dev.read_into(ACC_X_L_REG, self.data)
+        self.x, self.y, self.z = struct.unpack('<hhh', self.data)
+        return (self.x, self.y, self.z)
 
     def roll(self):
-        div = math.sqrt(math.pow(self.y[0], 2) + math.pow(self.z[0], 2))
+        div = math.sqrt(math.pow(self.y, 2) + math.pow(self.z, 2))
         if div == 0:
             div = 0.01
-        return (180 / 3.14154) * math.atan(self.x[0] / div)
+        return (180 / 3.14154) * math.atan(self.x / div)
 
     def pitch(self):
-        if self.z[0] == 0:
+        if self.z == 0:
             div = 1
         else:
-            div = self.z[0]
-        return (180 / 3.14154) * math.atan(math.sqrt(math.pow(self.x[0], 2) + math.pow(self.y[0], 2)) / div)
+            div = self.z
+        return (180 / 3.14154) * math.atan(math.sqrt(math.pow(self.x, 2) + math.pow(self.y, 2)) / div)
 
     def yaw(self):
-        div = math.sqrt(math.pow(self.x[0], 2) + math.pow(self.z[0], 2))
+        div = math.sqrt(math.pow(self.x, 2) + math.pow(self.z, 2))
         if div == 0:
             div = 0.01
-        return (180 / 3.14154) * math.atan(self.y[0] / div)
+        return (180 / 3.14154) * math.atan(self.y / div)
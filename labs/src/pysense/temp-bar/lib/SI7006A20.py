@@ -1,10 +1,16 @@
 import time
 
+from i2cdevice import I2CDevice
+
 class SI7006A20:
 
     SI7006A20_I2C_ADDR = const(0x40)
     TEMP_NOHOLDMASTER = const(0xF3)
     HUMD_NOHOLDMASTER = const(0xF5)
+    TEMP_FROM_HUMD = const(0xE0)
+    # polling interval of a conversion, 12 bit RH and temperature take 10 to 23 ms
+    POLL_MS = const(5)
+    TIMEOUT_MS = const(100)
 
     def __init__(self, pysense=None, sda='P22', scl='P21'):
         if pysense is not None:
@@ -13,6 +19,12 @@ class SI7006A20:
             from machine import I2C
             self.i2c = I2C(0, mode=I2C.MASTER, pins=(sda, scl))
 
+        self.dev = I2CDevice(self.i2c, SI7006A20_I2C_ADDR)
+        self.data = bytearray(2)
+        # No Hold Master conversion in progress, and if its result was read
+        self.cmd = 0
+        self.done = False
+
     def _concat_hex(self, a, b):
         sizeof_b = 0
         while((b >> sizeof_b) > 0):
@@ -20,30 +32,92 @@ class SI7006A20:
         sizeof_b += sizeof_b % 8
         return (a << sizeof_b) | b
 
+    def start(self, cmd=HUMD_NOHOLDMASTER):
+        # starts a conversion and returns, a humidity one by default which
+        # converts the temperature as well, see values()
+        self.dev.command(cmd)
+        self.cmd = cmd
+        self.done = False
+
+    def ready(self):
+        # the conversion started is over. The sensor NACKs its address
+        # until then, so each call is one read attempt of the result
+        if self.done:
+            return True
+        if not self.cmd:
+            return False
+        try:
+            self.dev.receive_into(self.data)
+        except OSError:
+            return False
+        self.done = True
+        return True
+
+    def wait(self, timeout_ms=TIMEOUT_MS):
+        # polls until ready, False on timeout
+        start = time.ticks_ms()
+        while not self.ready():
+            if time.ticks_diff(time.ticks_ms(), start) >= timeout_ms:
+                return False
+            time.sleep_ms(POLL_MS)
+        return True
+
+    def result(self, unit=None):
+        # value of the conversion, % RH or degrees, None until ready
+        if not self.ready():
+            return None
+        cmd = self.cmd
+        self.cmd = 0
+        self.done = False
+        code = (self.data[0] << 8) | self.data[1]
+        if cmd == HUMD_NOHOLDMASTER:
+            return self._humidity(code)
+        return self._temp(code, unit)
+
+    def values(self, unit=None):
+        # (temperature, humidity) of the humidity conversion started, None
+        # until ready. The temperature is the one measured for the
+        # humidity compensation, read back without a conversion
+        if self.cmd != HUMD_NOHOLDMASTER:
+            return None
+        humidity = self.result()
+        if humidity is None:
+            return None
+        return (self.temp_from_humidity(unit), humidity)
+
+    def temp_from_humidity(self, unit=None):
+        # temperature of the last humidity conversion
+        self.dev.command(TEMP_FROM_HUMD)
+        data = self.dev.receive_into(self.data)
+        return self._temp((data[0] << 8) | data[1], unit)
+
+    def read(self, unit=None):
+        # (temperature, humidity) of one conversion, None on timeout
+        if self.cmd != HUMD_NOHOLDMASTER:
+            self.start()
+        self.wait()
+        return self.values(unit)
+
     def temp(self, unit=None):
-        self.i2c.writeto(SI7006A20_I2C_ADDR, bytearray([0xF3]))
-        time.sleep(0.5)
-        data = self.i2c.readfrom(SI7006A20_I2C_ADDR,2)
-        # data0 = data[0]
-        # data1 = data[1]
-        # tmpdata = self._concat_hex(data0, data1)
-        tmpdata = (data[0]*256) + data[1]
+        self.start(TEMP_NOHOLDMASTER)
+        self.wait()
+        return self.result(unit)
+
+    def humidity(self):
+        self.start(HUMD_NOHOLDMASTER)
+        self.wait()
+        return self.result()
+
+    def _temp(self, tmpdata, unit=None):
         # Check if temperature is correct by ANDing with 0xFFFC
         if((tmpdata & 0xFFFC) == 0):
             return 0.0
-            
+
         temp = ((175.72 * float(tmpdata)) / 65536.0) - 46.85
         if unit == 'F':
             temp = temp * 1.8 + 32
         return temp
 
-    def humidity(self):
-        self.i2c.writeto(SI7006A20_I2C_ADDR, bytearray([0xF5]))
-        time.sleep(0.5)
-        data = self.i2c.readfrom(SI7006A20_I2C_ADDR,2)
-        # data0 = data[0]
-        # data1 = data[1]
-        # data = self._concat_hex(data0, data1)
-        tmpdata = (data[0]*256) + data[1]
-        humidity = ((125.0 * float(tmpdata)) / 65536.0) + 6.0
+    def _humidity(self, tmpdata):
+        humidity = ((125.0 * float(tmpdata)) / 65536.0) - 6.0
         return humidity
@@ -10,9 +10,14 @@ import time
 
 py = Pysense()
 tempHum = SI7006A20(py)
+# one conversion per loop, started at the end of the previous one: it
+# is over when read, and gives the temperature with the humidity
+tempHum.start()
 while True:
-    temperature = tempHum.temp()
-    humidity = tempHum.humidity()
-    print("Temperature: {} Degrees  Humidity: {}".format(temperature, humidity))
     time.sleep(1)
+    values = tempHum.values()
+    if values is not None:
+        temperature, humidity = values
+        print("Temperature: {} Degrees  Humidity: {}".format(temperature, humidity))
+    tempHum.start()
     
\ No newline at end of file